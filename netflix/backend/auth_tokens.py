@@ -0,0 +1,125 @@
+import hashlib
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AUTH_CLAIMS_CACHE_SIZE = int(os.environ.get('AUTH_CLAIMS_CACHE_SIZE', '1024'))
+# Upper bound on how long decoded claims are trusted, even for long-lived tokens
+AUTH_CLAIMS_CACHE_TTL = int(os.environ.get('AUTH_CLAIMS_CACHE_TTL', '300'))
+# How often each process picks up revocations made by other processes
+AUTH_REVOCATION_SYNC_INTERVAL = float(os.environ.get('AUTH_REVOCATION_SYNC_INTERVAL', '5'))
+
+
+def token_digest(token: str) -> str:
+    """Cache/revocation key for a token; the raw token is never stored"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenClaimsCache:
+    """Bounded LRU of verified JWT claims by token digest; entries die with the token's exp"""
+
+    def __init__(self, max_entries: int = AUTH_CLAIMS_CACHE_SIZE, max_ttl: int = AUTH_CLAIMS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: 'OrderedDict[str, Tuple[Dict[str, Any], float]]' = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        claims, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[digest]
+            self.stats['expired'] += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.stats['hits'] += 1
+        return claims
+
+    def put(self, digest: str, claims: Dict[str, Any]):
+        expires_at = time.time() + self.max_ttl
+        if 'exp' in claims:
+            expires_at = min(expires_at, float(claims['exp']))
+        self._entries[digest] = (claims, expires_at)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, digest: str):
+        if self._entries.pop(digest, None) is not None:
+            self.stats['invalidations'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), 'max_entries': self.max_entries, 'max_ttl': self.max_ttl, **self.stats}
+
+
+class RevocationList:
+    """Revoked token digests, persisted in revoked_tokens (TTL-purged at the token's exp) and mirrored in memory"""
+
+    def __init__(self, cache: TokenClaimsCache):
+        self.cache = cache
+        self._revoked: Dict[str, float] = {}
+        self._synced_at = 0.0
+        self._synced_until: Optional[datetime] = None
+
+    def is_revoked(self, digest: str) -> bool:
+        expires_at = self._revoked.get(digest)
+        if expires_at is None:
+            return False
+        if time.time() >= expires_at:
+            # The token can no longer verify anyway
+            del self._revoked[digest]
+            return False
+        return True
+
+    def _add(self, digest: str, expires_at: float):
+        self._revoked[digest] = expires_at
+        self.cache.invalidate(digest)
+
+    async def revoke(self, db, digest: str, expires_at: float):
+        """Revoke a token everywhere; this process stops accepting it immediately"""
+        self._add(digest, expires_at)
+        now = datetime.now(timezone.utc)
+        await db.revoked_tokens.update_one(
+            {'_id': digest},
+            {'$set': {'revoked_at': now, 'expires_at': datetime.fromtimestamp(expires_at, timezone.utc)}},
+            upsert=True
+        )
+
+    async def sync(self, db):
+        """Pull revocations recorded since the last sync, at most once per interval"""
+        now = time.monotonic()
+        if self._synced_at and now - self._synced_at < AUTH_REVOCATION_SYNC_INTERVAL:
+            return
+        self._synced_at = now
+        started = datetime.now(timezone.utc)
+        query = {'expires_at': {'$gt': started}}
+        if self._synced_until is not None:
+            query['revoked_at'] = {'$gte': self._synced_until}
+        try:
+            async for doc in db.revoked_tokens.find(query, {'expires_at': 1}):
+                expires_at = doc['expires_at']
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                self._add(doc['_id'], expires_at.timestamp())
+        except Exception as e:
+            # Revocations already known here keep applying; retry on the next interval
+            logger.warning(f"Token revocation sync failed: {e}")
+            return
+        # Overlap the next window so revocations written during this query are not missed
+        self._synced_until = started - timedelta(seconds=AUTH_REVOCATION_SYNC_INTERVAL)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'revoked': len(self._revoked), 'sync_interval': AUTH_REVOCATION_SYNC_INTERVAL}
+
+
+claims_cache = TokenClaimsCache()
+token_revocations = RevocationList(claims_cache)
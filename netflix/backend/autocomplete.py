@@ -0,0 +1,218 @@
+import asyncio
+import ipaddress
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from title_index import normalize
+from tmdb_service import POSTER_SIZE
+
+# Tiny poster bucket for type-ahead rows
+SUGGEST_POSTER_SIZE = os.environ.get('SUGGEST_POSTER_SIZE', 'w92')
+SUGGEST_CACHE_TTL = float(os.environ.get('SUGGEST_CACHE_TTL', '600'))
+SUGGEST_CACHE_MAX_ENTRIES = int(os.environ.get('SUGGEST_CACHE_MAX_ENTRIES', '5000'))
+# While an earlier keystroke of the same session is still in flight, wait this long for a follow-up
+SUGGEST_DEBOUNCE_MS = float(os.environ.get('SUGGEST_DEBOUNCE_MS', '150'))
+# Upstream (TMDB) calls a single client IP may make: burst, then a steady refill per minute
+SUGGEST_CLIENT_BURST = int(os.environ.get('SUGGEST_CLIENT_BURST', '5'))
+SUGGEST_CLIENT_PER_MINUTE = float(os.environ.get('SUGGEST_CLIENT_PER_MINUTE', '20'))
+SUGGEST_MAX_SESSIONS = int(os.environ.get('SUGGEST_MAX_SESSIONS', '10000'))
+# Peers (IPs or CIDRs, comma separated) whose X-Forwarded-For is believed, e.g. the ingress subnet
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.environ.get('TRUSTED_PROXIES', '127.0.0.1').split(',')
+    if network.strip()
+]
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str]) -> str:
+    """The nearest address no trusted proxy vouches for: X-Forwarded-For is walked right to left
+    from the peer, so entries a client prepends itself are never reached"""
+    hops = [hop.strip() for hop in (forwarded_for or '').split(',') if hop.strip()]
+    address = peer or 'unknown'
+    while hops and _is_trusted_proxy(address):
+        address = hops.pop()
+    return address
+
+
+def compact(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Type-ahead row: just enough to render a suggestion"""
+    poster = doc.get('poster')
+    if poster and f"/{POSTER_SIZE}/" in poster:
+        poster = poster.replace(f"/{POSTER_SIZE}/", f"/{SUGGEST_POSTER_SIZE}/", 1)
+    return {
+        'id': doc.get('id'),
+        'title': doc.get('title'),
+        'year': doc.get('year'),
+        'poster': poster,
+        'media_type': doc.get('media_type')
+    }
+
+
+def matches(norm_query: str, norm_title: str) -> bool:
+    """Every query word is a prefix of some title word (the rule the title index uses)"""
+    title_tokens = norm_title.split()
+    return all(any(t.startswith(q) for t in title_tokens) for q in norm_query.split())
+
+
+class CacheEntry:
+    __slots__ = ('items', 'complete', 'expires_at')
+
+    def __init__(self, items: List[Tuple[str, Dict[str, Any]]], complete: bool, expires_at: float):
+        # (normalized title, compact row) pairs so narrowing never re-normalizes
+        self.items = items
+        self.complete = complete
+        self.expires_at = expires_at
+
+
+class PrefixCache:
+    """LRU of suggestion lists by normalized query; longer queries narrow a cached prefix"""
+
+    def __init__(self, max_entries: int = SUGGEST_CACHE_MAX_ENTRIES, ttl: float = SUGGEST_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self.stats = {'hits': 0, 'prefix_hits': 0, 'misses': 0}
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def lookup(self, norm_query: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Exact hit, or a shorter cached prefix whose results can be filtered locally"""
+        entry = self._get(norm_query)
+        if entry is not None:
+            self.stats['hits'] += 1
+            return [row for _, row in entry.items[:limit]]
+
+        for end in range(len(norm_query) - 1, 0, -1):
+            entry = self._get(norm_query[:end])
+            if entry is None:
+                continue
+            narrowed = [(title, row) for title, row in entry.items if matches(norm_query, title)]
+            # A complete prefix list contains every match; otherwise it must still fill the page
+            if entry.complete or len(narrowed) >= limit:
+                self.stats['prefix_hits'] += 1
+                self.put(norm_query, narrowed, entry.complete)
+                return [row for _, row in narrowed[:limit]]
+            break
+
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, norm_query: str, docs, complete: bool):
+        items = [
+            item if isinstance(item, tuple) else (normalize(item.get('title') or ''), compact(item))
+            for item in docs
+        ]
+        self._entries[norm_query] = CacheEntry(items, complete, time.monotonic() + self.ttl)
+        self._entries.move_to_end(norm_query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), **self.stats}
+
+
+class SessionState:
+    __slots__ = ('sequence', 'in_flight', 'newer')
+
+    def __init__(self):
+        self.sequence = 0
+        self.in_flight = 0
+        # Set when a newer keystroke arrives, ending the current one's debounce wait early
+        self.newer = asyncio.Event()
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self):
+        self.tokens = float(SUGGEST_CLIENT_BURST)
+        self.updated = time.monotonic()
+
+
+class SessionGovernor:
+    """Per-session keystroke debounce, and an upstream call budget per client IP.
+
+    Session ids are client-supplied, so they only sequence keystrokes; the budget is keyed
+    on the address resolved through trusted proxies, which a client cannot mint.
+    """
+
+    def __init__(self, max_sessions: int = SUGGEST_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: 'OrderedDict[str, SessionState]' = OrderedDict()
+        self._budgets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self.stats = {'upstream_calls': 0, 'debounced': 0, 'throttled': 0}
+
+    def _lru(self, entries: OrderedDict, key: str, factory):
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = factory()
+            while len(entries) > self.max_sessions:
+                entries.popitem(last=False)
+        entries.move_to_end(key)
+        return entry
+
+    @asynccontextmanager
+    async def keystroke(self, session_id: str) -> AsyncIterator[bool]:
+        """Track one request for the session; yields False when a newer keystroke supersedes it.
+
+        A lone request goes straight through. Only while another request of the session is in
+        flight (the user is typing) does it wait up to the debounce window for a follow-up.
+        """
+        state = self._lru(self._sessions, session_id, SessionState)
+        state.sequence += 1
+        sequence = state.sequence
+        state.newer.set()
+        newer = state.newer = asyncio.Event()
+        state.in_flight += 1
+        try:
+            if state.in_flight > 1:
+                try:
+                    await asyncio.wait_for(newer.wait(), SUGGEST_DEBOUNCE_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            latest = state.sequence == sequence
+            if not latest:
+                self.stats['debounced'] += 1
+            yield latest
+        finally:
+            state.in_flight -= 1
+
+    def try_spend(self, client: str) -> bool:
+        """Take one upstream call from the client's token bucket"""
+        bucket = self._lru(self._budgets, client, TokenBucket)
+        now = time.monotonic()
+        refill = (now - bucket.updated) * SUGGEST_CLIENT_PER_MINUTE / 60
+        bucket.tokens = min(float(SUGGEST_CLIENT_BURST), bucket.tokens + refill)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            self.stats['throttled'] += 1
+            return False
+        bucket.tokens -= 1
+        self.stats['upstream_calls'] += 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'sessions': len(self._sessions), 'clients': len(self._budgets), **self.stats}
+
+
+suggest_cache = PrefixCache()
+suggest_sessions = SessionGovernor()
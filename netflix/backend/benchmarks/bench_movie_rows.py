@@ -0,0 +1,90 @@
+"""Mapping + serialization cost of one 50-title catalogue row, before and after the fast path.
+
+Run from netflix/backend:  python benchmarks/bench_movie_rows.py
+"""
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+
+from fast_json import FastJSONResponse, orjson
+from tmdb_service import BACKDROP_SIZE, POSTER_SIZE, image_url, map_results
+
+ROW_SIZE = 50
+ROUNDS = 2000
+
+
+def legacy_map(movie, media_type='movie'):
+    """map_movie_to_frontend as it was before the fast path"""
+    title = movie.get('title') or movie.get('name', 'Unknown')
+    year = movie.get('release_date', movie.get('first_air_date', ''))
+    year = year[:4] if year else '2024'
+    vote_avg = movie.get('vote_average', 7.0)
+    match = int(vote_avg * 10)
+    if movie.get('adult', False):
+        rating = 'R'
+    elif vote_avg >= 8:
+        rating = 'TV-MA'
+    elif vote_avg >= 6:
+        rating = 'TV-14'
+    else:
+        rating = 'PG-13'
+    return {
+        'id': movie.get('id'),
+        'title': title,
+        'description': movie.get('overview', ''),
+        'backdrop': image_url(movie.get('backdrop_path'), BACKDROP_SIZE),
+        'poster': image_url(movie.get('poster_path'), POSTER_SIZE),
+        'rating': rating,
+        'year': int(year),
+        'match': match,
+        'media_type': media_type
+    }
+
+
+def sample_results(n):
+    rng = random.Random(42)
+    return [
+        {
+            'id': 100000 + i,
+            'title': f"Sample Title {i}",
+            'overview': "A fairly typical TMDB overview sentence, repeated to a realistic length. " * 3,
+            'backdrop_path': f"/{rng.getrandbits(64):016x}.jpg",
+            'poster_path': f"/{rng.getrandbits(64):016x}.jpg",
+            'release_date': f"{rng.randint(1970, 2024)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            'vote_average': round(rng.uniform(3, 9.5), 1),
+            'adult': False,
+            'media_type': 'movie'
+        }
+        for i in range(n)
+    ]
+
+
+def before(results):
+    # FastAPI default: dicts returned from the route go through jsonable_encoder, then json.dumps
+    payload = {"success": True, "data": [legacy_map(m, 'movie') for m in results]}
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def after(results):
+    return FastJSONResponse({"success": True, "data": map_results(results, 'movie')}).body
+
+
+def main():
+    results = sample_results(ROW_SIZE)
+    assert json.loads(before(results)) == json.loads(after(results))
+
+    print(f"{ROW_SIZE}-item row, {ROUNDS} rounds (orjson: {'yes' if orjson else 'no'})")
+    for name, fn in (('before', before), ('after', after)):
+        best = min(timeit.repeat(lambda: fn(results), number=ROUNDS, repeat=5))
+        print(f"  {name:<7} {best / ROUNDS * 1e6:8.1f} us/row")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Per-keystroke search latency of a full title index (TITLE_INDEX_MAX_TITLES titles).
+
+Run from netflix/backend:  python benchmarks/bench_title_index.py
+"""
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from title_index import TITLE_INDEX_MAX_TITLES, TitleIndex
+
+COMMON_WORDS = (
+    'the a of and in love night man last story dark day house girl city war dead life world '
+    'king return star blood black time lost secret home little big american game red road'
+).split()
+QUERIES = ['t', 'a', 'th', 'the', 'love', 'the la', 'star wa', 'intersteller', 'the lost ci']
+ROUNDS = 200
+
+
+def sample_titles(n):
+    rng = random.Random(42)
+    syllables = ['ka', 'lo', 'mi', 'ra', 'te', 'su', 'no', 'vi', 'de', 'an', 'or', 'el', 'is', 'um']
+    invented = [''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(20000)]
+    titles = []
+    for i in range(n):
+        words = [rng.choice(COMMON_WORDS) if rng.random() < 0.5 else rng.choice(invented)
+                 for _ in range(rng.randint(1, 5))]
+        titles.append({'id': i, 'title': ' '.join(words).title(), 'media_type': 'movie'})
+    titles.append({'id': n, 'title': 'Interstellar', 'media_type': 'movie'})
+    return titles
+
+
+def build(n=TITLE_INDEX_MAX_TITLES):
+    index = TitleIndex(max_titles=n + 1)
+    index.add_many(sample_titles(n))
+    return index
+
+
+def timings_ms(index, query, rounds=ROUNDS):
+    """Median and p99 wall time of one search"""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        index.search(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    index = build()
+    print(f"{len(index)} titles, {ROUNDS} searches per query")
+    for query in QUERIES:
+        median, p99 = timings_ms(index, query)
+        print(f"  {query!r:<16} median {median:6.3f} ms   p99 {p99:6.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import re
+import weakref
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import anyio
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from storage import storage
+
+# A record marked deleting this long ago belongs to a process that died mid-delete
+BLOB_DELETE_STALE_SECONDS = int(os.environ.get('BLOB_DELETE_STALE_SECONDS', '60'))
+BLOB_INGEST_WAIT = 0.05
+BLOB_INGEST_ATTEMPTS = 100
+
+# Public names are {sha256}{ext}; the extension only drives the served Content-Type
+BLOB_NAME_RE = re.compile(r'^([0-9a-f]{64})(\.[A-Za-z0-9]{1,10})?$')
+
+
+class BlobStore:
+    """Content-addressed objects at {prefix}/ab/cd/{sha256}, reference-counted in the blobs collection"""
+
+    def __init__(self, storage, prefix: str = 'blobs'):
+        self.storage = storage
+        self.prefix = prefix
+        # Serialises the record/file steps of ingest and release per digest within this process
+        self._locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+        self.stats = {'stored': 0, 'deduplicated': 0, 'released': 0, 'unlinked': 0}
+
+    def _lock(self, digest: str) -> asyncio.Lock:
+        lock = self._locks.get(digest)
+        if lock is None:
+            lock = self._locks[digest] = asyncio.Lock()
+        return lock
+
+    def key_for(self, digest: str) -> str:
+        # Two levels of 256 shards keep every directory (or listing) small
+        return f"{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def digest_of(self, name: Optional[str]) -> Optional[str]:
+        match = BLOB_NAME_RE.match(name or '')
+        return match.group(1) if match else None
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Storage key for a public {sha256}{ext} name, or None for legacy flat filenames"""
+        digest = self.digest_of(name)
+        return self.key_for(digest) if digest else None
+
+    async def _take_ref(self, db, digest: str, size: int) -> bool:
+        """Increment (or create) the record; True when it was created. Waits out a concurrent delete."""
+        for _ in range(BLOB_INGEST_ATTEMPTS):
+            try:
+                result = await db.blobs.update_one(
+                    {'_id': digest, 'deleting': {'$ne': True}},
+                    {'$inc': {'refs': 1}, '$setOnInsert': {'size': size, 'created_at': datetime.now(timezone.utc)}},
+                    upsert=True
+                )
+                return result.upserted_id is not None
+            except DuplicateKeyError:
+                # Another process is removing the last reference; the record goes once the object is gone
+                stale = datetime.now(timezone.utc) - timedelta(seconds=BLOB_DELETE_STALE_SECONDS)
+                await db.blobs.delete_one({'_id': digest, 'deleting': True, 'deleting_at': {'$lt': stale}})
+                await asyncio.sleep(BLOB_INGEST_WAIT)
+        raise RuntimeError(f"Blob {digest} is still being deleted")
+
+    async def ingest(self, db, source: Path, digest: str, size: int, content_type: Optional[str] = None) -> bool:
+        """Take one reference on digest and store source under it; True when the bytes were already stored"""
+        key = self.key_for(digest)
+
+        async def _place(created: bool) -> bool:
+            # A fresh record always writes: whatever object is there may be a delete's leftover
+            if not created and await self.storage.exists(key):
+                await anyio.to_thread.run_sync(os.remove, source)
+                return True
+            await self.storage.put_file(key, source, content_type)
+            return False
+
+        async with self._lock(digest):
+            created = await self._take_ref(db, digest, size)
+            try:
+                deduplicated = await _place(created)
+            except Exception:
+                await self._release(db, digest)
+                raise
+        self.stats['deduplicated' if deduplicated else 'stored'] += 1
+        return deduplicated
+
+    async def add_ref(self, db, digest: str) -> bool:
+        """Take a reference on an already stored blob without any bytes; False if it is not stored"""
+        async with self._lock(digest):
+            result = await db.blobs.update_one(
+                {'_id': digest, 'refs': {'$gt': 0}, 'deleting': {'$ne': True}}, {'$inc': {'refs': 1}}
+            )
+            if result.modified_count != 1:
+                return False
+            if not await self.storage.exists(self.key_for(digest)):
+                await self._release(db, digest)
+                return False
+        self.stats['deduplicated'] += 1
+        return True
+
+    async def release(self, db, digest: Optional[str]):
+        """Drop one reference; the file is unlinked when the last one goes"""
+        if not digest:
+            return
+        async with self._lock(digest):
+            await self._release(db, digest)
+
+    async def _release(self, db, digest: str):
+        doc = await db.blobs.find_one_and_update(
+            {'_id': digest}, {'$inc': {'refs': -1}}, return_document=ReturnDocument.AFTER
+        )
+        self.stats['released'] += 1
+        if doc is None or doc['refs'] > 0:
+            return
+        # Claim the delete first: ingest and add_ref refuse a record in this state (in any process),
+        # so nobody can take a reference on an object that is about to disappear
+        claimed = await db.blobs.find_one_and_update(
+            {'_id': digest, 'refs': {'$lte': 0}, 'deleting': {'$ne': True}},
+            {'$set': {'deleting': True, 'deleting_at': datetime.now(timezone.utc)}}
+        )
+        if claimed is None:
+            return
+        await self.storage.delete(self.key_for(digest))
+        await db.blobs.delete_one({'_id': digest, 'deleting': True})
+        self.stats['unlinked'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'prefix': self.prefix, 'storage': self.storage.snapshot(), **self.stats}
+
+
+blob_store = BlobStore(storage)
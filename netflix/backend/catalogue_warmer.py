@@ -0,0 +1,134 @@
+import asyncio
+import os
+import random
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from tmdb_service import (
+    GENRE_MAP,
+    get_category_movies,
+    get_movie_details,
+    refresh_ahead,
+    tmdb_rate_limiter
+)
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_WARMER_ENABLED = os.environ.get('CATALOGUE_WARMER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Seconds between passes; must stay below the row TTLs (1h) for rows to never go cold
+CATALOGUE_WARMER_INTERVAL = float(os.environ.get('CATALOGUE_WARMER_INTERVAL', '900'))
+# Each pass starts up to this fraction of the interval early or late
+CATALOGUE_WARMER_JITTER = float(os.environ.get('CATALOGUE_WARMER_JITTER', '0.1'))
+CATALOGUE_WARMER_STARTUP_DELAY = float(os.environ.get('CATALOGUE_WARMER_STARTUP_DELAY', '5'))
+CATALOGUE_WARMER_ROW_LIMIT = int(os.environ.get('CATALOGUE_WARMER_ROW_LIMIT', '20'))
+CATALOGUE_WARMER_DETAILS_PER_ROW = int(os.environ.get('CATALOGUE_WARMER_DETAILS_PER_ROW', '10'))
+# API key tokens left for user traffic; the warmer waits rather than dip below this
+CATALOGUE_WARMER_MIN_BUDGET = float(os.environ.get('CATALOGUE_WARMER_MIN_BUDGET', '20'))
+CATALOGUE_WARMER_BUDGET_WAIT = float(os.environ.get('CATALOGUE_WARMER_BUDGET_WAIT', '30'))
+# Random pause between upstream calls so a pass doesn't arrive as one burst
+CATALOGUE_WARMER_SPACING = float(os.environ.get('CATALOGUE_WARMER_SPACING', '0.25'))
+
+WARM_CATEGORIES = ['trending', 'popular'] + list(GENRE_MAP)
+
+
+class BudgetExhausted(Exception):
+    """Raised when API key budget stays below the reserve for user traffic"""
+
+
+class CatalogueWarmer:
+    """Periodically refreshes every category row and its top titles' details in the TMDB cache"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.passes = 0
+        self.rows_warmed = 0
+        self.details_warmed = 0
+        self.budget_skips = 0
+        self.errors = 0
+        self.last_pass_at: Optional[float] = None
+        self.last_pass_seconds: Optional[float] = None
+
+    @property
+    def horizon(self) -> float:
+        """Anything expiring before the latest possible next pass is refetched now"""
+        return CATALOGUE_WARMER_INTERVAL * (1 + CATALOGUE_WARMER_JITTER) + 60
+
+    async def _wait_for_budget(self):
+        deadline = time.monotonic() + CATALOGUE_WARMER_BUDGET_WAIT
+        while tmdb_rate_limiter.remaining_budget() < CATALOGUE_WARMER_MIN_BUDGET:
+            if time.monotonic() >= deadline:
+                raise BudgetExhausted()
+            await asyncio.sleep(1)
+        await asyncio.sleep(random.uniform(0, CATALOGUE_WARMER_SPACING))
+
+    async def _warm_row(self, category: str):
+        await self._wait_for_budget()
+        with refresh_ahead(self.horizon):
+            movies = await get_category_movies(category, CATALOGUE_WARMER_ROW_LIMIT)
+        self.rows_warmed += 1
+
+        targets: List[Dict] = [
+            m for m in movies[:CATALOGUE_WARMER_DETAILS_PER_ROW]
+            if m.get('id') is not None and m.get('media_type') in ('movie', 'tv')
+        ]
+        for movie in targets:
+            await self._wait_for_budget()
+            with refresh_ahead(self.horizon):
+                await get_movie_details(movie['id'], movie['media_type'])
+            self.details_warmed += 1
+
+    async def run_once(self):
+        """Warm every row in turn; stops early if key budget is needed by users"""
+        started = time.monotonic()
+        for category in WARM_CATEGORIES:
+            try:
+                await self._warm_row(category)
+            except BudgetExhausted:
+                self.budget_skips += 1
+                logger.info(f"Catalogue warmer paused at '{category}': TMDB key budget is low")
+                break
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Catalogue warmer failed on '{category}': {e}")
+        self.passes += 1
+        self.last_pass_at = time.time()
+        self.last_pass_seconds = round(time.monotonic() - started, 3)
+
+    async def _run(self):
+        await asyncio.sleep(CATALOGUE_WARMER_STARTUP_DELAY)
+        while True:
+            await self.run_once()
+            jitter = random.uniform(-CATALOGUE_WARMER_JITTER, CATALOGUE_WARMER_JITTER)
+            await asyncio.sleep(CATALOGUE_WARMER_INTERVAL * (1 + jitter))
+
+    def start(self):
+        if self._task is None and CATALOGUE_WARMER_ENABLED:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Catalogue warmer started ({len(WARM_CATEGORIES)} rows every {CATALOGUE_WARMER_INTERVAL:.0f}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'enabled': CATALOGUE_WARMER_ENABLED,
+            'running': self._task is not None and not self._task.done(),
+            'interval': CATALOGUE_WARMER_INTERVAL,
+            'passes': self.passes,
+            'rows_warmed': self.rows_warmed,
+            'details_warmed': self.details_warmed,
+            'budget_skips': self.budget_skips,
+            'errors': self.errors,
+            'last_pass_at': self.last_pass_at,
+            'last_pass_seconds': self.last_pass_seconds
+        }
+
+
+catalogue_warmer = CatalogueWarmer()
@@ -0,0 +1,100 @@
+import os
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Consecutive upstream failures that open the circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+# Seconds an open circuit waits before letting a probe through
+CIRCUIT_RECOVERY_TIMEOUT = float(os.environ.get('CIRCUIT_RECOVERY_TIMEOUT', '30'))
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open single probe -> closed again on success"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {'opened': 0, 'rejected': 0, 'failures': 0, 'successes': 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; half-open admits one probe at a time"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.stats['rejected'] += 1
+        return False
+
+    def record_success(self):
+        self.stats['successes'] += 1
+        self._failures = 0
+        self._probe_in_flight = False
+        self._state = CLOSED
+
+    def record_failure(self):
+        self.stats['failures'] += 1
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.stats['opened'] += 1
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a half-open probe slot when the call never reached upstream"""
+        self._probe_in_flight = False
+
+    def retry_after(self) -> Optional[float]:
+        if self.state != OPEN:
+            return None
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'retry_after': self.retry_after(),
+            **self.stats
+        }
+
+
+class BreakerGroup:
+    """One breaker per name (e.g. endpoint family), created on first use"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(f"{self.prefix}:{name}")
+        return breaker
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
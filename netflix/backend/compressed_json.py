@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from fast_json import dumps
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this go out uncompressed
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+# Each payload is compressed once, so levels can favour size over speed
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '9'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '9'))
+RESPONSE_VARIANT_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_VARIANT_CACHE_MAX_BYTES', str(64 * 1024 ** 2)))
+CATALOGUE_CACHE_CONTROL = os.environ.get('CATALOGUE_CACHE_CONTROL', 'public, no-cache')
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    'gzip': lambda body: gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+# Server preference when the client accepts several equally
+ENCODING_PREFERENCE = ['br', 'gzip']
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported coding from an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in ENCODING_PREFERENCE:
+        if coding not in COMPRESSORS:
+            continue
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def etag_matches(if_none_match: str, digest: str) -> bool:
+    """If-None-Match check; any encoding's tag for the same payload counts (weak comparison)"""
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"').split('-', 1)[0] == digest:
+            return True
+    return False
+
+
+class CompressedVariantCache:
+    """Byte-bounded LRU of compressed bodies keyed by payload digest and encoding"""
+
+    def __init__(self, max_bytes: int = RESPONSE_VARIANT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'compressions': 0, 'not_modified': 0, 'identity': 0}
+
+    def get(self, digest: str, encoding: str, body: bytes) -> bytes:
+        key = (digest, encoding)
+        compressed = self._entries.get(key)
+        if compressed is not None:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return compressed
+        compressed = COMPRESSORS[encoding](body)
+        self.stats['compressions'] += 1
+        self._entries[key] = compressed
+        self.total_bytes += len(compressed)
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+        return compressed
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'encodings': list(COMPRESSORS),
+            **self.stats
+        }
+
+
+response_variants = CompressedVariantCache()
+
+
+def json_response(request: Request, content: Any, cache_control: str = CATALOGUE_CACHE_CONTROL) -> Response:
+    """JSON response with a strong ETag from the payload hash, 304 handling and memoized compression"""
+    body = dumps(content)
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    encoding = negotiate_encoding(request.headers.get('accept-encoding')) if len(body) >= RESPONSE_COMPRESS_MIN_BYTES else None
+    # Each encoding is a different byte sequence, so it gets its own strong tag
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and etag_matches(if_none_match, digest):
+        response_variants.stats['not_modified'] += 1
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        body = response_variants.get(digest, encoding, body)
+        headers['Content-Encoding'] = encoding
+    else:
+        response_variants.stats['identity'] += 1
+    return Response(body, media_type='application/json', headers=headers)
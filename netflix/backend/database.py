@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Env var -> MongoClient option; unset vars keep the defaults below (or the driver's)
+POOL_SETTINGS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', 100),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', 0),
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', 60000),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', 5000),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', 5000),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', None),
+}
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection counts and checkout wait times from pymongo pool events"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._waits = deque(maxlen=window)
+        self.open = 0
+        self.in_use = 0
+        self.created = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.max_wait_ms = 0.0
+
+    def _record_wait(self):
+        started = getattr(self._local, 'started', None)
+        if started is None:
+            return
+        self._local.started = None
+        wait_ms = (time.perf_counter() - started) * 1000
+        self._waits.append(wait_ms)
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_started(self, event):
+        # Motor runs pymongo calls on executor threads; start/finish happen on the same one
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._record_wait()
+            self.checkouts += 1
+            self.in_use += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._record_wait()
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+        def pct(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 3) if waits else 0.0
+        return {
+            'open_connections': self.open,
+            'in_use': self.in_use,
+            'created': self.created,
+            'closed': self.closed,
+            'checkouts': self.checkouts,
+            'checkout_failures': self.checkout_failures,
+            'checkout_wait_ms': {
+                'p50': pct(0.5),
+                'p95': pct(0.95),
+                'p99': pct(0.99),
+                'max': round(self.max_wait_ms, 3)
+            }
+        }
+
+
+pool_metrics = PoolMetrics()
+
+_client: Optional[AsyncIOMotorClient] = None
+_db: Optional[AsyncIOMotorDatabase] = None
+_settings: Dict[str, Any] = {}
+
+
+def pool_settings() -> Dict[str, Any]:
+    """Client pool options from the environment"""
+    settings = {}
+    for env_name, (option, default) in POOL_SETTINGS.items():
+        value = os.environ.get(env_name)
+        if value is not None:
+            settings[option] = int(value)
+        elif default is not None:
+            settings[option] = default
+    return settings
+
+
+def connect() -> AsyncIOMotorDatabase:
+    """Create the process-wide Motor client; called once from the app lifespan"""
+    global _client, _db, _settings
+    if _client is None:
+        _settings = pool_settings()
+        _client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'], tz_aware=True, event_listeners=[pool_metrics], **_settings
+        )
+        _db = _client[os.environ['DB_NAME']]
+        logger.info(f"MongoDB client created with {_settings}")
+    return _db
+
+
+def close():
+    global _client, _db
+    if _client is not None:
+        _client.close()
+        _client = None
+        _db = None
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    """FastAPI dependency returning the shared database handle"""
+    if _db is None:
+        raise RuntimeError("Database is not connected; connect() runs in the app lifespan")
+    return _db
+
+
+def snapshot() -> Dict[str, Any]:
+    return {'connected': _client is not None, 'settings': _settings, 'pool': pool_metrics.snapshot()}
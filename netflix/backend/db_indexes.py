@@ -0,0 +1,205 @@
+import asyncio
+import os
+import random
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# status_checks documents expire this many seconds after their timestamp
+STATUS_CHECK_TTL = int(os.environ.get('STATUS_CHECK_TTL', str(30 * 24 * 3600)))
+# Fraction of instrumented queries that get an explain() to detect collection scans
+QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get('QUERY_EXPLAIN_SAMPLE_RATE', '0.01'))
+# Don't re-explain the same query shape more often than this (seconds)
+QUERY_EXPLAIN_INTERVAL = float(os.environ.get('QUERY_EXPLAIN_INTERVAL', '600'))
+
+# MongoDB error codes for an existing index with the same name/keys but different options
+INDEX_CONFLICT_CODES = (85, 86)
+
+
+class IndexSpec:
+    """One index the application expects to exist"""
+
+    def __init__(self, collection: str, keys: List[Tuple[str, int]], name: str, **options):
+        self.collection = collection
+        self.keys = keys
+        self.name = name
+        self.options = options
+
+    def describe(self) -> Dict[str, Any]:
+        return {'collection': self.collection, 'name': self.name, 'keys': self.keys, **self.options}
+
+
+INDEX_REGISTRY: List[IndexSpec] = [
+    IndexSpec('custom_videos', [('id', 1)], 'id_unique', unique=True),
+    IndexSpec('custom_videos', [('created_at', -1), ('id', -1)], 'created_at_id'),
+    IndexSpec('custom_videos', [('category', 1), ('created_at', -1), ('id', -1)], 'category_created_at_id'),
+    IndexSpec('custom_videos', [('thumbnail_path', 1)], 'thumbnail_path', sparse=True),
+    IndexSpec('status_checks', [('id', 1)], 'id_unique', unique=True),
+    IndexSpec('status_checks', [('timestamp', 1)], 'timestamp_ttl', expireAfterSeconds=STATUS_CHECK_TTL),
+    IndexSpec('upload_sessions', [('id', 1)], 'id_unique', unique=True),
+    IndexSpec('upload_sessions', [('status', 1), ('updated_at', 1)], 'status_updated_at'),
+    IndexSpec('media_jobs', [('id', 1)], 'id_unique', unique=True),
+    IndexSpec('media_jobs', [('status', 1), ('run_after', 1)], 'status_run_after'),
+    IndexSpec('media_jobs', [('video_id', 1)], 'video_id'),
+    IndexSpec('tmdb_cache', [('purge_at', 1)], 'purge_at_ttl', expireAfterSeconds=0),
+    IndexSpec('tmdb_snapshots', [('purge_at', 1)], 'purge_at_ttl', expireAfterSeconds=0),
+    IndexSpec('revoked_tokens', [('expires_at', 1)], 'expires_at_ttl', expireAfterSeconds=0),
+]
+
+
+# Last ensure_indexes() result, for diagnostics
+index_report: List[Dict[str, Any]] = []
+
+
+async def _ensure_index(db, spec: IndexSpec) -> str:
+    collection = db[spec.collection]
+    try:
+        await collection.create_index(spec.keys, name=spec.name, **spec.options)
+        return 'ok'
+    except OperationFailure as e:
+        if e.code not in INDEX_CONFLICT_CODES:
+            raise
+    # Same name or keys with different options (e.g. a changed TTL): rebuild it
+    logger.info(f"Rebuilding index {spec.collection}.{spec.name} with new options")
+    indexes = await collection.index_information()
+    for name, info in indexes.items():
+        if name == spec.name or info.get('key') == spec.keys:
+            await collection.drop_index(name)
+    await collection.create_index(spec.keys, name=spec.name, **spec.options)
+    return 'rebuilt'
+
+
+async def ensure_indexes(db, registry: List[IndexSpec] = INDEX_REGISTRY) -> List[Dict[str, Any]]:
+    """Create every registered index; safe to run on every startup"""
+    report = []
+    for spec in registry:
+        try:
+            status = await _ensure_index(db, spec)
+        except Exception as e:
+            logger.error(f"Could not ensure index {spec.collection}.{spec.name}: {e}")
+            status = f'error: {e}'
+        report.append({**spec.describe(), 'status': status})
+    index_report[:] = report
+    return report
+
+
+async def _status_checks_timestamp_to_date(db):
+    """TTL indexes only expire BSON dates, so convert ISO-string timestamps"""
+    await db.status_checks.update_many(
+        {'timestamp': {'$type': 'string'}},
+        [{'$set': {'timestamp': {'$dateFromString': {'dateString': '$timestamp'}}}}]
+    )
+
+
+async def _custom_videos_backfill_created_at(db):
+    """Keyset pagination sorts on created_at; derive it from the ObjectId for old uploads"""
+    await db.custom_videos.update_many(
+        {'created_at': {'$exists': False}},
+        [{'$set': {'created_at': {'$toDate': '$_id'}}}]
+    )
+
+
+MIGRATIONS: List[Tuple[str, Callable[[Any], Awaitable[None]]]] = [
+    ('0001_status_checks_timestamp_to_date', _status_checks_timestamp_to_date),
+    ('0002_custom_videos_backfill_created_at', _custom_videos_backfill_created_at),
+]
+
+
+async def run_migrations(db) -> List[str]:
+    """Apply migrations not yet recorded in the migrations collection, in order"""
+    applied = []
+    done = {doc['_id'] async for doc in db.migrations.find({}, {'_id': 1})}
+    for name, migration in MIGRATIONS:
+        if name in done:
+            continue
+        logger.info(f"Applying migration {name}")
+        await migration(db)
+        # Upsert: another worker starting at the same time may have applied and recorded it too
+        await db.migrations.update_one(
+            {'_id': name}, {'$setOnInsert': {'applied_at': datetime.now(timezone.utc)}}, upsert=True
+        )
+        applied.append(name)
+    return applied
+
+
+def _query_shape(value: Any) -> Any:
+    """Replace literal values with type names so shapes group similar queries"""
+    if isinstance(value, dict):
+        return {k: _query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_query_shape(v) for v in value]
+    return type(value).__name__
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get('stage', '')]
+    if 'inputStage' in plan:
+        stages.extend(_plan_stages(plan['inputStage']))
+    for child in plan.get('inputStages', []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+class QueryProfiler:
+    """Sample queries with explain() and remember shapes whose winning plan is a COLLSCAN"""
+
+    def __init__(self, sample_rate: float = QUERY_EXPLAIN_SAMPLE_RATE, interval: float = QUERY_EXPLAIN_INTERVAL):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.unindexed: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._last_checked: Dict[str, float] = {}
+        self._tasks = set()
+        self.stats = {'sampled': 0, 'explained': 0, 'errors': 0}
+
+    def sample(self, collection, filter: Dict, sort: Optional[List[Tuple[str, int]]] = None):
+        """Maybe explain this query in the background; never blocks the caller"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        self.stats['sampled'] += 1
+        shape = {'filter': _query_shape(filter), 'sort': sort}
+        key = f"{collection.name}:{shape}"
+        now = time.monotonic()
+        if now - self._last_checked.get(key, -self.interval) < self.interval:
+            return
+        self._last_checked[key] = now
+        task = asyncio.create_task(self._explain(collection, filter, sort, key, shape))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, collection, filter: Dict, sort, key: str, shape: Dict):
+        try:
+            cursor = collection.find(filter)
+            if sort:
+                cursor = cursor.sort(sort)
+            plan = await cursor.explain()
+            self.stats['explained'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.debug(f"explain() failed for {key}: {e}")
+            return
+        stages = _plan_stages(plan.get('queryPlanner', {}).get('winningPlan', {}))
+        if 'COLLSCAN' in stages:
+            entry = self.unindexed.get(key) or {'collection': collection.name, **shape, 'count': 0}
+            entry['count'] += 1
+            entry['stages'] = stages
+            entry['last_seen'] = datetime.now(timezone.utc).isoformat()
+            self.unindexed[key] = entry
+            logger.warning(f"Query without index on {collection.name}: {shape}")
+        else:
+            self.unindexed.pop(key, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'sample_rate': self.sample_rate,
+            'unindexed_queries': list(self.unindexed.values()),
+            **self.stats
+        }
+
+
+query_profiler = QueryProfiler()
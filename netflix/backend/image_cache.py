@@ -0,0 +1,151 @@
+import asyncio
+import os
+import re
+import uuid
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import anyio
+import httpx
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+TMDB_IMAGE_CDN = 'https://image.tmdb.org/t/p'
+IMAGE_CACHE_DIR = Path(os.environ.get('IMAGE_CACHE_DIR', str(Path(__file__).parent / 'image_cache')))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', '10'))
+
+# TMDB size buckets we are willing to proxy
+ALLOWED_SIZES = {'w92', 'w154', 'w185', 'w300', 'w342', 'w500', 'w780', 'w1280', 'original'}
+IMAGE_PATH_RE = re.compile(r'^[A-Za-z0-9_-]+\.(jpg|jpeg|png|webp|svg)$')
+
+
+class ImageFetchError(Exception):
+    """Raised when TMDB's image CDN can't provide the requested image"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DiskLRUCache:
+    """Size-bounded on-disk cache of image bytes, evicting least recently used files"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        self.total_bytes = 0
+        self._loaded = False
+        # Concurrent first requests must not scan (and count) the directory twice
+        self._load_lock = asyncio.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _load(self):
+        """Rebuild the index from disk, oldest access first"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.root.glob('*/*'):
+            if path.is_file() and not path.name.startswith('.'):
+                st = path.stat()
+                files.append((st.st_atime, path, st.st_size))
+        for _, path, size in sorted(files):
+            key = f"{path.parent.name}/{path.name}"
+            self._entries[key] = size
+            self.total_bytes += size
+        self._loaded = True
+
+    async def ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await anyio.to_thread.run_sync(self._load)
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key
+
+    def get(self, key: str) -> Optional[Path]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return self.path_for(key)
+        self.stats['misses'] += 1
+        return None
+
+    def _write(self, key: str, data: bytes):
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f".{uuid.uuid4().hex}.tmp"
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    async def put(self, key: str, data: bytes) -> Path:
+        await anyio.to_thread.run_sync(self._write, key, data)
+        self.total_bytes += len(data) - self._entries.pop(key, 0)
+        self._entries[key] = len(data)
+        await self._evict()
+        return self.path_for(key)
+
+    async def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.stats['evictions'] += 1
+            try:
+                await anyio.to_thread.run_sync(os.remove, self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            **self.stats
+        }
+
+
+image_cache = DiskLRUCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+_image_flight = SingleFlight()
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(base_url=TMDB_IMAGE_CDN, timeout=IMAGE_FETCH_TIMEOUT)
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def _fetch(size: str, filename: str, key: str) -> Path:
+    try:
+        response = await _get_http_client().get(f"/{size}/{filename}")
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        status_code = 404 if e.response.status_code == 404 else 502
+        raise ImageFetchError(f"TMDB image CDN returned {e.response.status_code}", status_code)
+    except httpx.HTTPError as e:
+        raise ImageFetchError(f"TMDB image fetch failed: {e}")
+    return await image_cache.put(key, response.content)
+
+
+async def get_image(size: str, filename: str) -> Path:
+    """Return a local path for a TMDB image, fetching it once on a cache miss"""
+    await image_cache.ensure_loaded()
+    key = f"{size}/{filename}"
+    path = image_cache.get(key)
+    if path is not None:
+        return path
+    return await _image_flight.do(key, lambda: _fetch(size, filename, key))
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import uuid
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it the original upload is served
+    Image = None
+
+from storage import storage
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = [int(w) for w in os.environ.get('THUMBNAIL_WIDTHS', '160,320,640,1280').split(',')]
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+WEBP_QUALITY = int(os.environ.get('THUMBNAIL_WEBP_QUALITY', '80'))
+JPEG_QUALITY = int(os.environ.get('THUMBNAIL_JPEG_QUALITY', '82'))
+
+# Storage key prefix for generated variants
+VARIANT_PREFIX = 'variants'
+
+# Card/hero contexts -> target width
+POSTER_WIDTH = 320
+BACKDROP_WIDTH = 1280
+
+FORMATS = {'webp': 'webp', 'jpeg': 'jpg'}
+SAVE_OPTIONS = {
+    'webp': {'quality': WEBP_QUALITY, 'method': 4},
+    'jpeg': {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+}
+# {stem}.w{width}.{content hash}.{ext}: the hash makes every URL safe to cache forever
+VARIANT_NAME_RE = re.compile(r'^[\w-]+\.w\d+\.[0-9a-f]{12}\.(webp|jpg)$')
+
+_executor: Optional[ProcessPoolExecutor] = None
+_tasks = set()
+
+
+def is_variant_name(filename: str) -> bool:
+    return bool(VARIANT_NAME_RE.match(filename))
+
+
+def generate_variants(source: str, dest_dir: str, stem: str, widths: List[int] = THUMBNAIL_WIDTHS) -> Dict[str, Any]:
+    """Write resized WebP and JPEG copies of source; runs in a worker process"""
+    with open(source, 'rb') as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()[:12]
+
+    os.makedirs(dest_dir, exist_ok=True)
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGB')
+        original_width = img.width
+        # Never upscale; the largest variant is capped at the original width
+        targets = sorted({w for w in widths if w < original_width} | {min(original_width, max(widths))})
+
+        variants = {}
+        for width in targets:
+            height = max(1, round(img.height * width / original_width))
+            resized = img.resize((width, height), Image.LANCZOS) if width != original_width else img
+            names = {}
+            for fmt, ext in FORMATS.items():
+                name = f"{stem}.w{width}.{content_hash}.{ext}"
+                resized.save(os.path.join(dest_dir, name), format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                names[fmt] = name
+            variants[str(width)] = names
+
+    return {'hash': content_hash, 'width': original_width, 'variants': variants}
+
+
+def pick_variant(thumbnail_variants: Optional[Dict[str, Any]], width: int, fmt: str = 'webp') -> Optional[str]:
+    """Smallest variant at least `width` wide (else the largest), in the requested format"""
+    if not thumbnail_variants or not thumbnail_variants.get('variants'):
+        return None
+    sizes = sorted(int(w) for w in thumbnail_variants['variants'])
+    chosen = next((w for w in sizes if w >= width), sizes[-1])
+    return thumbnail_variants['variants'][str(chosen)].get(fmt)
+
+
+def variant_files(thumbnail_variants: Optional[Dict[str, Any]]) -> List[str]:
+    if not thumbnail_variants:
+        return []
+    return [name for names in thumbnail_variants.get('variants', {}).values() for name in names.values()]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    return _executor
+
+
+def variant_key(name: str) -> str:
+    return f"{VARIANT_PREFIX}/{name}"
+
+
+async def delete_variants(names: Iterable[str]):
+    for name in names:
+        await storage.delete(variant_key(name))
+
+
+async def _build_and_store(db, video_id: str, source_key: str):
+    loop = asyncio.get_running_loop()
+    # Rendered into node-local scratch, then published through the storage backend
+    scratch = storage.scratch_dir / f"variants-{uuid.uuid4().hex}"
+    stored = []
+    try:
+        async with storage.local_copy(source_key) as source:
+            result = await loop.run_in_executor(
+                _get_executor(), generate_variants, str(source), str(scratch), f"{video_id}_thumb"
+            )
+        for name in variant_files(result):
+            content_type = 'image/webp' if name.endswith('.webp') else 'image/jpeg'
+            await storage.put_file(variant_key(name), scratch / name, content_type)
+            stored.append(name)
+    except Exception as e:
+        logger.warning(f"Thumbnail variants for {video_id} failed: {e}")
+        await delete_variants(stored)
+        return
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    # Swap in one step and get the replaced set back, so no variant is left without a document
+    previous = await db.custom_videos.find_one_and_update(
+        {"id": video_id},
+        {"$set": {"thumbnail_variants": result}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
+        # Deleted while rendering
+        await delete_variants(stored)
+        return
+    # Names carry the content hash, so an unchanged thumbnail keeps its files
+    await delete_variants(set(variant_files(previous.get("thumbnail_variants"))) - set(stored))
+
+
+def schedule_variants(db, video_id: str, source_key: str):
+    """Generate thumbnail variants in the worker pool without holding up the request"""
+    if Image is None:
+        logger.info("Pillow not installed; skipping thumbnail variants")
+        return
+    task = asyncio.create_task(_build_and_store(db, video_id, source_key))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
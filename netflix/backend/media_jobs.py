@@ -0,0 +1,275 @@
+import asyncio
+import os
+import uuid
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+import anyio
+from pymongo import ReturnDocument
+
+from media_processing import MediaToolMissing
+from storage import storage
+
+logger = logging.getLogger(__name__)
+
+MEDIA_JOB_WORKERS = int(os.environ.get('MEDIA_JOB_WORKERS', '2'))
+# Idle workers re-check the collection this often (jobs enqueued by other API processes)
+MEDIA_JOB_POLL_INTERVAL = float(os.environ.get('MEDIA_JOB_POLL_INTERVAL', '5'))
+# A running job whose lease lapses (e.g. its process died) is picked up again;
+# live workers renew it every heartbeat, so it only needs to outlast a few missed beats
+MEDIA_JOB_LEASE = int(os.environ.get('MEDIA_JOB_LEASE', '300'))
+MEDIA_JOB_HEARTBEAT = float(os.environ.get('MEDIA_JOB_HEARTBEAT', str(MEDIA_JOB_LEASE / 5)))
+MEDIA_JOB_MAX_ATTEMPTS = int(os.environ.get('MEDIA_JOB_MAX_ATTEMPTS', '3'))
+MEDIA_JOB_RETRY_DELAY = int(os.environ.get('MEDIA_JOB_RETRY_DELAY', '30'))
+
+# Errors a retry cannot fix
+PERMANENT_ERRORS = (MediaToolMissing, FileNotFoundError)
+
+JOB_PROJECTION = {'_id': 0, 'payload': 0, 'lease_until': 0, 'lease_token': 0}
+
+
+class JobHandler:
+    """Blocking work run in the process pool, then an async step that applies its result.
+
+    Payload fields named in inputs hold storage keys; the worker gets a local file path instead.
+    Fields named in outputs are scratch paths the worker writes: every attempt gets its own
+    unique name, and a failed attempt's leftovers are removed.
+    """
+
+    def __init__(
+        self,
+        process: Callable[..., Dict[str, Any]],
+        apply: Callable[[Any, Dict, Dict], Awaitable[None]],
+        inputs: Sequence[str] = (),
+        outputs: Sequence[str] = ()
+    ):
+        self.process = process
+        self.apply = apply
+        self.inputs = inputs
+        self.outputs = outputs
+
+
+def _attempt_path(path: str, job_id: str) -> Path:
+    """{stem}.{job id}.{uuid}{suffix}: never shared with another attempt of the same job"""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.{job_id}.{uuid.uuid4().hex}{path.suffix}")
+
+
+class MediaJobQueue:
+    """Persistent job queue in the media_jobs collection, drained by worker tasks into a process pool"""
+
+    def __init__(self):
+        self.handlers: Dict[str, JobHandler] = {}
+        self._db = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._workers = []
+        self._wake = asyncio.Event()
+        self.stats = {'enqueued': 0, 'completed': 0, 'failed': 0, 'retried': 0, 'leases_lost': 0}
+
+    def register(self, job_type: str, process, apply, inputs: Sequence[str] = (), outputs: Sequence[str] = ()):
+        self.handlers[job_type] = JobHandler(process, apply, inputs, outputs)
+
+    async def enqueue(self, db, job_type: str, video_id: str, payload: Dict[str, Any]) -> str:
+        """Record a job; an idle worker in this process starts on it right away"""
+        now = datetime.now(timezone.utc)
+        job_id = str(uuid.uuid4())
+        await db.media_jobs.insert_one({
+            'id': job_id,
+            'type': job_type,
+            'video_id': video_id,
+            'payload': payload,
+            'status': 'queued',
+            'attempts': 0,
+            'run_after': now,
+            'created_at': now,
+            'updated_at': now
+        })
+        self.stats['enqueued'] += 1
+        self._wake.set()
+        return job_id
+
+    async def get(self, db, job_id: str) -> Optional[Dict[str, Any]]:
+        return await db.media_jobs.find_one({'id': job_id}, JOB_PROJECTION)
+
+    async def _fail_abandoned(self, now: datetime):
+        """Fail jobs whose last allowed attempt died holding the lease instead of running them again"""
+        result = await self._db.media_jobs.update_many(
+            {
+                'type': {'$in': list(self.handlers)},
+                'status': 'running',
+                'lease_until': {'$lt': now},
+                'attempts': {'$gte': MEDIA_JOB_MAX_ATTEMPTS}
+            },
+            {
+                '$set': {
+                    'status': 'failed',
+                    'error': f"Lease expired on attempt {MEDIA_JOB_MAX_ATTEMPTS} of {MEDIA_JOB_MAX_ATTEMPTS}",
+                    'finished_at': now,
+                    'updated_at': now
+                },
+                '$unset': {'lease_until': '', 'lease_token': ''}
+            }
+        )
+        self.stats['failed'] += result.modified_count
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        await self._fail_abandoned(now)
+        return await self._db.media_jobs.find_one_and_update(
+            {
+                'type': {'$in': list(self.handlers)},
+                '$or': [
+                    {'status': 'queued', 'run_after': {'$lte': now}},
+                    {'status': 'running', 'lease_until': {'$lt': now}, 'attempts': {'$lt': MEDIA_JOB_MAX_ATTEMPTS}}
+                ]
+            },
+            {
+                '$set': {
+                    'status': 'running',
+                    'started_at': now,
+                    'updated_at': now,
+                    'lease_until': now + timedelta(seconds=MEDIA_JOB_LEASE),
+                    # Identifies this attempt, so a worker that lost its lease cannot renew or finish the job
+                    'lease_token': uuid.uuid4().hex
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('run_after', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _finish(self, job: Dict[str, Any], update: Dict[str, Any]):
+        update['updated_at'] = datetime.now(timezone.utc)
+        result = await self._db.media_jobs.update_one(
+            {'id': job['id'], 'lease_token': job['lease_token']},
+            {'$set': update, '$unset': {'lease_until': '', 'lease_token': ''}}
+        )
+        if not result.matched_count:
+            logger.warning(f"Media job {job['id']} was re-claimed elsewhere; dropping this attempt's outcome")
+
+    async def _renew_lease(self, job: Dict[str, Any]) -> bool:
+        """Extend this attempt's lease; False once another worker has taken the job over"""
+        if job.get('lease_lost'):
+            return False
+        now = datetime.now(timezone.utc)
+        result = await self._db.media_jobs.update_one(
+            {'id': job['id'], 'lease_token': job['lease_token']},
+            {'$set': {'lease_until': now + timedelta(seconds=MEDIA_JOB_LEASE), 'updated_at': now}}
+        )
+        if not result.matched_count:
+            job['lease_lost'] = True
+            self.stats['leases_lost'] += 1
+            logger.warning(f"Media job {job['id']} lost its lease")
+            return False
+        return True
+
+    async def _heartbeat(self, job: Dict[str, Any]):
+        """Renew the lease while the job runs, so a long encode is not claimed a second time"""
+        while True:
+            await asyncio.sleep(MEDIA_JOB_HEARTBEAT)
+            try:
+                if not await self._renew_lease(job):
+                    return
+            except Exception as e:
+                logger.warning(f"Media job {job['id']} lease renewal failed: {e}")
+
+    async def _run(self, job: Dict[str, Any]):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self._attempt(job)
+        finally:
+            heartbeat.cancel()
+
+    async def _remove_outputs(self, outputs: Sequence[Path]):
+        for path in outputs:
+            await anyio.to_thread.run_sync(partial(path.unlink, missing_ok=True))
+
+    async def _attempt(self, job: Dict[str, Any]):
+        handler = self.handlers[job['type']]
+        loop = asyncio.get_running_loop()
+        payload = dict(job['payload'])
+        outputs = []
+        for field in handler.outputs:
+            if payload.get(field):
+                payload[field] = str(_attempt_path(payload[field], job['id']))
+                outputs.append(Path(payload[field]))
+        try:
+            async with AsyncExitStack() as stack:
+                for field in handler.inputs:
+                    if payload.get(field):
+                        payload[field] = str(await stack.enter_async_context(storage.local_copy(payload[field])))
+                result = await loop.run_in_executor(self._get_executor(), partial(handler.process, **payload))
+            # The worker that took over a lapsed lease applies its own result; renewing also
+            # leaves this attempt a full lease for the apply step
+            if not await self._renew_lease(job):
+                await self._remove_outputs(outputs)
+                logger.warning(f"Media job {job['id']} was re-claimed elsewhere; not applying this attempt")
+                return
+            await handler.apply(self._db, job, result)
+        except Exception as e:
+            await self._remove_outputs(outputs)
+            permanent = isinstance(e, PERMANENT_ERRORS) or job['attempts'] >= MEDIA_JOB_MAX_ATTEMPTS
+            logger.warning(f"Media job {job['id']} ({job['type']}) attempt {job['attempts']} failed: {e}")
+            if permanent:
+                self.stats['failed'] += 1
+                await self._finish(job, {'status': 'failed', 'error': str(e), 'finished_at': datetime.now(timezone.utc)})
+            else:
+                self.stats['retried'] += 1
+                delay = MEDIA_JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+                await self._finish(job, {
+                    'status': 'queued',
+                    'error': str(e),
+                    'run_after': datetime.now(timezone.utc) + timedelta(seconds=delay)
+                })
+            return
+        self.stats['completed'] += 1
+        await self._finish(job, {'status': 'done', 'result': result, 'error': None, 'finished_at': datetime.now(timezone.utc)})
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.warning(f"Media job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), MEDIA_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=MEDIA_JOB_WORKERS)
+        return self._executor
+
+    def start(self, db):
+        if self._workers:
+            return
+        self._db = db
+        self._wake = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(MEDIA_JOB_WORKERS)]
+        logger.info(f"Media job workers started ({MEDIA_JOB_WORKERS})")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'workers': len(self._workers), 'job_types': list(self.handlers), **self.stats}
+
+
+media_jobs = MediaJobQueue()
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+FFPROBE_BIN = os.environ.get('FFPROBE_BIN', 'ffprobe')
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+# Upper bound for a single ffmpeg/ffprobe invocation
+MEDIA_TOOL_TIMEOUT = float(os.environ.get('MEDIA_TOOL_TIMEOUT', '600'))
+POSTER_FRAME_WIDTH = int(os.environ.get('POSTER_FRAME_WIDTH', '1280'))
+
+# Containers whose moov atom can be moved to the front
+ISO_BMFF_FORMATS = {'mov', 'mp4', 'm4a', '3gp', '3g2', 'mj2'}
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class MediaToolMissing(Exception):
+    """Raised when ffmpeg/ffprobe are not installed; retrying will not help"""
+
+
+def _run(args, timeout: float = MEDIA_TOOL_TIMEOUT) -> subprocess.CompletedProcess:
+    if shutil.which(args[0]) is None:
+        raise MediaToolMissing(f"{args[0]} is not installed")
+    result = subprocess.run(args, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"{Path(args[0]).name} failed: {result.stderr.decode(errors='replace').strip()[-500:]}")
+    return result
+
+
+def _number(value: Any, cast=float) -> Optional[Any]:
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(value: Optional[str]) -> Optional[float]:
+    num, _, den = (value or '').partition('/')
+    num, den = _number(num), _number(den or 1)
+    return round(num / den, 3) if num and den else None
+
+
+def probe(path: str) -> Dict[str, Any]:
+    """Container duration/bitrate and the first video and audio stream, via ffprobe"""
+    result = _run([
+        FFPROBE_BIN, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path
+    ])
+    data = json.loads(result.stdout or b'{}')
+    fmt = data.get('format', {})
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    info = {
+        'container': fmt.get('format_name'),
+        'duration': _number(fmt.get('duration')),
+        'bit_rate': _number(fmt.get('bit_rate'), int),
+        'video': None,
+        'audio': None
+    }
+    if video:
+        info['video'] = {
+            'codec': video.get('codec_name'),
+            'profile': video.get('profile'),
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'fps': _frame_rate(video.get('avg_frame_rate')),
+            'pix_fmt': video.get('pix_fmt'),
+            'bit_rate': _number(video.get('bit_rate'), int)
+        }
+    if audio:
+        info['audio'] = {
+            'codec': audio.get('codec_name'),
+            'channels': audio.get('channels'),
+            'sample_rate': _number(audio.get('sample_rate'), int),
+            'bit_rate': _number(audio.get('bit_rate'), int)
+        }
+    return info
+
+
+def moov_after_mdat(path: str) -> bool:
+    """Walk top-level ISO-BMFF boxes; True when media data precedes the moov index"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + 8 <= size:
+            f.seek(offset)
+            box_size, box_type = struct.unpack('>I4s', f.read(8))
+            if box_size == 1:
+                box_size = struct.unpack('>Q', f.read(8))[0]
+            elif box_size == 0:
+                box_size = size - offset
+            if box_type == b'moov':
+                return False
+            if box_type == b'mdat':
+                return True
+            if box_size < 8:
+                break
+            offset += box_size
+    return False
+
+
+def faststart(path: str, dest: Optional[str] = None):
+    """Rewrite the file with its moov atom first (stream copy, no re-encode), in place or to dest"""
+    src = Path(path)
+    # Unique per call: a re-claimed job may run alongside the attempt it replaced
+    tmp = src.with_name(f".{src.stem}.faststart-{uuid.uuid4().hex}{src.suffix}") if dest is None else Path(dest)
+    try:
+        _run([FFMPEG_BIN, '-v', 'error', '-y', '-i', str(src), '-map', '0', '-c', 'copy',
+              '-movflags', '+faststart', '-f', 'mp4', str(tmp)])
+        if dest is None:
+            os.replace(tmp, src)
+    finally:
+        if dest is None and tmp.exists():
+            tmp.unlink()
+
+
+def extract_poster(path: str, dest: str, duration: Optional[float]):
+    """Grab one frame ~10% in (at most 10s) as a JPEG poster"""
+    at = min(duration * 0.1, 10.0) if duration else 0.0
+    _run([FFMPEG_BIN, '-v', 'error', '-y', '-ss', f"{at:.3f}", '-i', path, '-frames:v', '1',
+          '-vf', f"scale='min({POSTER_FRAME_WIDTH},iw)':-2", '-q:v', '3', dest])
+
+
+def file_digest(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def process_upload(video_path: str, poster_path: Optional[str] = None, remux_path: Optional[str] = None) -> Dict[str, Any]:
+    """Probe, faststart and (optionally) extract a poster frame; runs in a worker process.
+
+    With remux_path the faststart copy is written there and the source is left untouched
+    (content-addressed blobs must never change under their hash).
+    """
+    info = probe(video_path)
+    result: Dict[str, Any] = {'media_info': info, 'faststart': False, 'poster': None}
+
+    container = set((info.get('container') or '').split(','))
+    if container & ISO_BMFF_FORMATS:
+        if moov_after_mdat(video_path):
+            faststart(video_path, remux_path)
+            # The bytes changed, so size and checksum must follow
+            output = remux_path or video_path
+            result['size'] = os.path.getsize(output)
+            result['checksum'] = file_digest(output)
+            result['remuxed'] = remux_path
+        result['faststart'] = True
+
+    if poster_path and info.get('video'):
+        extract_poster(video_path, poster_path, info.get('duration'))
+        result['poster'] = poster_path
+        result['poster_size'] = os.path.getsize(poster_path)
+        result['poster_checksum'] = file_digest(poster_path)
+    return result
+
+
+# HLS ladder as height:video kbps, best first; renditions taller than the source are skipped
+HLS_RENDITIONS = os.environ.get('HLS_RENDITIONS', '1080:5000,720:2800,480:1400,360:800')
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', '6'))
+HLS_KEYFRAME_SECONDS = 2
+HLS_AUDIO_KBPS = 128
+
+
+def hls_ladder(source_height: Optional[int]):
+    ladder = []
+    for entry in HLS_RENDITIONS.split(','):
+        height, _, kbps = entry.partition(':')
+        ladder.append((int(height), int(kbps)))
+    fitting = [(h, k) for h, k in ladder if not source_height or h <= source_height]
+    # Sources smaller than every rung still get the lowest one, at their own (even) height
+    return fitting or [(source_height - source_height % 2, min(k for _, k in ladder))]
+
+
+def _avc_level(height: int) -> Tuple[str, str]:
+    """H.264 High profile level and its RFC 6381 codec string for a rendition height"""
+    if height <= 480:
+        return '3.0', 'avc1.64001e'
+    if height <= 720:
+        return '3.1', 'avc1.64001f'
+    return '4.0', 'avc1.640028'
+
+
+def _encode_rendition(path: str, out_dir: Path, height: int, kbps: int, has_audio: bool):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    level, _ = _avc_level(height)
+    args = [
+        FFMPEG_BIN, '-v', 'error', '-y', '-i', path, '-map', '0:v:0',
+        '-vf', f"scale=-2:{height}", '-c:v', 'libx264', '-preset', 'veryfast',
+        '-profile:v', 'high', '-level', level,
+        '-b:v', f"{kbps}k", '-maxrate', f"{int(kbps * 1.07)}k", '-bufsize', f"{int(kbps * 1.5)}k",
+        # Fixed keyframe cadence so every rendition cuts segments at the same timestamps
+        '-force_key_frames', f"expr:gte(t,n_forced*{HLS_KEYFRAME_SECONDS})", '-sc_threshold', '0'
+    ]
+    if has_audio:
+        args += ['-map', '0:a:0', '-c:a', 'aac', '-b:a', f"{HLS_AUDIO_KBPS}k", '-ac', '2']
+    args += [
+        '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4', '-hls_flags', 'independent_segments',
+        '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', str(out_dir / 'seg_%05d.m4s'),
+        str(out_dir / 'index.m3u8')
+    ]
+    _run(args)
+
+
+def package_hls(video_path: str, out_dir: str, width: Optional[int] = None, height: Optional[int] = None,
+                has_audio: bool = True) -> Dict[str, Any]:
+    """Encode an fMP4 HLS ladder plus master playlist; written aside and swapped in whole"""
+    final = Path(out_dir)
+    staging = final.with_name(f".{final.name}.tmp")
+    if staging.exists():
+        shutil.rmtree(staging)
+
+    renditions = []
+    try:
+        for rung_height, kbps in hls_ladder(height):
+            name = f"{rung_height}p"
+            _encode_rendition(video_path, staging / name, rung_height, kbps, has_audio)
+            rung_width = round(width * rung_height / height / 2) * 2 if width and height else None
+            bandwidth = (kbps + (HLS_AUDIO_KBPS if has_audio else 0)) * 1000
+            codecs = _avc_level(rung_height)[1] + (',mp4a.40.2' if has_audio else '')
+            renditions.append({
+                'name': name,
+                'height': rung_height,
+                'width': rung_width,
+                'bandwidth': bandwidth,
+                'codecs': codecs
+            })
+
+        lines = ['#EXTM3U', '#EXT-X-VERSION:7', '#EXT-X-INDEPENDENT-SEGMENTS']
+        for r in renditions:
+            resolution = f",RESOLUTION={r['width']}x{r['height']}" if r['width'] else ''
+            lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={r['bandwidth']}{resolution},CODECS=\"{r['codecs']}\"")
+            lines.append(f"{r['name']}/index.m3u8")
+        (staging / 'master.m3u8').write_text('\n'.join(lines) + '\n')
+
+        if final.exists():
+            shutil.rmtree(final)
+        os.replace(staging, final)
+    finally:
+        if staging.exists():
+            shutil.rmtree(staging)
+    return {'master': 'master.m3u8', 'renditions': renditions}
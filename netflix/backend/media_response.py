@@ -0,0 +1,288 @@
+import mmap
+import os
+import stat
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Bytes per body message when the server can't do zero-copy sends
+CHUNK_SIZE = 1024 * 1024
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def _map_file(path) -> mmap.mmap:
+    """Read-only mapping of the whole file; the mapping stays valid after the file is closed"""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def make_etag(st: os.stat_result) -> str:
+    """Strong validator derived from inode, size and mtime"""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a bytes Range header into sorted, merged (start, end-exclusive) pairs.
+
+    Returns None when the header is malformed (the range must then be ignored)
+    and an empty list when no range is satisfiable.
+    """
+    units, _, spec = value.partition("=")
+    if units.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, sep, end_str = part.partition("-")
+        if not sep:
+            return None
+        start_str, end_str = start_str.strip(), end_str.strip()
+        try:
+            if not start_str:
+                # Suffix range: last N bytes
+                length = int(end_str)
+                if length <= 0:
+                    continue
+                start, end = max(0, size - length), size
+            else:
+                start = int(start_str)
+                last = int(end_str) if end_str else size - 1
+                if start < 0 or (end_str and last < start):
+                    return None
+                end = min(last + 1, size)
+        except ValueError:
+            return None
+        if start < size and start < end:
+            ranges.append((start, end))
+
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RangeFileResponse(Response):
+    """File response with Range/If-Range, validators and zero-copy or mmap-backed delivery"""
+
+    def __init__(
+        self,
+        path: "os.PathLike[str] | str",
+        media_type: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        stat_result: Optional[os.stat_result] = None,
+    ) -> None:
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type or "application/octet-stream"
+        self.background = None
+        self.stat_result = stat_result
+        self.init_headers(headers)
+
+    def _not_modified(self, request_headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _if_range_matches(self, value: str, etag: str, last_modified: str) -> bool:
+        value = value.strip()
+        if value.startswith('"'):
+            return value == etag  # strong comparison only
+        return value == last_modified
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        st = self.stat_result
+        if st is None:
+            st = await anyio.to_thread.run_sync(os.stat, self.path)
+        if not stat.S_ISREG(st.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+
+        request_headers = Headers(scope=scope)
+        send_body = scope.get("method", "GET") != "HEAD"
+        size = st.st_size
+        etag = make_etag(st)
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+
+        self.headers.setdefault("etag", etag)
+        self.headers.setdefault("last-modified", last_modified)
+        self.headers["accept-ranges"] = "bytes"
+
+        if self._not_modified(request_headers, etag, st.st_mtime):
+            del self.headers["content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if range_header:
+            if_range = request_headers.get("if-range")
+            if if_range is None or self._if_range_matches(if_range, etag, last_modified):
+                ranges = parse_range_header(range_header, size)
+
+        if ranges is not None and not ranges:
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            await send({"type": "http.response.start", "status": 416, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if not ranges:
+            await self._send_single(scope, send, 200, 0, size, send_body)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            await self._send_single(scope, send, 206, start, end, send_body)
+        else:
+            await self._send_multipart(send, ranges, size, send_body)
+
+    async def _send_single(self, scope: Scope, send: Send, status: int, start: int, end: int, send_body: bool):
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        if not send_body or end == start:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            # Let the server hand the descriptor to sendfile(2)
+            fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+            try:
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": fd,
+                    "offset": start,
+                    "count": end - start,
+                    "more_body": False,
+                })
+            finally:
+                await anyio.to_thread.run_sync(os.close, fd)
+            return
+
+        # Without the extension, mmap-backed chunks; opening and mapping can block on disk too
+        mm = await anyio.to_thread.run_sync(_map_file, self.path)
+        try:
+            await self._send_mmap(send, mm, start, end, more_after=False)
+        finally:
+            mm.close()
+
+    async def _send_multipart(self, send: Send, ranges: List[Tuple[int, int]], size: int, send_body: bool):
+        boundary = uuid.uuid4().hex
+        part_type = self.media_type
+        heads = [
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {part_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        length = sum(len(h) for h in heads) + sum(end - start for start, end in ranges) + len(tail)
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if not send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        mm = await anyio.to_thread.run_sync(_map_file, self.path)
+        try:
+            for head, (start, end) in zip(heads, ranges):
+                await send({"type": "http.response.body", "body": head, "more_body": True})
+                await self._send_mmap(send, mm, start, end, more_after=True)
+        finally:
+            mm.close()
+        await send({"type": "http.response.body", "body": tail, "more_body": False})
+
+    async def _send_mmap(self, send: Send, mm: mmap.mmap, start: int, end: int, more_after: bool):
+        # Slicing may fault pages in from disk, so do it off the event loop
+        offset = start
+        while offset < end:
+            chunk_end = min(offset + CHUNK_SIZE, end)
+            chunk = await anyio.to_thread.run_sync(mm.__getitem__, slice(offset, chunk_end))
+            offset = chunk_end
+            await send({
+                "type": "http.response.body",
+                "body": chunk,
+                "more_body": more_after or offset < end,
+            })
+
+
+class RangeObjectResponse(RangeFileResponse):
+    """RangeFileResponse for objects in remote storage: one ranged GET streamed through per request.
+
+    Multi-range requests are answered with the whole object (ignoring Range is always allowed).
+    """
+
+    def __init__(self, storage, key: str, info, media_type: Optional[str] = None,
+                 headers: Optional[Mapping[str, str]] = None) -> None:
+        super().__init__(key, media_type=media_type, headers=headers)
+        self.storage = storage
+        self.key = key
+        self.info = info
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        send_body = scope.get("method", "GET") != "HEAD"
+        size = self.info.size
+        etag = f'"{self.info.etag}"'
+        mtime = self.info.last_modified.timestamp()
+        last_modified = formatdate(mtime, usegmt=True)
+
+        self.headers.setdefault("etag", etag)
+        self.headers.setdefault("last-modified", last_modified)
+        self.headers["accept-ranges"] = "bytes"
+
+        if self._not_modified(request_headers, etag, mtime):
+            del self.headers["content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if range_header:
+            if_range = request_headers.get("if-range")
+            if if_range is None or self._if_range_matches(if_range, etag, last_modified):
+                ranges = parse_range_header(range_header, size)
+
+        if ranges is not None and not ranges:
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            await send({"type": "http.response.start", "status": 416, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        status, start, end = 200, 0, size
+        if ranges and len(ranges) == 1:
+            status, (start, end) = 206, ranges[0]
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        if not send_body or end == start:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async for chunk in self.storage.iter_range(self.key, start, end):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 class CustomVideo(BaseModel):
@@ -13,6 +13,8 @@ class CustomVideo(BaseModel):
     rating: str = 'TV-14'
     match: int = 90
     duration: Optional[str] = None
+    media_info: Optional[Dict[str, Any]] = None
+    faststart: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class CustomVideoCreate(BaseModel):
@@ -0,0 +1,21 @@
+from typing import List, Optional, TypedDict
+
+
+class MovieCard(TypedDict):
+    """A mapped TMDB title as the frontend consumes it; a plain dict at runtime, so it serializes as-is"""
+    id: int
+    title: str
+    description: str
+    backdrop: Optional[str]
+    poster: Optional[str]
+    rating: str
+    year: int
+    match: int
+    media_type: str
+
+
+class MovieDetails(MovieCard, total=False):
+    duration: str
+    seasons: int
+    genres: List[str]
+    trailer: Optional[str]
@@ -0,0 +1,60 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Header carrying the caller's own timeout, in seconds
+REQUEST_TIMEOUT_HEADER = os.environ.get('REQUEST_TIMEOUT_HEADER', 'x-request-timeout').lower()
+# Budget for requests that don't send the header; unset means no deadline
+REQUEST_DEFAULT_TIMEOUT = os.environ.get('REQUEST_DEFAULT_TIMEOUT')
+# Time kept back for building and sending our own response
+REQUEST_DEADLINE_MARGIN = float(os.environ.get('REQUEST_DEADLINE_MARGIN', '0.05'))
+
+_deadline: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, or None when it has no deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _parse_timeout(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        timeout = float(value)
+    except ValueError:
+        return None
+    return timeout if timeout > 0 else None
+
+
+class DeadlineMiddleware:
+    """Turn the caller's timeout header into a monotonic deadline visible to upstream calls"""
+
+    def __init__(self, app):
+        self.app = app
+        self.default_timeout = _parse_timeout(REQUEST_DEFAULT_TIMEOUT)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self.default_timeout
+        for name, value in scope.get('headers', []):
+            if name.decode('latin-1') == REQUEST_TIMEOUT_HEADER:
+                timeout = _parse_timeout(value.decode('latin-1')) or timeout
+                break
+
+        if timeout is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = _deadline.set(time.monotonic() + max(0.0, timeout - REQUEST_DEADLINE_MARGIN))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
@@ -0,0 +1,199 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anyio
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per chunk when copying spooled uploads or re-hashing partial files
+CHUNK_SIZE = 1024 * 1024
+# Uploads with no progress for this long are expired and their partial files removed
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', str(24 * 3600)))
+UPLOAD_SWEEP_INTERVAL = float(os.environ.get('UPLOAD_SWEEP_INTERVAL', '3600'))
+
+
+class UploadTooLarge(Exception):
+    """Raised when a PATCH would write past the declared upload length"""
+
+
+class UploadBusy(Exception):
+    """Raised when another worker process is already writing the same partial upload"""
+
+
+class UploadState:
+    """In-process hashing state for one resumable upload"""
+
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.offset = 0
+        self.lock = asyncio.Lock()
+
+
+# upload_id -> state; rebuilt from the partial file when missing (e.g. after a restart).
+# Only created for sessions known to be uploading, and dropped on completion or expiry.
+_states: Dict[str, UploadState] = {}
+
+
+def get_state(upload_id: str) -> UploadState:
+    state = _states.get(upload_id)
+    if state is None:
+        state = _states[upload_id] = UploadState()
+    return state
+
+
+def drop_state(upload_id: str):
+    _states.pop(upload_id, None)
+
+
+def _hash_prefix(path: Path, length: int):
+    hasher = hashlib.sha256()
+    remaining = length
+    with open(path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+
+async def sync_state(state: UploadState, path: Path, offset: int):
+    """Make the in-memory hasher reflect exactly the first `offset` bytes of the partial file"""
+    if state.offset != offset:
+        state.hasher = await anyio.to_thread.run_sync(_hash_prefix, path, offset)
+        state.offset = offset
+
+
+@asynccontextmanager
+async def exclusive_partial(path: Path):
+    """Advisory lock on a partial upload file; keeps PATCHes in different worker processes from interleaving"""
+    fd = await anyio.to_thread.run_sync(os.open, path, os.O_RDWR)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy("Another request is writing to this upload")
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        await anyio.to_thread.run_sync(os.close, fd)
+
+
+async def truncate_file(path: Path, length: int):
+    """Cut a partial file back to length; a file that is already gone is left alone"""
+    try:
+        await anyio.to_thread.run_sync(os.truncate, path, length)
+    except FileNotFoundError:
+        pass
+
+
+async def append_chunks(
+    path: Path,
+    state: UploadState,
+    chunks: AsyncIterator[bytes],
+    max_size: int
+) -> int:
+    """Write request chunks at state.offset without blocking the loop; returns the new offset.
+
+    Bytes beyond a previous, unacknowledged write are truncated so the file always
+    ends at the persisted offset. state.offset is advanced even if the client disconnects
+    mid-stream, so the caller can persist whatever was received.
+    """
+    f = await anyio.to_thread.run_sync(open, path, "r+b")
+    try:
+        await anyio.to_thread.run_sync(f.seek, state.offset)
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if state.offset + len(chunk) > max_size:
+                    raise UploadTooLarge(f"Upload exceeds declared length of {max_size} bytes")
+                await anyio.to_thread.run_sync(f.write, chunk)
+                state.hasher.update(chunk)
+                state.offset += len(chunk)
+        finally:
+            await anyio.to_thread.run_sync(f.truncate, state.offset)
+    finally:
+        await anyio.to_thread.run_sync(f.close)
+    return state.offset
+
+
+async def save_upload_file(upload: UploadFile, dest: Path) -> Tuple[int, str]:
+    """Copy an UploadFile to dest in chunks off the event loop; returns (size, sha256)"""
+    hasher = hashlib.sha256()
+    size = 0
+    f = await anyio.to_thread.run_sync(open, dest, "wb")
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            await anyio.to_thread.run_sync(f.write, chunk)
+            hasher.update(chunk)
+            size += len(chunk)
+    finally:
+        await anyio.to_thread.run_sync(f.close)
+    return size, hasher.hexdigest()
+
+
+async def remove_file(path: Optional[Path]):
+    if path is not None and path.exists():
+        await anyio.to_thread.run_sync(os.remove, path)
+
+
+def _stale_files(directory: Path, pattern: str, cutoff: float) -> List[Path]:
+    stale = []
+    for path in directory.glob(pattern):
+        try:
+            if path.stat().st_mtime < cutoff:
+                stale.append(path)
+        except FileNotFoundError:
+            pass
+    return stale
+
+
+async def stale_files(directory: Path, pattern: str, max_age: float) -> List[Path]:
+    """Files matching pattern that have not been written for max_age seconds"""
+    return await anyio.to_thread.run_sync(_stale_files, directory, pattern, time.time() - max_age)
+
+
+class UploadSweeper:
+    """Runs the abandoned-upload sweep every UPLOAD_SWEEP_INTERVAL"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'runs': 0, 'expired': 0}
+
+    async def _run(self, sweep: Callable[[], Awaitable[int]]):
+        while True:
+            try:
+                self.stats['expired'] += await sweep()
+                self.stats['runs'] += 1
+            except Exception as e:
+                logger.warning(f"Upload sweep failed: {e}")
+            await asyncio.sleep(UPLOAD_SWEEP_INTERVAL)
+
+    def start(self, sweep: Callable[[], Awaitable[int]]):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(sweep))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+upload_sweeper = UploadSweeper()
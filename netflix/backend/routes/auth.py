@@ -1,14 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
 import os
+import time
+import uuid
 from datetime import datetime, timedelta
 import jwt
 from typing import Optional
+import sys
+sys.path.append('/app/backend')
+from auth_tokens import claims_cache, token_digest, token_revocations
+from database import get_db
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-# Secret key for JWT - in production, use env variable
-SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-this')
+# Secret key for JWT; no default, since a well-known key lets anyone sign their own admin token
+SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')  # Default password
 ALGORITHM = "HS256"
 
@@ -20,17 +27,68 @@ class LoginResponse(BaseModel):
     token: str
     message: str
 
+class RevokeRequest(BaseModel):
+    token: Optional[str] = None
+
+# auto_error=False so a missing header gets our 401 (with WWW-Authenticate) rather than a 403
+bearer_scheme = HTTPBearer(auto_error=False)
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+def _signing_key() -> str:
+    """The JWT secret; tokens are neither issued nor accepted without one"""
+    if not SECRET_KEY:
+        raise HTTPException(status_code=503, detail="Authentication is not configured")
+    return SECRET_KEY
+
+async def verify_claims(token: str, db) -> dict:
+    """Decoded claims for a token, from the claims cache when possible; raises 401 if unusable"""
+    key = _signing_key()
+    digest = token_digest(token)
+    await token_revocations.sync(db)
+    if token_revocations.is_revoked(digest):
+        raise _unauthorized("Token revoked")
+    
+    claims = claims_cache.get(digest)
+    if claims is not None:
+        return claims
+    
+    try:
+        claims = jwt.decode(token, key, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized("Token expired")
+    except jwt.InvalidTokenError:
+        raise _unauthorized("Invalid token")
+    claims_cache.put(digest, claims)
+    return claims
+
+async def require_admin(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db=Depends(get_db)
+) -> dict:
+    """Dependency for admin-only routes: a valid, unrevoked bearer token with the admin role"""
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    claims = await verify_claims(credentials.credentials, db)
+    if claims.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return claims
+
 @router.post("/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
     """Admin login endpoint"""
+    key = _signing_key()
     if request.password == ADMIN_PASSWORD:
         # Create JWT token
         expires = datetime.utcnow() + timedelta(hours=24)
         token_data = {
             "exp": expires,
-            "role": "admin"
+            "role": "admin",
+            # Unique per login, so revoking one token never revokes another minted the same second
+            "jti": uuid.uuid4().hex
         }
-        token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
+        token = jwt.encode(token_data, key, algorithm=ALGORITHM)
         
         return LoginResponse(
             success=True,
@@ -41,12 +99,26 @@ async def login(request: LoginRequest):
         raise HTTPException(status_code=401, detail="Invalid password")
 
 @router.post("/verify")
-async def verify_token(token: str):
+async def verify_token(token: str, db=Depends(get_db)):
     """Verify JWT token"""
+    await verify_claims(token, db)
+    return {"success": True, "valid": True}
+
+@router.post("/revoke", dependencies=[Depends(require_admin)])
+async def revoke_token(
+    request: RevokeRequest,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db=Depends(get_db)
+):
+    """Revoke a token (the caller's own when none is given); takes effect immediately"""
+    token = request.token or credentials.credentials
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return {"success": True, "valid": True}
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
+        # Signature must still check out; an expired token needs no revocation
+        payload = jwt.decode(token, _signing_key(), algorithms=[ALGORITHM], options={"verify_exp": False})
     except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        raise HTTPException(status_code=400, detail="Invalid token")
+    
+    expires_at = float(payload.get("exp", time.time() + 24 * 3600))
+    if expires_at > time.time():
+        await token_revocations.revoke(db, token_digest(token), expires_at)
+    return {"success": True, "message": "Token revoked"}
@@ -1,29 +1,268 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.requests import ClientDisconnect
+import anyio
+import base64
+import json
 import os
-import uuid
+import re
 import shutil
+import uuid
+import mimetypes
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Optional
-from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import List, Optional, Tuple
+import sys
+sys.path.append('/app/backend')
+from media_response import RangeFileResponse, RangeObjectResponse
+from blob_store import blob_store
+from storage import STORAGE_REDIRECT, storage
+from db_indexes import query_profiler
+from database import get_db
+from routes.auth import require_admin
+from title_index import title_index
+from image_variants import (
+    BACKDROP_WIDTH,
+    POSTER_WIDTH,
+    delete_variants,
+    is_variant_name,
+    pick_variant,
+    schedule_variants,
+    variant_files,
+    variant_key
+)
+from media_jobs import media_jobs
+from media_processing import package_hls, process_upload
+from resumable_upload import (
+    UPLOAD_SESSION_TTL,
+    UploadBusy,
+    UploadTooLarge,
+    append_chunks,
+    drop_state as drop_upload_state,
+    exclusive_partial,
+    get_state as get_upload_state,
+    remove_file,
+    save_upload_file,
+    stale_files,
+    sync_state as sync_upload_state,
+    truncate_file
+)
 
-# Load environment variables
-load_dotenv()
+router = APIRouter(prefix="/custom-videos", tags=["custom-videos"])
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', '')
-db_name = os.environ.get('DB_NAME', 'netflix_clone')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# In-progress and not-yet-hashed uploads plus encoder output, local to this node;
+# finished files are published through the storage backend (local disk or S3)
+PARTIAL_DIR = storage.scratch_dir
+PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+# Packaged HLS renditions: hls/{video_id}/{version}/...
+HLS_PREFIX = "hls"
+# Encode an fMP4 HLS ladder after probing each upload (CPU heavy, so opt-in)
+HLS_PACKAGING = os.environ.get('HLS_PACKAGING', 'false').lower() in ('1', 'true', 'yes')
+HLS_PATH_RE = re.compile(r'^[0-9a-f]{12}/(master\.m3u8|\d+p/(index\.m3u8|init\.mp4|seg_\d{5}\.m4s))$')
+HLS_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4"
+}
 
-router = APIRouter(prefix="/custom-videos", tags=["custom-videos"])
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+def _partial_path(upload_id: str) -> Path:
+    return PARTIAL_DIR / f"{upload_id}.part"
+
+def _stored_key(name: str) -> str:
+    """Storage key of a video/thumbnail name: a sharded blob, or a legacy flat upload"""
+    return blob_store.resolve(name) or name
+
+async def _serve_stored(
+    key: str,
+    media_type: Optional[str],
+    headers: Optional[dict] = None,
+    not_found: str = "File not found",
+    redirect: bool = True
+):
+    """Range-capable response for a stored object: from local disk, a presigned redirect, or proxied ranged GETs"""
+    local = storage.local_path(key)
+    if local is not None:
+        if not local.is_file():
+            raise HTTPException(status_code=404, detail=not_found)
+        return RangeFileResponse(local, media_type=media_type, headers=headers)
+    
+    if redirect and STORAGE_REDIRECT:
+        # The client fetches the bytes from object storage directly; the URL expires, so don't cache it
+        url = await storage.presigned_url(key, media_type)
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+    
+    info = await storage.stat(key)
+    if info is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return RangeObjectResponse(storage, key, info, media_type=media_type, headers=headers)
+
+async def _store_upload(db, upload: UploadFile) -> Tuple[str, int, str]:
+    """Hash an UploadFile into a temp file and ingest it as a blob; returns (name, size, sha256)"""
+    ext = os.path.splitext(upload.filename)[1]
+    tmp = PARTIAL_DIR / f"{uuid.uuid4()}{ext}"
+    try:
+        size, checksum = await save_upload_file(upload, tmp)
+        await blob_store.ingest(db, tmp, checksum, size, upload.content_type)
+    finally:
+        # Already moved or discarded by a successful ingest
+        await remove_file(tmp)
+    return f"{checksum}{ext}", size, checksum
+
+async def _release_stored(db, name: Optional[str]):
+    """Drop a document's reference to a stored file; legacy flat uploads are removed outright"""
+    digest = blob_store.digest_of(name)
+    if digest:
+        await blob_store.release(db, digest)
+    elif name:
+        await storage.delete(name)
 
-# Upload directory
-UPLOAD_DIR = Path("/app/backend/uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+def _build_video_doc(
+    video_id: str,
+    title: str,
+    description: str,
+    category: str,
+    year: int,
+    rating: str,
+    match: int,
+    video_filename: str,
+    thumbnail_filename: Optional[str],
+    size: int,
+    checksum: str
+) -> dict:
+    return {
+        "id": video_id,
+        "title": title,
+        "description": description,
+        "video_path": str(video_filename),
+        "thumbnail_path": str(thumbnail_filename) if thumbnail_filename else None,
+        "category": category,
+        "year": year,
+        "rating": rating,
+        "match": match,
+        "media_type": "custom",
+        "size": size,
+        "checksum": checksum,
+        "created_at": datetime.now(timezone.utc)
+    }
 
-@router.post("/upload")
+async def _commit_video(db, video_doc: dict) -> str:
+    """Insert a video whose files are stored, index it and queue its processing"""
+    await db.custom_videos.insert_one(video_doc)
+    title_index.add(_format_video(video_doc))
+    if video_doc["thumbnail_path"]:
+        schedule_variants(db, video_doc["id"], _stored_key(video_doc["thumbnail_path"]))
+    return await _enqueue_processing(db, video_doc["id"], video_doc["video_path"], bool(video_doc["thumbnail_path"]))
+
+async def _enqueue_processing(db, video_id: str, video_filename: str, has_thumbnail: bool) -> str:
+    """Queue probing/faststart, plus a poster frame when no thumbnail was uploaded"""
+    # Blobs are immutable, so a faststart rewrite goes to a new file that becomes a new blob
+    is_blob = blob_store.digest_of(video_filename) is not None
+    return await media_jobs.enqueue(db, "process_upload", video_id, {
+        "video_path": _stored_key(video_filename),
+        "poster_path": None if has_thumbnail else str(PARTIAL_DIR / f"{video_id}_poster.jpg"),
+        "remux_path": str(PARTIAL_DIR / f"{video_id}.faststart.mp4") if is_blob else None
+    })
+
+def _format_duration(seconds: Optional[float]) -> Optional[str]:
+    if not seconds:
+        return None
+    total = int(round(seconds))
+    hours, minutes = total // 3600, total % 3600 // 60
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {total % 60}s" if minutes else f"{total}s"
+
+async def _apply_processing(db, job: dict, result: dict):
+    """Store probe results on the video, swap in the faststart blob and adopt the extracted poster frame"""
+    video_id = job["video_id"]
+    poster = Path(result["poster"]) if result.get("poster") else None
+    remuxed = Path(result["remuxed"]) if result.get("remuxed") else None
+    video = await db.custom_videos.find_one({"id": video_id}, VIDEO_PROJECTION)
+    if not video:
+        # Deleted while processing
+        await remove_file(poster)
+        await remove_file(remuxed)
+        return
+    
+    update = {
+        "media_info": result["media_info"],
+        "duration": _format_duration(result["media_info"].get("duration")),
+        "faststart": result["faststart"]
+    }
+    if "size" in result:
+        update["size"] = result["size"]
+        update["checksum"] = result["checksum"]
+    if remuxed:
+        await blob_store.ingest(db, remuxed, result["checksum"], result["size"], "video/mp4")
+        update["video_path"] = f"{result['checksum']}{Path(video['video_path']).suffix}"
+    if poster and not video.get("thumbnail_path"):
+        await blob_store.ingest(db, poster, result["poster_checksum"], result["poster_size"], "image/jpeg")
+        update["thumbnail_path"] = f"{result['poster_checksum']}.jpg"
+    else:
+        await remove_file(poster)
+    
+    # Only if the stored files did not change underneath us (e.g. a concurrent delete)
+    updated = await db.custom_videos.update_one(
+        {"id": video_id, "video_path": video["video_path"], "thumbnail_path": video.get("thumbnail_path")},
+        {"$set": update}
+    )
+    if not updated.matched_count:
+        await _release_stored(db, update.get("video_path"))
+        await _release_stored(db, update.get("thumbnail_path"))
+        return
+    if "video_path" in update:
+        await _release_stored(db, video["video_path"])
+    
+    video.update(update)
+    title_index.add(_format_video(video))
+    if "thumbnail_path" in update:
+        schedule_variants(db, video_id, _stored_key(update["thumbnail_path"]))
+    if HLS_PACKAGING and result["media_info"].get("video"):
+        await _enqueue_packaging(db, video_id, video["video_path"], result["media_info"])
+
+async def _enqueue_packaging(db, video_id: str, video_filename: str, media_info: dict) -> str:
+    # A fresh version directory per packaging run keeps every published URL immutable
+    version = uuid.uuid4().hex[:12]
+    video_stream = media_info.get("video") or {}
+    return await media_jobs.enqueue(db, "package_hls", video_id, {
+        "video_path": _stored_key(video_filename),
+        "out_dir": str(PARTIAL_DIR / HLS_PREFIX / video_id / version),
+        "width": video_stream.get("width"),
+        "height": video_stream.get("height"),
+        "has_audio": bool(media_info.get("audio"))
+    })
+
+def _remove_tree(path: Path):
+    shutil.rmtree(path, ignore_errors=True)
+
+async def _apply_packaging(db, job: dict, result: dict):
+    """Publish a packaged HLS version and drop the one it replaces"""
+    video_id = job["video_id"]
+    out_dir = Path(job["payload"]["out_dir"])
+    version = out_dir.name
+    video = await db.custom_videos.find_one({"id": video_id}, {"_id": 0, "id": 1, "hls.version": 1})
+    if not video:
+        await anyio.to_thread.run_sync(_remove_tree, out_dir)
+        await storage.delete_prefix(f"{HLS_PREFIX}/{video_id}")
+        return
+    
+    await storage.put_tree(f"{HLS_PREFIX}/{video_id}/{version}", out_dir, HLS_MEDIA_TYPES)
+    hls = {**result, "version": version, "packaged_at": datetime.now(timezone.utc)}
+    await db.custom_videos.update_one({"id": video_id}, {"$set": {"hls": hls}})
+    previous = (video.get("hls") or {}).get("version")
+    if previous and previous != version:
+        await storage.delete_prefix(f"{HLS_PREFIX}/{video_id}/{previous}")
+
+media_jobs.register(
+    "process_upload", process_upload, _apply_processing,
+    inputs=("video_path",), outputs=("poster_path", "remux_path")
+)
+media_jobs.register("package_hls", package_hls, _apply_packaging, inputs=("video_path",))
+
+@router.post("/upload", dependencies=[Depends(require_admin)])
 async def upload_video(
     title: str = Form(...),
     description: str = Form(...),
@@ -32,152 +271,525 @@ async def upload_video(
     rating: str = Form("TV-14"),
     match: int = Form(90),
     video: UploadFile = File(...),
-    thumbnail: Optional[UploadFile] = File(None)
+    thumbnail: Optional[UploadFile] = File(None),
+    db=Depends(get_db)
 ):
-    """Upload custom video with metadata"""
+    """Upload custom video with metadata in a single request"""
+    video_id = str(uuid.uuid4())
+    video_filename = None
+    thumbnail_filename = None
+    
     try:
-        video_id = str(uuid.uuid4())
-        
-        # Save video file
-        video_ext = os.path.splitext(video.filename)[1]
-        video_filename = f"{video_id}{video_ext}"
-        video_path = UPLOAD_DIR / video_filename
+        # Copy in chunks off the event loop, hashing as we go; identical bytes are stored once
+        video_filename, size, checksum = await _store_upload(db, video)
+        if thumbnail:
+            thumbnail_filename, _, _ = await _store_upload(db, thumbnail)
         
-        with open(video_path, "wb") as buffer:
-            shutil.copyfileobj(video.file, buffer)
+        # Metadata is only committed once the files are complete
+        video_doc = _build_video_doc(
+            video_id, title, description, category, year, rating, match,
+            video_filename, thumbnail_filename, size, checksum
+        )
+        job_id = await _commit_video(db, video_doc)
         
-        # Save thumbnail if provided
-        thumbnail_filename = None
+        return {
+            "success": True,
+            "message": "Video uploaded successfully",
+            "video_id": video_id,
+            "job_id": job_id
+        }
+    except Exception as e:
+        await _release_stored(db, video_filename)
+        await _release_stored(db, thumbnail_filename)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/uploads", status_code=201, dependencies=[Depends(require_admin)])
+async def create_upload(
+    response: Response,
+    title: str = Form(...),
+    description: str = Form(...),
+    filename: str = Form(...),
+    size: int = Form(..., gt=0),
+    category: str = Form("My Videos"),
+    year: int = Form(2024),
+    rating: str = Form("TV-14"),
+    match: int = Form(90),
+    checksum: Optional[str] = Form(None),
+    thumbnail: Optional[UploadFile] = File(None),
+    db=Depends(get_db)
+):
+    """Start a resumable upload; send the video bytes with PATCH /uploads/{upload_id}.
+
+    When the checksum names content that is already stored, the upload completes
+    immediately and no bytes need to be sent.
+    """
+    upload_id = str(uuid.uuid4())
+    video_filename = None
+    thumbnail_filename = None
+    
+    try:
         if thumbnail:
-            thumb_ext = os.path.splitext(thumbnail.filename)[1]
-            thumbnail_filename = f"{video_id}_thumb{thumb_ext}"
-            thumb_path = UPLOAD_DIR / thumbnail_filename
-            
-            with open(thumb_path, "wb") as buffer:
-                shutil.copyfileobj(thumbnail.file, buffer)
-        
-        # Save metadata to MongoDB
-        video_doc = {
-            "id": video_id,
+            thumbnail_filename, _, _ = await _store_upload(db, thumbnail)
+        metadata = {
             "title": title,
             "description": description,
-            "video_path": str(video_filename),
-            "thumbnail_path": str(thumbnail_filename) if thumbnail_filename else None,
             "category": category,
             "year": year,
             "rating": rating,
-            "match": match,
-            "media_type": "custom"
+            "match": match
         }
+        video_ext = os.path.splitext(filename)[1]
+        expected = checksum.lower() if checksum else None
         
-        await db.custom_videos.insert_one(video_doc)
+        if expected and await blob_store.add_ref(db, expected):
+            video_filename = f"{expected}{video_ext}"
+            # The stored record is authoritative; the declared size was never checked against any bytes
+            blob = await db.blobs.find_one({"_id": expected}, {"size": 1})
+            size = blob["size"]
+            video_doc = _build_video_doc(
+                upload_id, **metadata,
+                video_filename=video_filename,
+                thumbnail_filename=thumbnail_filename,
+                size=size,
+                checksum=expected
+            )
+            job_id = await _commit_video(db, video_doc)
+            await db.upload_sessions.insert_one({
+                "id": upload_id,
+                "size": size,
+                "offset": size,
+                "status": "complete",
+                "video_id": upload_id,
+                "checksum": expected,
+                "deduplicated": True,
+                "created_at": datetime.now(timezone.utc)
+            })
+            response.headers["Upload-Offset"] = str(size)
+            return {
+                "success": True,
+                "upload_id": upload_id,
+                "offset": size,
+                "size": size,
+                "complete": True,
+                "deduplicated": True,
+                "video_id": upload_id,
+                "job_id": job_id
+            }
         
-        return {
-            "success": True,
-            "message": "Video uploaded successfully",
-            "video_id": video_id
+        await anyio.to_thread.run_sync(_partial_path(upload_id).touch)
+        session = {
+            "id": upload_id,
+            "metadata": metadata,
+            "video_ext": video_ext,
+            "thumbnail_path": thumbnail_filename,
+            "size": size,
+            "offset": 0,
+            "expected_checksum": expected,
+            "status": "uploading",
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
         }
+        await db.upload_sessions.insert_one(session)
+        
+        response.headers["Location"] = f"/api/custom-videos/uploads/{upload_id}"
+        response.headers["Upload-Offset"] = "0"
+        return {"success": True, "upload_id": upload_id, "offset": 0, "size": size}
     except Exception as e:
+        await _release_stored(db, video_filename)
+        await _release_stored(db, thumbnail_filename)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.head("/uploads/{upload_id}", dependencies=[Depends(require_admin)])
+async def get_upload_offset(upload_id: str, db=Depends(get_db)):
+    """Report how many bytes of a resumable upload have been received"""
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    return Response(status_code=200, headers={
+        "Upload-Offset": str(session["offset"]),
+        "Upload-Length": str(session["size"]),
+        "Cache-Control": "no-store"
+    })
+
+@router.patch("/uploads/{upload_id}", dependencies=[Depends(require_admin)])
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    db=Depends(get_db)
+):
+    """Append the request body to a resumable upload at Upload-Offset"""
+    # Look the session up before creating in-memory state, so unknown ids cost nothing
+    session = await _uploading_session(db, upload_id)
+    state = get_upload_state(upload_id)
+    partial = _partial_path(upload_id)
+    async with state.lock, AsyncExitStack() as stack:
+        # The asyncio lock serializes PATCHes in this process; the file lock, other worker processes
+        try:
+            await stack.enter_async_context(exclusive_partial(partial))
+        except UploadBusy as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        # Re-read under the locks: a concurrent PATCH may have moved it on
+        session = await _uploading_session(db, upload_id)
+        if upload_offset != session["offset"]:
+            raise HTTPException(
+                status_code=409,
+                detail="Upload-Offset does not match the received length",
+                headers={"Upload-Offset": str(session["offset"])}
+            )
+        
+        await sync_upload_state(state, partial, session["offset"])
+        error = None
+        try:
+            await append_chunks(partial, state, request.stream(), session["size"])
+        except UploadTooLarge as e:
+            error = HTTPException(status_code=413, detail=str(e))
+        except ClientDisconnect:
+            pass
+        
+        # Persist progress even on error/disconnect so the client can resume from here.
+        # Conditional on the offset this PATCH started from, so progress is never counted twice
+        result = await db.upload_sessions.update_one(
+            {"id": upload_id, "status": "uploading", "offset": session["offset"]},
+            {"$set": {"offset": state.offset, "updated_at": datetime.now(timezone.utc)}}
+        )
+        if not result.matched_count:
+            # The session moved on (e.g. it expired) while this chunk was written: none of it counts
+            await truncate_file(partial, session["offset"])
+            drop_upload_state(upload_id)
+            current = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0, "offset": 1})
+            raise HTTPException(
+                status_code=409,
+                detail="Upload changed while this chunk was being written",
+                headers={"Upload-Offset": str((current or session)["offset"])}
+            )
+        if error:
+            raise error
+        
+        headers = {"Upload-Offset": str(state.offset)}
+        if state.offset < session["size"]:
+            return JSONResponse(
+                {"success": True, "upload_id": upload_id, "offset": state.offset, "complete": False},
+                headers=headers
+            )
+        
+        video_id, job_id = await _complete_upload(db, session, state, partial)
+        return JSONResponse(
+            {
+                "success": True,
+                "upload_id": upload_id,
+                "offset": state.offset,
+                "complete": True,
+                "video_id": video_id,
+                "job_id": job_id,
+                "message": "Video uploaded successfully"
+            },
+            headers=headers
+        )
+
+async def _uploading_session(db, upload_id: str) -> dict:
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        drop_upload_state(upload_id)
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session["status"] != "uploading":
+        drop_upload_state(upload_id)
+        raise HTTPException(status_code=409, detail=f"Upload is {session['status']}")
+    return session
+
+def _stale_session_query(cutoff: datetime) -> dict:
+    return {
+        "status": "uploading",
+        "$or": [
+            {"updated_at": {"$lt": cutoff}},
+            {"updated_at": {"$exists": False}, "created_at": {"$lt": cutoff}}
+        ]
+    }
+
+async def expire_stale_uploads(db) -> int:
+    """Expire resumable uploads idle for UPLOAD_SESSION_TTL, removing their partial files and thumbnails"""
+    now = datetime.now(timezone.utc)
+    query = _stale_session_query(now - timedelta(seconds=UPLOAD_SESSION_TTL))
+    expired = 0
+    async for session in db.upload_sessions.find(query, {"_id": 0, "id": 1, "thumbnail_path": 1}):
+        # Conditional, so a PATCH that just made progress (or another process's sweep) wins
+        result = await db.upload_sessions.update_one(
+            {"id": session["id"], **query},
+            {"$set": {"status": "expired", "updated_at": now}}
+        )
+        if not result.modified_count:
+            continue
+        drop_upload_state(session["id"])
+        await remove_file(_partial_path(session["id"]))
+        await _release_stored(db, session.get("thumbnail_path"))
+        expired += 1
+    
+    # Partial files whose session was never recorded, or already finished elsewhere
+    for path in await stale_files(PARTIAL_DIR, "*.part", UPLOAD_SESSION_TTL):
+        if not await db.upload_sessions.find_one({"id": path.stem, "status": "uploading"}, {"_id": 1}):
+            await remove_file(path)
+    return expired
+
+async def _complete_upload(db, session: dict, state, partial: Path) -> Tuple[str, str]:
+    """Verify the checksum, ingest the file as a blob, then commit the video metadata"""
+    upload_id = session["id"]
+    checksum = state.hasher.hexdigest()
+    drop_upload_state(upload_id)
+    
+    expected = session.get("expected_checksum")
+    if expected and expected != checksum:
+        await remove_file(partial)
+        await _release_stored(db, session.get("thumbnail_path"))
+        await db.upload_sessions.update_one({"id": upload_id}, {"$set": {"status": "failed", "checksum": checksum}})
+        raise HTTPException(status_code=422, detail="Checksum mismatch")
+    
+    await blob_store.ingest(db, partial, checksum, session["size"])
+    
+    video_doc = _build_video_doc(
+        upload_id, **session["metadata"],
+        video_filename=f"{checksum}{session['video_ext']}",
+        thumbnail_filename=session.get("thumbnail_path"),
+        size=session["size"],
+        checksum=checksum
+    )
+    job_id = await _commit_video(db, video_doc)
+    await db.upload_sessions.update_one(
+        {"id": upload_id},
+        {"$set": {"status": "complete", "video_id": upload_id, "checksum": checksum}}
+    )
+    return upload_id, job_id
+
+# Only the fields the list/detail payloads need
+VIDEO_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "title": 1,
+    "description": 1,
+    "thumbnail_path": 1,
+    "video_path": 1,
+    "category": 1,
+    "year": 1,
+    "rating": 1,
+    "match": 1,
+    "created_at": 1,
+    "thumbnail_variants": 1,
+    "duration": 1,
+    "hls.version": 1
+}
+
+def _format_video(video: dict) -> dict:
+    """Format a custom video document for the frontend"""
+    thumbnail_url = f"/api/custom-videos/thumbnail/{video['thumbnail_path']}" if video.get('thumbnail_path') else None
+    poster = pick_variant(video.get("thumbnail_variants"), POSTER_WIDTH)
+    backdrop = pick_variant(video.get("thumbnail_variants"), BACKDROP_WIDTH)
+    return {
+        "id": video["id"],
+        "title": video["title"],
+        "description": video["description"],
+        "poster": f"/api/custom-videos/thumbnail/{poster}" if poster else thumbnail_url,
+        "backdrop": f"/api/custom-videos/thumbnail/{backdrop}" if backdrop else thumbnail_url,
+        "category": video.get("category", "My Videos"),
+        "year": video.get("year", 2024),
+        "rating": video.get("rating", "TV-14"),
+        "match": video.get("match", 90),
+        "duration": video.get("duration"),
+        "media_type": "custom",
+        "video_url": f"/api/custom-videos/stream/{video['video_path']}"
+    }
+
+def _encode_cursor(video: dict) -> str:
+    created_at = video.get("created_at")
+    payload = {"c": created_at.isoformat() if created_at else None, "i": video["id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = datetime.fromisoformat(payload["c"]) if payload["c"] else None
+        return created_at, str(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _after_cursor(created_at: Optional[datetime], last_id: str) -> dict:
+    """Keyset filter for rows after (created_at, id) in descending order"""
+    if created_at is None:
+        # Legacy documents without created_at sort last; page through them by id
+        return {"created_at": None, "id": {"$lt": last_id}}
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": last_id}},
+        {"created_at": None}
+    ]}
+
+async def index_custom_videos(db):
+    """Load every custom upload into the search index; called once at startup"""
+    count = 0
+    async for video in db.custom_videos.find({}, VIDEO_PROJECTION):
+        title_index.add(_format_video(video))
+        count += 1
+    return count
+
 @router.get("/list")
-async def list_custom_videos():
-    """Get all custom uploaded videos"""
+async def list_custom_videos(
+    limit: int = Query(default=100, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None),
+    category: Optional[str] = Query(default=None),
+    db=Depends(get_db)
+):
+    """Get custom uploaded videos, newest first, one keyset page at a time"""
+    query = {}
+    if category:
+        query["category"] = category
+    if cursor:
+        query.update(_after_cursor(*_decode_cursor(cursor)))
+    
+    sort = [("created_at", -1), ("id", -1)]
+    query_profiler.sample(db.custom_videos, query, sort)
+    
     try:
-        videos = await db.custom_videos.find().to_list(100)
-        
-        # Format videos for frontend
-        formatted_videos = []
-        for video in videos:
-            formatted_videos.append({
-                "id": video["id"],
-                "title": video["title"],
-                "description": video["description"],
-                "poster": f"/api/custom-videos/thumbnail/{video['thumbnail_path']}" if video.get('thumbnail_path') else None,
-                "backdrop": f"/api/custom-videos/thumbnail/{video['thumbnail_path']}" if video.get('thumbnail_path') else None,
-                "category": video.get("category", "My Videos"),
-                "year": video.get("year", 2024),
-                "rating": video.get("rating", "TV-14"),
-                "match": video.get("match", 90),
-                "media_type": "custom",
-                "video_url": f"/api/custom-videos/stream/{video['video_path']}"
-            })
+        # Fetch one extra row to know whether another page exists
+        videos = await (
+            db.custom_videos.find(query, VIDEO_PROJECTION)
+            .sort(sort)
+            .limit(limit + 1)
+            .to_list(limit + 1)
+        )
         
-        return {"success": True, "data": formatted_videos}
+        next_cursor = _encode_cursor(videos[limit - 1]) if len(videos) > limit else None
+        
+        return {
+            "success": True,
+            "data": [_format_video(video) for video in videos[:limit]],
+            "next_cursor": next_cursor
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/stream/{filename}")
+@router.api_route("/stream/{filename}", methods=["GET", "HEAD"])
 async def stream_video(filename: str):
-    """Stream video file"""
-    file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Video not found")
-    
-    return FileResponse(file_path, media_type="video/mp4")
+    """Stream video file with Range/If-Range support (206, multi-range, ETag/Last-Modified)"""
+    media_type = mimetypes.guess_type(filename)[0] or "video/mp4"
+    # Content-addressed names never change meaning
+    headers = {"Cache-Control": IMMUTABLE_CACHE} if blob_store.digest_of(filename) else None
+    return await _serve_stored(_stored_key(filename), media_type, headers, not_found="Video not found")
 
 @router.get("/thumbnail/{filename}")
-async def get_thumbnail(filename: str):
-    """Get thumbnail image"""
+async def get_thumbnail(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(default=None, ge=1, le=4096),
+    db=Depends(get_db)
+):
+    """Get thumbnail image; hashed variant names are immutable, ?w= picks a resized variant"""
     if not filename or filename == "None":
         raise HTTPException(status_code=404, detail="Thumbnail not found")
     
-    file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    if is_variant_name(filename):
+        return await _serve_stored(
+            variant_key(filename),
+            mimetypes.guess_type(filename)[0],
+            {"Cache-Control": IMMUTABLE_CACHE},
+            not_found="Thumbnail not found"
+        )
+    
+    if w is not None:
+        video = await db.custom_videos.find_one({"thumbnail_path": filename}, {"_id": 0, "thumbnail_variants": 1})
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+        variant = pick_variant(video.get("thumbnail_variants") if video else None, w, fmt)
+        if variant:
+            # Variants are recorded only once they are stored
+            return await _serve_stored(
+                variant_key(variant),
+                mimetypes.guess_type(variant)[0],
+                {"Cache-Control": "public, max-age=3600", "Vary": "Accept"},
+                not_found="Thumbnail not found"
+            )
+    
+    headers = {"Cache-Control": IMMUTABLE_CACHE} if blob_store.digest_of(filename) else None
+    return await _serve_stored(
+        _stored_key(filename), mimetypes.guess_type(filename)[0], headers, not_found="Thumbnail not found"
+    )
+
+@router.get("/hls/{video_id}/{path:path}")
+async def get_hls_file(video_id: str, path: str):
+    """Serve HLS playlists, init segments and fMP4 media segments (Range-capable, immutable)"""
+    if not re.match(r'^[\w-]+$', video_id) or not HLS_PATH_RE.match(path):
+        raise HTTPException(status_code=404, detail="HLS file not found")
     
-    return FileResponse(file_path)
+    suffix = os.path.splitext(path)[1]
+    return await _serve_stored(
+        f"{HLS_PREFIX}/{video_id}/{path}",
+        HLS_MEDIA_TYPES[suffix],
+        {"Cache-Control": IMMUTABLE_CACHE},
+        not_found="HLS file not found",
+        # Players resolve a playlist's relative URIs against its final URL, so playlists must
+        # stay on this route; init and media segments can still go straight to the bucket
+        redirect=suffix != ".m3u8"
+    )
+
+@router.post("/{video_id}/hls", status_code=202, dependencies=[Depends(require_admin)])
+async def package_custom_video(video_id: str, db=Depends(get_db)):
+    """Queue (re)packaging of a video as fMP4 HLS"""
+    video = await db.custom_videos.find_one({"id": video_id}, {"_id": 0, "video_path": 1, "media_info": 1})
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if not (video.get("media_info") or {}).get("video"):
+        raise HTTPException(status_code=409, detail="Video has not been probed yet")
+    
+    job_id = await _enqueue_packaging(db, video_id, video["video_path"], video["media_info"])
+    return {"success": True, "job_id": job_id}
+
+@router.get("/jobs/{job_id}")
+async def get_media_job(job_id: str, db=Depends(get_db)):
+    """Status of a background media-processing job"""
+    job = await media_jobs.get(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "data": job}
 
 @router.get("/{video_id}")
-async def get_custom_video(video_id: str):
+async def get_custom_video(video_id: str, db=Depends(get_db)):
     """Get custom video details"""
     try:
-        video = await db.custom_videos.find_one({"id": video_id})
+        query_profiler.sample(db.custom_videos, {"id": video_id})
+        video = await db.custom_videos.find_one({"id": video_id}, VIDEO_PROJECTION)
         if not video:
             raise HTTPException(status_code=404, detail="Video not found")
         
-        return {
-            "success": True,
-            "data": {
-                "id": video["id"],
-                "title": video["title"],
-                "description": video["description"],
-                "poster": f"/api/custom-videos/thumbnail/{video['thumbnail_path']}" if video.get('thumbnail_path') else None,
-                "backdrop": f"/api/custom-videos/thumbnail/{video['thumbnail_path']}" if video.get('thumbnail_path') else None,
-                "category": video.get("category", "My Videos"),
-                "year": video.get("year", 2024),
-                "rating": video.get("rating", "TV-14"),
-                "match": video.get("match", 90),
-                "media_type": "custom",
-                "video_url": f"/api/custom-videos/stream/{video['video_path']}",
-                "genres": [video.get("category", "My Videos")]
-            }
-        }
+        data = _format_video(video)
+        data["genres"] = [video.get("category", "My Videos")]
+        if video.get("hls"):
+            data["hls_url"] = f"/api/custom-videos/hls/{video_id}/{video['hls']['version']}/master.m3u8"
+        return {"success": True, "data": data}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.delete("/{video_id}")
-async def delete_custom_video(video_id: str):
+@router.delete("/{video_id}", dependencies=[Depends(require_admin)])
+async def delete_custom_video(video_id: str, db=Depends(get_db)):
     """Delete custom video"""
     try:
+        query_profiler.sample(db.custom_videos, {"id": video_id})
         video = await db.custom_videos.find_one({"id": video_id})
         if not video:
             raise HTTPException(status_code=404, detail="Video not found")
         
-        # Delete files
-        video_path = UPLOAD_DIR / video["video_path"]
-        if video_path.exists():
-            os.remove(video_path)
+        # Drop the document first so nothing points at a blob once its last reference goes
+        await db.custom_videos.delete_one({"id": video_id})
+        await _release_stored(db, video["video_path"])
+        await _release_stored(db, video.get("thumbnail_path"))
         
-        if video.get("thumbnail_path"):
-            thumb_path = UPLOAD_DIR / video["thumbnail_path"]
-            if thumb_path.exists():
-                os.remove(thumb_path)
+        await delete_variants(variant_files(video.get("thumbnail_variants")))
         
-        # Delete from database
-        await db.custom_videos.delete_one({"id": video_id})
+        await storage.delete_prefix(f"{HLS_PREFIX}/{video_id}")
+        
+        # Jobs not yet started have nothing left to process
+        await db.media_jobs.delete_many({"video_id": video_id, "status": "queued"})
+        title_index.remove("custom", video_id)
         
         return {"success": True, "message": "Video deleted successfully"}
     except HTTPException:
@@ -0,0 +1,77 @@
+from fastapi import APIRouter
+import sys
+sys.path.append('/app/backend')
+from tmdb_cache import tmdb_cache
+from tmdb_service import tmdb_breakers, tmdb_flight, tmdb_latency, tmdb_rate_limiter
+from tmdb_snapshots import tmdb_snapshots
+from db_indexes import index_report, query_profiler
+import database
+from image_cache import image_cache
+from compressed_json import response_variants
+from media_jobs import media_jobs
+from blob_store import blob_store
+from auth_tokens import claims_cache, token_revocations
+from title_index import title_index
+from autocomplete import suggest_cache, suggest_sessions
+from catalogue_warmer import catalogue_warmer
+
+router = APIRouter(prefix="/diagnostics", tags=["diagnostics"])
+
+@router.get("/tmdb")
+async def tmdb_diagnostics():
+    """TMDB cache, coalescing, rate limit, circuit, latency, snapshot, type-ahead and warmer counters"""
+    return {
+        "success": True,
+        "data": {
+            "cache": tmdb_cache.snapshot(),
+            "coalescing": tmdb_flight.snapshot(),
+            "rate_limiter": tmdb_rate_limiter.snapshot(),
+            "circuits": tmdb_breakers.snapshot(),
+            "latency": tmdb_latency.snapshot(),
+            "snapshots": tmdb_snapshots.snapshot(),
+            "title_index": title_index.snapshot(),
+            "suggest": {"cache": suggest_cache.snapshot(), "sessions": suggest_sessions.snapshot()},
+            "warmer": catalogue_warmer.snapshot()
+        }
+    }
+
+@router.get("/indexes")
+async def index_diagnostics():
+    """Registered indexes from the last startup run and sampled queries that ran without one"""
+    return {
+        "success": True,
+        "data": {
+            "indexes": index_report,
+            "queries": query_profiler.snapshot()
+        }
+    }
+
+@router.get("/db")
+async def db_diagnostics():
+    """MongoDB pool settings, connection counts and checkout wait times"""
+    return {"success": True, "data": database.snapshot()}
+
+@router.get("/images")
+async def image_cache_diagnostics():
+    """TMDB image proxy disk cache usage"""
+    return {"success": True, "data": image_cache.snapshot()}
+
+@router.get("/responses")
+async def response_cache_diagnostics():
+    """Compressed catalogue response variants and conditional request counters"""
+    return {"success": True, "data": response_variants.snapshot()}
+
+@router.get("/media-jobs")
+async def media_job_diagnostics():
+    """Media-processing worker state and job counters for this process"""
+    return {"success": True, "data": media_jobs.snapshot()}
+
+@router.get("/blobs")
+async def blob_store_diagnostics():
+    """Content-addressed upload storage and deduplication counters for this process"""
+    return {"success": True, "data": blob_store.snapshot()}
+
+@router.get("/auth")
+async def auth_diagnostics():
+    """Verified-claims cache and revocation list counters for this process"""
+    return {"success": True, "data": {"claims_cache": claims_cache.snapshot(), "revocations": token_revocations.snapshot()}}
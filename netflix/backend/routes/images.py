@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+import mimetypes
+import sys
+sys.path.append('/app/backend')
+from image_cache import ALLOWED_SIZES, IMAGE_PATH_RE, ImageFetchError, get_image
+from media_response import RangeFileResponse
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+# TMDB image paths never change content, so proxied copies can be cached forever
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+@router.get("/{size}/{filename}")
+async def get_tmdb_image(size: str, filename: str):
+    """Proxy a TMDB poster/backdrop at a given size bucket through the local disk cache"""
+    if size not in ALLOWED_SIZES or not IMAGE_PATH_RE.match(filename):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    try:
+        path = await get_image(size, filename)
+    except ImageFetchError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    return RangeFileResponse(
+        path,
+        media_type=mimetypes.guess_type(filename)[0],
+        headers={"Cache-Control": IMMUTABLE_CACHE}
+    )
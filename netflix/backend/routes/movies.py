@@ -1,35 +1,106 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
 import sys
 sys.path.append('/app/backend')
 from tmdb_service import (
     get_trending_movies,
     get_category_movies,
     search_movies,
+    search_first_page,
     get_movie_details,
-    get_movie_trailer
+    prefetch_movie_details
 )
+from title_index import normalize, title_index, TITLE_INDEX_MIN_CONFIDENCE
+from fast_json import FastJSONResponse, dumps
+from compressed_json import json_response
+from autocomplete import client_ip, compact, suggest_cache, suggest_sessions
+from tmdb_snapshots import track_staleness
 
 router = APIRouter(prefix="/movies", tags=["movies"])
 
+CATEGORIES = [
+    {"id": "trending", "name": "Trending Now"},
+    {"id": "popular", "name": "Popular on Netflix"},
+    {"id": "action", "name": "Action Thrillers"},
+    {"id": "comedy", "name": "Comedies"},
+    {"id": "documentary", "name": "Documentaries"},
+    {"id": "horror", "name": "Horror Movies"},
+    {"id": "romance", "name": "Romance"},
+    {"id": "drama", "name": "Drama Series"}
+]
+CATEGORY_NAMES = {c["id"]: c["name"] for c in CATEGORIES}
+
+def _parse_categories(categories: Optional[List[str]]) -> List[str]:
+    """Accept repeated and/or comma-separated category params, preserving order"""
+    if not categories:
+        return [c["id"] for c in CATEGORIES]
+    parsed = []
+    for value in categories:
+        for category in value.split(','):
+            category = category.strip()
+            if category and category not in parsed:
+                parsed.append(category)
+    return parsed
+
+def _dedupe_row(movies: List[Dict], seen: Set[Tuple]) -> List[Dict]:
+    """Drop titles already shown in an earlier row"""
+    row = []
+    for movie in movies:
+        key = (movie.get('media_type'), movie.get('id'))
+        if key in seen:
+            continue
+        seen.add(key)
+        row.append(movie)
+    return row
+
+async def _fetch_row(category: str, limit: int) -> Tuple[str, List[Dict], Optional[str], Dict]:
+    with track_staleness() as staleness:
+        try:
+            return category, await get_category_movies(category, limit), None, staleness.fields()
+        except Exception as e:
+            return category, [], str(e), staleness.fields()
+
+def _row_payload(category: str, movies: List[Dict], error: Optional[str], stale: Dict) -> Dict:
+    row = {"category": category, "name": CATEGORY_NAMES.get(category, category), "data": movies, **stale}
+    if error:
+        row["error"] = error
+    return row
+
 @router.get("/trending")
-async def get_trending(limit: int = Query(default=20, ge=1, le=50)):
+async def get_trending(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    limit: int = Query(default=20, ge=1, le=50),
+    prefetch: int = Query(default=0, ge=0, le=20)
+):
     """Get trending movies and series"""
     try:
-        movies = get_trending_movies(limit)
-        return {"success": True, "data": movies}
+        with track_staleness() as staleness:
+            movies = await get_trending_movies(limit)
+        if prefetch:
+            background_tasks.add_task(prefetch_movie_details, movies, prefetch)
+        return json_response(request, {"success": True, "data": movies, **staleness.fields()})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/category/{category}")
 async def get_by_category(
+    request: Request,
     category: str,
-    limit: int = Query(default=20, ge=1, le=50)
+    background_tasks: BackgroundTasks,
+    limit: int = Query(default=20, ge=1, le=50),
+    prefetch: int = Query(default=0, ge=0, le=20)
 ):
     """Get movies by category"""
     try:
-        movies = get_category_movies(category, limit)
-        return {"success": True, "data": movies, "category": category}
+        with track_staleness() as staleness:
+            movies = await get_category_movies(category, limit)
+        if prefetch:
+            background_tasks.add_task(prefetch_movie_details, movies, prefetch)
+        return json_response(request, {"success": True, "data": movies, "category": category, **staleness.fields()})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -38,45 +109,128 @@ async def search(
     q: str = Query(..., min_length=1),
     limit: int = Query(default=20, ge=1, le=50)
 ):
-    """Search movies and series"""
+    """Search movies and series, answering from the local title index when it is confident"""
+    try:
+        local = title_index.search(q, limit)
+        if title_index.is_confident(local, limit):
+            results = [doc for _, doc in local]
+            source = "local"
+        else:
+            # Low confidence: ask TMDB, keeping strong local hits (e.g. custom uploads) first
+            with track_staleness() as staleness:
+                remote = await search_movies(q, limit)
+            strong = [doc for score, doc in local if score >= TITLE_INDEX_MIN_CONFIDENCE]
+            seen: Set[Tuple] = set()
+            results = _dedupe_row(strong + remote, seen)[:limit]
+            source = "snapshot" if staleness.stale else "tmdb"
+        return FastJSONResponse({"success": True, "data": results, "query": q, "count": len(results), "source": source})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/suggest")
+async def suggest(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(default=8, ge=1, le=20),
+    x_session_id: Optional[str] = Header(default=None)
+):
+    """Type-ahead suggestions from cached prefixes or the local index, falling back to a debounced TMDB call"""
+    try:
+        norm = normalize(q)
+        if not norm:
+            return FastJSONResponse({"success": True, "data": [], "query": q, "source": "local"})
+        
+        cached = suggest_cache.lookup(norm, limit)
+        if cached is not None:
+            return FastJSONResponse({"success": True, "data": cached, "query": q, "source": "cache"})
+        
+        local = title_index.search(q, limit)
+        local_rows = [compact(doc) for _, doc in local]
+        if title_index.is_confident(local, limit):
+            return FastJSONResponse({"success": True, "data": local_rows, "query": q, "source": "local"})
+        
+        # Only the last keystroke of a burst, within the client's budget, reaches TMDB
+        client = client_ip(request.client.host if request.client else None, request.headers.get("x-forwarded-for"))
+        async with suggest_sessions.keystroke(x_session_id or client) as latest:
+            if not latest or not suggest_sessions.try_spend(client):
+                return FastJSONResponse({"success": True, "data": local_rows, "query": q, "source": "local", "partial": True})
+            
+            with track_staleness() as staleness:
+                remote, complete = await search_first_page(q)
+        strong = [doc for score, doc in local if score >= TITLE_INDEX_MIN_CONFIDENCE]
+        seen: Set[Tuple] = set()
+        merged = _dedupe_row(strong + remote, seen)
+        if staleness.stale:
+            return FastJSONResponse({"success": True, "data": [compact(doc) for doc in merged[:limit]], "query": q, "source": "snapshot"})
+        suggest_cache.put(norm, merged, complete)
+        return FastJSONResponse({"success": True, "data": [compact(doc) for doc in merged[:limit]], "query": q, "source": "tmdb"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/feed")
+async def get_feed(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    categories: Optional[List[str]] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=50),
+    stream: bool = Query(default=False),
+    prefetch: int = Query(default=0, ge=0, le=20)
+):
+    """Get several category rows in one call, fetched concurrently and deduplicated across rows"""
+    category_ids = _parse_categories(categories)
+    
+    async def prefetch_rows(rows: List[Dict]):
+        await asyncio.gather(*[prefetch_movie_details(row["data"], prefetch) for row in rows])
+    
+    if stream:
+        streamed_rows: List[Dict] = []
+        
+        async def row_stream():
+            # Rows are emitted as NDJSON in completion order; dedupe follows that order
+            seen: Set[Tuple] = set()
+            for next_row in asyncio.as_completed([_fetch_row(c, limit) for c in category_ids]):
+                category, movies, error, stale = await next_row
+                row = _row_payload(category, _dedupe_row(movies, seen), error, stale)
+                streamed_rows.append(row)
+                yield dumps(row) + b"\n"
+        
+        background = BackgroundTask(prefetch_rows, streamed_rows) if prefetch else None
+        return StreamingResponse(row_stream(), media_type="application/x-ndjson", background=background)
+    
     try:
-        results = search_movies(q, limit)
-        return {"success": True, "data": results, "query": q, "count": len(results)}
+        results = await asyncio.gather(*[_fetch_row(c, limit) for c in category_ids])
+        seen: Set[Tuple] = set()
+        rows = [
+            _row_payload(category, _dedupe_row(movies, seen), error, stale)
+            for category, movies, error, stale in results
+        ]
+        if prefetch:
+            background_tasks.add_task(prefetch_rows, rows)
+        return json_response(request, {"success": True, "data": rows})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{movie_id}")
 async def get_movie(
+    request: Request,
     movie_id: int,
     media_type: str = Query(default="movie", regex="^(movie|tv)$")
 ):
     """Get detailed movie information"""
     try:
-        movie = get_movie_details(movie_id, media_type)
+        # Details and trailer arrive in one upstream call
+        with track_staleness() as staleness:
+            movie = await get_movie_details(movie_id, media_type)
         if not movie:
             raise HTTPException(status_code=404, detail="Movie not found")
         
-        # Get trailer
-        trailer = get_movie_trailer(movie_id, media_type)
-        movie['trailer'] = trailer
-        
-        return {"success": True, "data": movie}
+        return json_response(request, {"success": True, "data": movie, **staleness.fields()})
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/categories/list")
-async def list_categories():
+async def list_categories(request: Request):
     """List all available categories"""
-    categories = [
-        {"id": "trending", "name": "Trending Now"},
-        {"id": "popular", "name": "Popular on Netflix"},
-        {"id": "action", "name": "Action Thrillers"},
-        {"id": "comedy", "name": "Comedies"},
-        {"id": "documentary", "name": "Documentaries"},
-        {"id": "horror", "name": "Horror Movies"},
-        {"id": "romance", "name": "Romance"},
-        {"id": "drama", "name": "Drama Series"}
-    ]
-    return {"success": True, "data": categories}
+    return json_response(request, {"success": True, "data": CATEGORIES})
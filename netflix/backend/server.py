@@ -1,29 +1,108 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List
 import uuid
+from functools import partial
 from datetime import datetime, timezone
-from routes.movies import router as movies_router
-from routes.custom_videos import router as custom_videos_router
-from routes.auth import router as auth_router
-
 
 ROOT_DIR = Path(__file__).parent
+# Before any local import: routes and services read their settings from the environment at import time
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from routes.movies import router as movies_router
+from routes.custom_videos import router as custom_videos_router, expire_stale_uploads, index_custom_videos
+from routes.auth import router as auth_router, SECRET_KEY as JWT_SECRET_KEY
+from routes.diagnostics import router as diagnostics_router
+from routes.images import router as images_router
+from tmdb_service import close_http_client
+from tmdb_cache import tmdb_cache
+from catalogue_warmer import catalogue_warmer
+from tmdb_snapshots import tmdb_snapshots
+from db_indexes import ensure_indexes, run_migrations, query_profiler
+import database
+from database import get_db
+from request_deadline import DeadlineMiddleware
+import image_variants
+from media_jobs import media_jobs
+from resumable_upload import upload_sweeper
+import image_cache
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+async def migrate_database(db):
+    if os.environ.get('DB_AUTO_MIGRATE', 'true').lower() not in ('1', 'true', 'yes'):
+        return
+    try:
+        applied = await run_migrations(db)
+        if applied:
+            logger.info(f"Applied migrations: {', '.join(applied)}")
+    except Exception as e:
+        logger.error(f"Database migration failed: {e}")
+    
+    # Indexes don't depend on the migrations, so a failed one must not leave queries unindexed
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        logger.error(f"Index creation failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Admin routes are only as safe as the token signing key
+    if not JWT_SECRET_KEY:
+        raise RuntimeError("JWT_SECRET_KEY is not set; refusing to start without a token signing key")
+    
+    # One MongoDB client (and pool) per worker, shared by every router
+    db = database.connect()
+    await migrate_database(db)
+    
+    try:
+        indexed = await index_custom_videos(db)
+        logger.info(f"Indexed {indexed} custom videos for search")
+    except Exception as e:
+        logger.error(f"Could not index custom videos for search: {e}")
+    
+    if os.environ.get('TMDB_CACHE_SHARED', '').lower() in ('1', 'true', 'yes'):
+        tmdb_cache.configure_shared_tier(db.tmdb_cache)
+        logger.info("Shared TMDB cache tier enabled")
+    
+    # Last-known-good TMDB responses, served when upstream is failing
+    tmdb_snapshots.configure(db.tmdb_snapshots)
+    
+    # Keep category rows and their top titles hot so users rarely wait on TMDB
+    catalogue_warmer.start()
+    
+    # Probe/faststart/poster jobs for uploads, including ones left over from a previous run
+    media_jobs.start(db)
+    
+    # Expire resumable uploads that stopped making progress
+    upload_sweeper.start(partial(expire_stale_uploads, db))
+    
+    try:
+        yield
+    finally:
+        await catalogue_warmer.stop()
+        await media_jobs.stop()
+        await upload_sweeper.stop()
+        tmdb_cache.configure_shared_tier(None)
+        tmdb_snapshots.configure(None)
+        await close_http_client()
+        await image_cache.close_http_client()
+        image_variants.shutdown()
+        database.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -32,6 +111,8 @@ api_router = APIRouter(prefix="/api")
 api_router.include_router(movies_router)
 api_router.include_router(custom_videos_router)
 api_router.include_router(auth_router)
+api_router.include_router(diagnostics_router)
+api_router.include_router(images_router)
 
 
 # Define Models
@@ -51,23 +132,23 @@ async def root():
     return {"message": "Hello World"}
 
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(input: StatusCheckCreate, db=Depends(get_db)):
     status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
     
-    # Convert to dict and serialize datetime to ISO string for MongoDB
+    # Keep timestamp a BSON date so the TTL index can expire old checks
     doc = status_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
     
     _ = await db.status_checks.insert_one(doc)
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
+async def get_status_checks(db=Depends(get_db)):
     # Exclude MongoDB's _id field from the query results
+    query_profiler.sample(db.status_checks, {})
     status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
     
-    # Convert ISO string timestamps back to datetime objects
+    # Convert legacy ISO string timestamps back to datetime objects
     for check in status_checks:
         if isinstance(check['timestamp'], str):
             check['timestamp'] = datetime.fromisoformat(check['timestamp'])
@@ -85,13 +166,5 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# Budget upstream calls from the caller's X-Request-Timeout
+app.add_middleware(DeadlineMiddleware)
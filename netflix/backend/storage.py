@@ -0,0 +1,288 @@
+import asyncio
+import os
+import shutil
+import uuid
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Mapping, Optional
+
+import anyio
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 is only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local').lower()
+STORAGE_ROOT = Path(os.environ.get('STORAGE_ROOT', '/app/backend/uploads'))
+# Node-local working files (partial uploads, encoder output); never served directly
+STORAGE_SCRATCH_DIR = Path(os.environ.get('STORAGE_SCRATCH_DIR', str(STORAGE_ROOT / '.partial')))
+# Redirect media GETs to presigned object URLs instead of proxying the bytes (s3 only)
+STORAGE_REDIRECT = os.environ.get('STORAGE_REDIRECT', 'false').lower() in ('1', 'true', 'yes')
+STORAGE_PRESIGN_TTL = int(os.environ.get('STORAGE_PRESIGN_TTL', '900'))
+
+S3_BUCKET = os.environ.get('S3_BUCKET', 'netflix-uploads')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+# e.g. http://localhost:9000 for MinIO or another local S3 stand-in
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', str(16 * 1024 ** 2)))
+S3_MULTIPART_CHUNK_SIZE = int(os.environ.get('S3_MULTIPART_CHUNK_SIZE', str(16 * 1024 ** 2)))
+S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', '8'))
+
+# Bytes per body message when proxying a ranged object read
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class ObjectInfo:
+    """Size and validators of a stored object"""
+
+    def __init__(self, size: int, etag: str, last_modified: datetime):
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class LocalStorage:
+    """Objects as files under one root directory; keys are relative paths"""
+
+    name = 'local'
+
+    def __init__(self, root: Path, scratch_dir: Path):
+        self.root = root
+        self.scratch_dir = scratch_dir
+        self.stats = {'puts': 0, 'deletes': 0}
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.root / key
+
+    async def put_file(self, key: str, source: Path, content_type: Optional[str] = None):
+        """Move a finished scratch file into place under key"""
+        dest = self.root / key
+
+        def _put():
+            with open(source, 'rb') as f:
+                os.fsync(f.fileno())
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(source, dest)
+
+        await anyio.to_thread.run_sync(_put)
+        self.stats['puts'] += 1
+
+    async def put_tree(self, prefix: str, source_dir: Path, content_types: Optional[Mapping[str, str]] = None):
+        """Move a finished scratch directory into place under prefix"""
+        dest = self.root / prefix
+
+        def _put():
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if dest.exists():
+                shutil.rmtree(dest)
+            os.replace(source_dir, dest)
+
+        await anyio.to_thread.run_sync(_put)
+        self.stats['puts'] += 1
+
+    async def exists(self, key: str) -> bool:
+        return await anyio.to_thread.run_sync((self.root / key).is_file)
+
+    async def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            st = await anyio.to_thread.run_sync(os.stat, self.root / key)
+        except FileNotFoundError:
+            return None
+        return ObjectInfo(st.st_size, f"{st.st_ino:x}-{st.st_size:x}", datetime.fromtimestamp(st.st_mtime, timezone.utc))
+
+    async def delete(self, key: str):
+        try:
+            await anyio.to_thread.run_sync(os.remove, self.root / key)
+            self.stats['deletes'] += 1
+        except FileNotFoundError:
+            pass
+
+    async def delete_prefix(self, prefix: str):
+        await anyio.to_thread.run_sync(lambda: shutil.rmtree(self.root / prefix, ignore_errors=True))
+        self.stats['deletes'] += 1
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        """A readable local path for key; for local storage that is the object itself"""
+        path = self.root / key
+        if not await anyio.to_thread.run_sync(path.is_file):
+            raise FileNotFoundError(f"Stored object {key} not found")
+        yield path
+
+    async def presigned_url(self, key: str, media_type: Optional[str] = None) -> Optional[str]:
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'root': str(self.root), **self.stats}
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket: parallel multipart writes, ranged reads, presigned GETs"""
+
+    name = 's3'
+
+    def __init__(self, bucket: str, prefix: str, scratch_dir: Path, endpoint_url: Optional[str] = None,
+                 region: str = S3_REGION):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.scratch_dir = scratch_dir
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._client = None
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+            max_concurrency=S3_MAX_CONCURRENCY,
+            use_threads=True
+        )
+        self.stats = {'puts': 0, 'deletes': 0, 'range_reads': 0, 'downloads': 0, 'presigned': 0}
+
+    @property
+    def client(self):
+        # boto3 clients are thread-safe; one per process, created on first use
+        if self._client is None:
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                config=BotoConfig(
+                    max_pool_connections=S3_MAX_CONCURRENCY * 2,
+                    retries={'max_attempts': 3, 'mode': 'standard'},
+                    # Path-style addressing works with MinIO and other local stand-ins
+                    s3={'addressing_style': 'path'} if self.endpoint_url else None
+                )
+            )
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    async def put_file(self, key: str, source: Path, content_type: Optional[str] = None):
+        """Upload a scratch file (multipart, parts in parallel above the threshold), then remove it"""
+        extra = {'ContentType': content_type} if content_type else None
+        await anyio.to_thread.run_sync(lambda: self.client.upload_file(
+            str(source), self.bucket, self._key(key), ExtraArgs=extra, Config=self.transfer_config
+        ))
+        self.stats['puts'] += 1
+        await anyio.to_thread.run_sync(os.remove, source)
+
+    async def put_tree(self, prefix: str, source_dir: Path, content_types: Optional[Mapping[str, str]] = None):
+        """Upload every file below a scratch directory concurrently, then remove it"""
+        files = await anyio.to_thread.run_sync(lambda: [p for p in source_dir.rglob('*') if p.is_file()])
+        limiter = anyio.CapacityLimiter(S3_MAX_CONCURRENCY)
+
+        async def _upload(path: Path):
+            async with limiter:
+                key = f"{prefix}/{path.relative_to(source_dir).as_posix()}"
+                await self.put_file(key, path, (content_types or {}).get(path.suffix))
+
+        await asyncio.gather(*(_upload(path) for path in files))
+        await anyio.to_thread.run_sync(lambda: shutil.rmtree(source_dir, ignore_errors=True))
+
+    async def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            head = await anyio.to_thread.run_sync(
+                lambda: self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return ObjectInfo(head['ContentLength'], head['ETag'].strip('"'), head['LastModified'])
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def delete(self, key: str):
+        await anyio.to_thread.run_sync(lambda: self.client.delete_object(Bucket=self.bucket, Key=self._key(key)))
+        self.stats['deletes'] += 1
+
+    async def delete_prefix(self, prefix: str):
+        def _delete():
+            paginator = self.client.get_paginator('list_objects_v2')
+            # Each page holds at most 1000 keys, the delete_objects batch limit
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix.rstrip('/') + '/')):
+                objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+                if objects:
+                    self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+
+        await anyio.to_thread.run_sync(_delete)
+        self.stats['deletes'] += 1
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        """Download key to a scratch file (parallel ranged GETs) for tools that need a real file"""
+        self.scratch_dir.mkdir(parents=True, exist_ok=True)
+        dest = self.scratch_dir / f"{uuid.uuid4().hex}{Path(key).suffix}"
+        try:
+            await anyio.to_thread.run_sync(lambda: self.client.download_file(
+                self.bucket, self._key(key), str(dest), Config=self.transfer_config
+            ))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(f"Stored object {key} not found")
+            raise
+        self.stats['downloads'] += 1
+        try:
+            yield dest
+        finally:
+            if dest.exists():
+                await anyio.to_thread.run_sync(os.remove, dest)
+
+    async def iter_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Stream bytes [start, end) of an object without buffering it"""
+        obj = await anyio.to_thread.run_sync(lambda: self.client.get_object(
+            Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{end - 1}"
+        ))
+        self.stats['range_reads'] += 1
+        body = obj['Body']
+        try:
+            while True:
+                chunk = await anyio.to_thread.run_sync(body.read, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def presigned_url(self, key: str, media_type: Optional[str] = None) -> Optional[str]:
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if media_type:
+            params['ResponseContentType'] = media_type
+        self.stats['presigned'] += 1
+        # Signing is local (no request), so it is cheap enough to run inline
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=STORAGE_PRESIGN_TTL)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'backend': self.name,
+            'bucket': self.bucket,
+            'prefix': self.prefix,
+            'endpoint_url': self.endpoint_url,
+            'redirect': STORAGE_REDIRECT,
+            **self.stats
+        }
+
+
+def create_storage():
+    if STORAGE_BACKEND == 's3':
+        logger.info(f"Upload storage: s3://{S3_BUCKET}/{S3_PREFIX} ({S3_ENDPOINT_URL or 'AWS'})")
+        return S3Storage(S3_BUCKET, S3_PREFIX, STORAGE_SCRATCH_DIR, S3_ENDPOINT_URL)
+    return LocalStorage(STORAGE_ROOT, STORAGE_SCRATCH_DIR)
+
+
+storage = create_storage()
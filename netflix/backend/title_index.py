@@ -0,0 +1,267 @@
+import heapq
+import os
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Minimum top score for a local answer to be trusted without asking TMDB
+TITLE_INDEX_MIN_CONFIDENCE = float(os.environ.get('TITLE_INDEX_MIN_CONFIDENCE', '0.75'))
+# Minimum trigram similarity for a fuzzy (typo-tolerant) match
+TITLE_INDEX_MIN_SIMILARITY = float(os.environ.get('TITLE_INDEX_MIN_SIMILARITY', '0.35'))
+# TMDB titles kept, least recently seen evicted first; uploaded (custom) titles are always kept
+TITLE_INDEX_MAX_TITLES = int(os.environ.get('TITLE_INDEX_MAX_TITLES', '50000'))
+# Rebuild the postings once this fraction of doc slots are tombstones
+TITLE_INDEX_COMPACT_RATIO = float(os.environ.get('TITLE_INDEX_COMPACT_RATIO', '0.25'))
+# Query words shorter than this match whole title words only, not every word they start
+TITLE_INDEX_MIN_PREFIX = int(os.environ.get('TITLE_INDEX_MIN_PREFIX', '2'))
+# Candidate titles gathered per query word or trigram, most recently indexed first
+TITLE_INDEX_MAX_POSTINGS = int(os.environ.get('TITLE_INDEX_MAX_POSTINGS', '250'))
+# Shorter queries have too few trigrams for similarity to mean anything
+FUZZY_MIN_QUERY = 3
+
+# Only these answer title searches; multi-search results also carry people
+TITLE_MEDIA_TYPES = {'movie', 'tv', 'custom'}
+PINNED_MEDIA_TYPES = {'custom'}
+
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM_RE.sub(' ', text).strip()
+
+
+def trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return list({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+class TitleIndex:
+    """In-memory prefix + trigram index over titles, with array-backed postings lists.
+
+    Bounded to max_titles (LRU by last add); removals leave tombstones that are compacted
+    away, postings included, once they make up compact_ratio of the doc slots.
+    """
+
+    def __init__(
+        self,
+        max_titles: int = TITLE_INDEX_MAX_TITLES,
+        compact_ratio: float = TITLE_INDEX_COMPACT_RATIO,
+        compact_min: int = 1024
+    ):
+        self.max_titles = max_titles
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        # Evictable keys, least recently added first
+        self._recency: 'OrderedDict[Tuple[str, Any], None]' = OrderedDict()
+        self.stats = {'evictions': 0, 'compactions': 0}
+        self._reset()
+
+    def _reset(self):
+        self._docs: List[Optional[Dict[str, Any]]] = []
+        self._doc_norm: List[str] = []
+        self._doc_gram_count = array('H')
+        self._key_to_doc: Dict[Tuple[str, Any], int] = {}
+        self._gram_postings: Dict[str, array] = {}
+        self._token_postings: Dict[str, array] = {}
+        self._sorted_tokens: List[str] = []
+        self.live = 0
+
+    def __len__(self) -> int:
+        return self.live
+
+    @staticmethod
+    def _key(doc: Dict[str, Any]) -> Tuple[str, Any]:
+        return (doc.get('media_type') or 'movie', doc.get('id'))
+
+    def add(self, doc: Dict[str, Any]):
+        """Index a mapped title; re-adding a known title only refreshes its payload"""
+        if doc.get('id') is None or not doc.get('title'):
+            return
+        key = self._key(doc)
+        if key[0] not in TITLE_MEDIA_TYPES:
+            return
+        if key[0] not in PINNED_MEDIA_TYPES:
+            self._recency[key] = None
+            self._recency.move_to_end(key)
+        norm = normalize(doc['title'])
+        doc_id = self._key_to_doc.get(key)
+        if doc_id is not None:
+            if self._doc_norm[doc_id] == norm:
+                self._docs[doc_id] = doc
+                return
+            self._tombstone(key)
+
+        self._insert(key, norm, doc)
+        while len(self._recency) > self.max_titles:
+            evicted, _ = self._recency.popitem(last=False)
+            self._tombstone(evicted)
+            self.stats['evictions'] += 1
+        self._maybe_compact()
+
+    def _insert(self, key: Tuple[str, Any], norm: str, doc: Dict[str, Any], keep_sorted: bool = True):
+        doc_id = len(self._docs)
+        grams = trigrams(norm)
+        self._docs.append(doc)
+        self._doc_norm.append(norm)
+        self._doc_gram_count.append(min(len(grams), 0xFFFF))
+        self._key_to_doc[key] = doc_id
+        self.live += 1
+
+        for gram in grams:
+            postings = self._gram_postings.get(gram)
+            if postings is None:
+                postings = self._gram_postings[gram] = array('I')
+            postings.append(doc_id)
+        for token in set(norm.split()):
+            postings = self._token_postings.get(token)
+            if postings is None:
+                postings = self._token_postings[token] = array('I')
+                if keep_sorted:
+                    insort(self._sorted_tokens, token)
+            postings.append(doc_id)
+
+    def add_many(self, docs: Iterable[Dict[str, Any]]):
+        for doc in docs:
+            self.add(doc)
+
+    def remove(self, media_type: str, item_id: Any):
+        """Tombstone a title; postings skip dead doc ids at query time until the next compaction"""
+        self._recency.pop((media_type, item_id), None)
+        self._tombstone((media_type, item_id))
+        self._maybe_compact()
+
+    def _tombstone(self, key: Tuple[str, Any]):
+        doc_id = self._key_to_doc.pop(key, None)
+        if doc_id is not None:
+            self._docs[doc_id] = None
+            self.live -= 1
+
+    def _maybe_compact(self):
+        dead = len(self._docs) - self.live
+        if dead >= self.compact_min and dead >= len(self._docs) * self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """Rebuild every structure from the live titles, dropping tombstones and emptied postings"""
+        live = sorted(self._key_to_doc.items(), key=lambda item: item[1])
+        entries = [(key, self._doc_norm[doc_id], self._docs[doc_id]) for key, doc_id in live]
+        self._reset()
+        for key, norm, doc in entries:
+            self._insert(key, norm, doc, keep_sorted=False)
+        self._sorted_tokens = sorted(self._token_postings)
+        self.stats['compactions'] += 1
+
+    def _prefix_postings(self, prefix: str) -> Iterator[array]:
+        """Postings of every title word starting with prefix; short prefixes only match the whole word"""
+        if len(prefix) < TITLE_INDEX_MIN_PREFIX:
+            postings = self._token_postings.get(prefix)
+            if postings is not None:
+                yield postings
+            return
+        tokens = self._sorted_tokens
+        i = bisect_left(tokens, prefix)
+        while i < len(tokens) and tokens[i].startswith(prefix):
+            yield self._token_postings[tokens[i]]
+            i += 1
+
+    def _prefix_size(self, prefix: str) -> int:
+        """Postings _prefix_docs would read for prefix, counted no further than the cap"""
+        total = 0
+        for postings in self._prefix_postings(prefix):
+            total += len(postings)
+            if total >= TITLE_INDEX_MAX_POSTINGS:
+                break
+        return total
+
+    def _prefix_docs(self, prefix: str) -> set:
+        """Titles with a word starting with prefix, most recently indexed first, up to the cap"""
+        docs = set()
+        budget = TITLE_INDEX_MAX_POSTINGS
+        for postings in self._prefix_postings(prefix):
+            docs.update(postings[-budget:])
+            budget -= len(postings)
+            if budget <= 0:
+                break
+        return docs
+
+    def _fuzzy_scores(self, norm: str) -> Dict[int, float]:
+        """Dice coefficient over trigrams for titles sharing enough of the query's trigrams"""
+        query_grams = trigrams(norm)
+        shared = Counter()
+        for gram in query_grams:
+            postings = self._gram_postings.get(gram)
+            if postings is not None:
+                shared.update(postings[-TITLE_INDEX_MAX_POSTINGS:])
+        # Even a one-trigram title needs this many shared trigrams to reach the threshold
+        floor = TITLE_INDEX_MIN_SIMILARITY * (len(query_grams) + 1) / 2
+        gram_count = self._doc_gram_count
+        size = len(query_grams)
+        scores = {}
+        for doc_id, count in shared.items():
+            if count >= floor:
+                similarity = 2 * count / (size + gram_count[doc_id])
+                if similarity >= TITLE_INDEX_MIN_SIMILARITY:
+                    scores[doc_id] = similarity
+        return scores
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[float, Dict[str, Any]]]:
+        """Rank titles by prefix match on every query word, falling back to trigram similarity"""
+        norm = normalize(query)
+        if not norm:
+            return []
+        # Candidates come from the most selective word; the others are checked against each title
+        tokens = list(dict.fromkeys(norm.split()))
+        if len(tokens) > 1:
+            tokens.sort(key=lambda token: (self._prefix_size(token), -len(token)))
+        doc_norm = self._doc_norm
+        candidates = self._prefix_docs(tokens[0])
+        if len(tokens) > 1:
+            others = [f" {token}" for token in tokens[1:]]
+            candidates = [d for d in candidates if all(token in f" {doc_norm[d]}" for token in others)]
+
+        # Exact/leading matches and shorter titles rank first
+        size = len(norm)
+        scores: Dict[int, float] = {}
+        for doc_id in candidates:
+            title = doc_norm[doc_id]
+            scores[doc_id] = (0.9 if title.startswith(norm) else 0.8) + 0.1 * size / max(len(title), size)
+
+        # Fuzzy (typo-tolerant) matching only when prefix matches don't fill the page
+        if len(norm) >= FUZZY_MIN_QUERY and len(scores) < limit:
+            for doc_id, similarity in self._fuzzy_scores(norm).items():
+                if similarity > scores.get(doc_id, 0):
+                    scores[doc_id] = similarity
+
+        docs = self._docs
+        ranked = heapq.nlargest(
+            limit,
+            ((score, -doc_id) for doc_id, score in scores.items() if docs[doc_id] is not None)
+        )
+        return [(round(score, 4), docs[-neg_id]) for score, neg_id in ranked]
+
+    def is_confident(self, results: List[Tuple[float, Dict[str, Any]]], limit: int) -> bool:
+        """Whether local results are good enough to skip TMDB"""
+        if not results or results[0][0] < TITLE_INDEX_MIN_CONFIDENCE:
+            return False
+        strong = sum(1 for score, _ in results if score >= TITLE_INDEX_MIN_CONFIDENCE)
+        return strong >= min(limit, 5)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'titles': self.live,
+            'tombstones': len(self._docs) - self.live,
+            'trigrams': len(self._gram_postings),
+            'tokens': len(self._sorted_tokens),
+            'max_titles': self.max_titles,
+            **self.stats
+        }
+
+
+title_index = TitleIndex()
+
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+TMDB_CACHE_MAX_ENTRIES = int(os.environ.get('TMDB_CACHE_MAX_ENTRIES', '2000'))
+TMDB_CACHE_STALE_TTL = int(os.environ.get('TMDB_CACHE_STALE_TTL', '86400'))
+
+# Default freshness (seconds) per endpoint family, overridable with TMDB_CACHE_TTL_<FAMILY>
+DEFAULT_TTLS = {
+    'trending': 3600,
+    'popular': 3600,
+    'discover': 3600,
+    'details': 86400,
+    'videos': 86400,
+    'search': 600,
+    'other': 300
+}
+
+def endpoint_family(endpoint: str) -> str:
+    """Classify a TMDB endpoint into a cache/TTL family"""
+    parts = [p for p in endpoint.split('/') if p]
+    if not parts:
+        return 'other'
+    if parts[0] == 'trending':
+        return 'trending'
+    if parts[0] == 'discover':
+        return 'discover'
+    if parts[0] == 'search':
+        return 'search'
+    if parts[0] in ('movie', 'tv') and len(parts) >= 2:
+        if parts[1] == 'popular':
+            return 'popular'
+        if parts[1].isdigit():
+            return 'videos' if parts[-1] == 'videos' else 'details'
+    return 'other'
+
+def get_ttl(family: str) -> int:
+    """Get the freshness TTL for an endpoint family"""
+    env_value = os.environ.get(f'TMDB_CACHE_TTL_{family.upper()}')
+    if env_value:
+        return int(env_value)
+    return DEFAULT_TTLS.get(family, DEFAULT_TTLS['other'])
+
+def make_cache_key(endpoint: str, params: Optional[Dict] = None) -> str:
+    """Build a stable cache key from endpoint and params (API key excluded)"""
+    items = sorted((k, str(v)) for k, v in (params or {}).items() if k != 'api_key')
+    return f"{endpoint}?{urlencode(items)}" if items else endpoint
+
+
+class CacheEntry:
+    __slots__ = ('value', 'fetched_at', 'expires_at')
+
+    def __init__(self, value: Any, fetched_at: float, expires_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def is_servable(self, now: float) -> bool:
+        return now < self.expires_at + TMDB_CACHE_STALE_TTL
+
+
+class TMDBCache:
+    """Two-tier (in-process LRU + optional MongoDB) cache with stale-while-revalidate"""
+
+    def __init__(self, max_entries: int = TMDB_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._shared = None
+        self.stats = {'hits': 0, 'stale_hits': 0, 'shared_hits': 0, 'misses': 0, 'refreshes': 0}
+
+    def configure_shared_tier(self, collection):
+        """Enable the shared MongoDB tier (a Motor collection), or disable it with None"""
+        self._shared = collection
+
+    def _get_local(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _set_local(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _get_shared(self, key: str) -> Optional[CacheEntry]:
+        if self._shared is None:
+            return None
+        try:
+            doc = await self._shared.find_one({'_id': key})
+        except Exception as e:
+            logger.warning(f"Shared TMDB cache read failed: {e}")
+            return None
+        if not doc:
+            return None
+        return CacheEntry(doc['value'], doc['fetched_at'], doc['expires_at'])
+
+    async def _set_shared(self, key: str, entry: CacheEntry):
+        if self._shared is None:
+            return
+        purge_at = datetime.fromtimestamp(entry.expires_at + TMDB_CACHE_STALE_TTL, tz=timezone.utc)
+        try:
+            await self._shared.replace_one(
+                {'_id': key},
+                {
+                    '_id': key,
+                    'value': entry.value,
+                    'fetched_at': entry.fetched_at,
+                    'expires_at': entry.expires_at,
+                    'purge_at': purge_at
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Shared TMDB cache write failed: {e}")
+
+    async def _store(self, key: str, value: Any, ttl: int):
+        now = time.time()
+        entry = CacheEntry(value, now, now + ttl)
+        self._set_local(key, entry)
+        await self._set_shared(key, entry)
+
+    async def _fetch_and_store(self, key: str, ttl: int, fetcher: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetcher()
+        if value is not None:
+            await self._store(key, value, ttl)
+        return value
+
+    def _schedule_refresh(self, key: str, ttl: int, fetcher: Callable[[], Awaitable[Any]]):
+        """Start a background refresh for key unless one is already running"""
+        if key in self._refreshing:
+            return
+        self.stats['refreshes'] += 1
+        task = asyncio.create_task(self._fetch_and_store(key, ttl, fetcher))
+        self._refreshing[key] = task
+
+        def _done(t: asyncio.Task):
+            self._refreshing.pop(key, None)
+            if not t.cancelled() and t.exception() is not None:
+                logger.warning(f"Background refresh of {key} failed: {t.exception()}")
+
+        task.add_done_callback(_done)
+
+    async def get_or_fetch(self, key: str, ttl: int, fetcher: Callable[[], Awaitable[Any]]) -> Any:
+        """Return a cached value for key, fetching it (or refreshing it in the background) as needed"""
+        now = time.time()
+        entry = self._get_local(key)
+        from_shared = False
+        if entry is None or not entry.is_fresh(now):
+            shared_entry = await self._get_shared(key)
+            if shared_entry is not None and (entry is None or shared_entry.fetched_at > entry.fetched_at):
+                entry = shared_entry
+                from_shared = True
+                self._set_local(key, entry)
+
+        if entry is not None and entry.is_fresh(now):
+            self.stats['shared_hits' if from_shared else 'hits'] += 1
+            return entry.value
+
+        if entry is not None and entry.is_servable(now):
+            self.stats['stale_hits'] += 1
+            self._schedule_refresh(key, ttl, fetcher)
+            return entry.value
+
+        self.stats['misses'] += 1
+        return await self._fetch_and_store(key, ttl, fetcher)
+
+    async def refresh(self, key: str, ttl: int, fetcher: Callable[[], Awaitable[Any]]) -> Any:
+        """Fetch key upstream now and overwrite any cached value"""
+        return await self._fetch_and_store(key, ttl, fetcher)
+
+    def expires_within(self, key: str, seconds: float) -> bool:
+        """Whether the locally cached value is missing or goes stale within `seconds`"""
+        entry = self._entries.get(key)
+        return entry is None or entry.expires_at - time.time() < seconds
+
+    def clear(self):
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current size and hit/miss counters"""
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'refreshing': len(self._refreshing),
+            'shared_tier': self._shared is not None,
+            **self.stats
+        }
+
+
+tmdb_cache = TMDBCache()
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+import logging
+from typing import Any, Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-key budget: sustained requests/second and burst size
+TMDB_KEY_RATE = float(os.environ.get('TMDB_KEY_RATE', '35'))
+TMDB_KEY_BURST = float(os.environ.get('TMDB_KEY_BURST', '40'))
+TMDB_MAX_QUEUE = int(os.environ.get('TMDB_MAX_QUEUE', '200'))
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no API key has budget before the caller's deadline"""
+
+
+class KeyBucket:
+    """Token bucket for a single TMDB API key"""
+
+    def __init__(self, key: str, rate: float, burst: float):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+
+    def refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def available(self, now: float) -> bool:
+        return now >= self.blocked_until and self.tokens >= 1
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until this key can serve one request"""
+        refill_wait = max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else float('inf')
+        return max(self.blocked_until - now, refill_wait, 0.0)
+
+
+class TMDBRateLimiter:
+    """Spread TMDB calls across API keys by remaining budget, queueing when all are saturated"""
+
+    def __init__(self, keys: List[str], rate: float = TMDB_KEY_RATE, burst: float = TMDB_KEY_BURST,
+                 max_queue: int = TMDB_MAX_QUEUE):
+        self.buckets = {key: KeyBucket(key, rate, burst) for key in keys}
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.stats = {'acquired': 0, 'queued': 0, 'timeouts': 0, 'rejected': 0, 'throttled': 0}
+
+    def _pick(self, now: float, exclude: Optional[str] = None) -> Optional[KeyBucket]:
+        best = None
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+            if bucket.key == exclude or not bucket.available(now):
+                continue
+            if best is None or bucket.tokens > best.tokens:
+                best = bucket
+        return best
+
+    async def acquire(self, deadline: float, exclude: Optional[str] = None) -> str:
+        """Take one token from the key with the most budget, waiting until deadline (monotonic)"""
+        now = time.monotonic()
+        bucket = self._pick(now, exclude)
+        if bucket is None:
+            if self.waiting >= self.max_queue:
+                self.stats['rejected'] += 1
+                raise RateLimitTimeout("TMDB request queue is full")
+            self.waiting += 1
+            self.stats['queued'] += 1
+            try:
+                while bucket is None:
+                    candidates = [b for b in self.buckets.values() if b.key != exclude] or list(self.buckets.values())
+                    wait = min(b.wait_time(now) for b in candidates)
+                    if now + wait > deadline:
+                        self.stats['timeouts'] += 1
+                        raise RateLimitTimeout("No TMDB API key budget before deadline")
+                    await asyncio.sleep(max(wait, 0.005))
+                    now = time.monotonic()
+                    bucket = self._pick(now, exclude)
+            finally:
+                self.waiting -= 1
+
+        bucket.tokens -= 1
+        self.stats['acquired'] += 1
+        return bucket.key
+
+    def record_response(self, key: str, status_code: int, headers: Mapping[str, str]):
+        """Fold upstream rate-limit feedback (429, Retry-After, X-RateLimit-*) into the key's bucket"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return
+        now = time.monotonic()
+
+        remaining = _parse_float(headers.get('x-ratelimit-remaining'))
+        if remaining is not None:
+            bucket.tokens = min(bucket.tokens, remaining)
+
+        reset = _parse_float(headers.get('x-ratelimit-reset'))
+        if remaining is not None and remaining < 1 and reset is not None:
+            bucket.blocked_until = max(bucket.blocked_until, now + max(0.0, reset - time.time()))
+
+        if status_code == 429:
+            retry_after = _parse_float(headers.get('retry-after'))
+            bucket.tokens = 0
+            bucket.blocked_until = max(bucket.blocked_until, now + (retry_after or DEFAULT_RETRY_AFTER))
+            bucket.throttled += 1
+            self.stats['throttled'] += 1
+            logger.info(f"TMDB key ...{key[-4:]} throttled for {bucket.blocked_until - now:.1f}s")
+
+    def remaining_budget(self) -> float:
+        """Total tokens currently available across unblocked keys"""
+        now = time.monotonic()
+        total = 0.0
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+            if now >= bucket.blocked_until:
+                total += bucket.tokens
+        return total
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-key budget and queue depth"""
+        now = time.monotonic()
+        keys = []
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+            keys.append({
+                'key': f"...{bucket.key[-4:]}",
+                'tokens': round(bucket.tokens, 2),
+                'burst': bucket.burst,
+                'blocked_for': round(max(0.0, bucket.blocked_until - now), 2),
+                'throttled': bucket.throttled
+            })
+        return {'keys': keys, 'queue_depth': self.waiting, 'max_queue': self.max_queue, **self.stats}
+
+
+def _parse_float(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -1,6 +1,20 @@
-import requests
-from typing import List, Dict, Optional
+import asyncio
+import os
+import time
+import httpx
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Optional, Tuple
 import logging
+from tmdb_cache import tmdb_cache, endpoint_family, get_ttl, make_cache_key
+from single_flight import SingleFlight
+from tmdb_rate_limiter import TMDBRateLimiter, RateLimitTimeout
+from title_index import title_index
+from models.movie import MovieCard, MovieDetails
+from circuit_breaker import BreakerGroup
+from upstream_latency import UpstreamLatency
+import request_deadline
+from tmdb_snapshots import tmdb_snapshots
 
 logger = logging.getLogger(__name__)
 
@@ -9,154 +23,334 @@ TMDB_API_KEYS = [
     'c8dea14dc917687ac631a52620e4f7ad',
     '3cb41ecea3bf606c56552db3d17adefd'
 ]
-CURRENT_KEY_INDEX = 0
 TMDB_BASE_URL = 'https://api.themoviedb.org/3'
-TMDB_IMAGE_BASE_URL = 'https://image.tmdb.org/t/p/original'
-
-def get_api_key():
-    """Get current TMDB API key with rotation on rate limit"""
-    return TMDB_API_KEYS[CURRENT_KEY_INDEX]
-
-def rotate_api_key():
-    """Rotate to next API key on rate limit"""
-    global CURRENT_KEY_INDEX
-    CURRENT_KEY_INDEX = (CURRENT_KEY_INDEX + 1) % len(TMDB_API_KEYS)
-    logger.info(f"Rotated to API key index: {CURRENT_KEY_INDEX}")
-
-def make_tmdb_request(endpoint: str, params: Dict = None) -> Optional[Dict]:
-    """Make request to TMDB API with error handling and key rotation"""
-    if params is None:
-        params = {}
+TMDB_IMAGE_BASE_URL = 'https://image.tmdb.org/t/p'
+
+# Right-sized TMDB image buckets per display context
+POSTER_SIZE = os.environ.get('TMDB_POSTER_SIZE', 'w342')
+BACKDROP_SIZE = os.environ.get('TMDB_BACKDROP_SIZE', 'w1280')
+# Opt-in: route images through /api/images (local disk cache) instead of linking TMDB's CDN.
+# Proxied URLs are relative, so only enable it where the frontend shares the API's origin.
+TMDB_IMAGE_PROXY = os.environ.get('TMDB_IMAGE_PROXY', 'false').lower() in ('1', 'true', 'yes')
+
+# TMDB Genre IDs for the genre category rows
+GENRE_MAP = {
+    'action': 28,
+    'comedy': 35,
+    'documentary': 99,
+    'horror': 27,
+    'romance': 10749,
+    'thriller': 53,
+    'drama': 18,
+    'scifi': 878
+}
+
+# HTTP client configuration
+TMDB_TIMEOUT = float(os.environ.get('TMDB_TIMEOUT', '10'))
+TMDB_CONNECT_TIMEOUT = float(os.environ.get('TMDB_CONNECT_TIMEOUT', '3'))
+TMDB_MAX_CONNECTIONS = int(os.environ.get('TMDB_MAX_CONNECTIONS', '20'))
+TMDB_MAX_KEEPALIVE = int(os.environ.get('TMDB_MAX_KEEPALIVE', '10'))
+TMDB_MAX_CONCURRENCY = int(os.environ.get('TMDB_MAX_CONCURRENCY', '16'))
+# How long a request may queue for API key budget before giving up
+TMDB_QUEUE_TIMEOUT = float(os.environ.get('TMDB_QUEUE_TIMEOUT', '5'))
+
+_http_client: Optional[httpx.AsyncClient] = None
+_request_semaphore: Optional[asyncio.Semaphore] = None
+
+# Identical concurrent upstream calls share one fetch
+tmdb_flight = SingleFlight()
+
+# Per-key token buckets shared by every TMDB call
+tmdb_rate_limiter = TMDBRateLimiter(TMDB_API_KEYS)
+
+# One breaker per endpoint family; each trips on timeouts, connection errors and 5xx responses
+tmdb_breakers = BreakerGroup('tmdb')
+
+# Recent latency per endpoint family, which decides when to hedge
+tmdb_latency = UpstreamLatency()
+
+# Set by refresh_ahead(); None means normal cache reads
+_refresh_horizon: ContextVar[Optional[float]] = ContextVar('tmdb_refresh_horizon', default=None)
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared keep-alive HTTP client for TMDB, creating it on first use"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=TMDB_BASE_URL,
+            timeout=httpx.Timeout(TMDB_TIMEOUT, connect=TMDB_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=TMDB_MAX_CONNECTIONS,
+                max_keepalive_connections=TMDB_MAX_KEEPALIVE
+            )
+        )
+    return _http_client
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore bounding concurrent in-flight TMDB requests"""
+    global _request_semaphore
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(TMDB_MAX_CONCURRENCY)
+    return _request_semaphore
+
+async def close_http_client():
+    """Close the shared TMDB HTTP client and its connection pool"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def _attempt(client: httpx.AsyncClient, endpoint: str, params: Dict, api_key: str, timeout) -> httpx.Response:
+    async with _get_semaphore():
+        response = await client.get(endpoint, params={**params, 'api_key': api_key}, timeout=timeout)
+    tmdb_rate_limiter.record_response(api_key, response.status_code, response.headers)
+    return response
+
+async def _first_good(tasks: List[asyncio.Task]) -> Tuple[httpx.Response, asyncio.Task]:
+    """First response that isn't a 429/5xx; otherwise the last outcome (raising its error)"""
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last = task
+                if task.exception() is None and task.result().status_code < 500 and task.result().status_code != 429:
+                    return task.result(), task
+        return last.result(), last
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def _hedged_attempt(client: httpx.AsyncClient, endpoint: str, params: Dict, api_key: str, timeout, family: str) -> httpx.Response:
+    """Send one request; if it outlives the family's tail latency, race a copy on another API key"""
+    started = time.monotonic()
+    primary = asyncio.ensure_future(_attempt(client, endpoint, params, api_key, timeout))
+    tasks = [primary]
+    try:
+        hedge_after = tmdb_latency.hedge_delay(family)
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                try:
+                    # Only hedge on budget that is free right now
+                    other_key = await tmdb_rate_limiter.acquire(time.monotonic(), exclude=api_key)
+                    tasks.append(asyncio.ensure_future(_attempt(client, endpoint, params, other_key, timeout)))
+                    tmdb_latency.stats['hedged'] += 1
+                except RateLimitTimeout:
+                    tmdb_latency.stats['hedge_skipped'] += 1
+        response, winner = await _first_good(tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    if winner is not primary:
+        tmdb_latency.stats['hedge_wins'] += 1
+    if response.status_code < 500:
+        tmdb_latency.record(family, time.monotonic() - started)
+    return response
+
+async def _fetch_from_tmdb(endpoint: str, params: Dict = None, timeout: Optional[float] = None) -> Optional[Dict]:
+    """Make request to TMDB API with per-family circuit breaking, hedging, rate limiting and deadlines"""
+    params = dict(params) if params else {}
+    client = get_http_client()
+    family = endpoint_family(endpoint)
+    breaker = tmdb_breakers.get(family)
+    
+    budget = request_deadline.remaining()
+    if budget is not None and budget <= 0:
+        logger.warning(f"TMDB request to {endpoint} skipped: caller deadline already passed")
+        return None
+    deadline = time.monotonic() + (TMDB_QUEUE_TIMEOUT if budget is None else min(TMDB_QUEUE_TIMEOUT, budget))
     
-    params['api_key'] = get_api_key()
-    url = f"{TMDB_BASE_URL}{endpoint}"
+    # While this family is unhealthy, fail fast instead of queueing more calls behind it
+    if not breaker.allow():
+        logger.warning(f"TMDB circuit '{family}' open; not calling {endpoint}")
+        return None
+    
+    request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+    
+    async def send() -> httpx.Response:
+        # A 429 blocks that key in the limiter, so each retry lands on a different key or waits
+        for _ in range(len(TMDB_API_KEYS) + 1):
+            api_key = await tmdb_rate_limiter.acquire(deadline)
+            response = await _hedged_attempt(client, endpoint, params, api_key, request_timeout, family)
+            if response.status_code != 429:
+                break
+        return response
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 429:  # Rate limit
-            rotate_api_key()
-            params['api_key'] = get_api_key()
-            response = requests.get(url, params=params, timeout=10)
-        
+        response = await (send() if budget is None else asyncio.wait_for(send(), budget))
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        data = response.json()
+    except RateLimitTimeout as e:
+        breaker.release()
+        logger.warning(f"TMDB request to {endpoint} not sent: {e}")
+        return None
+    except asyncio.TimeoutError:
+        # Running out of the caller's budget says nothing about TMDB's health
+        breaker.release()
+        logger.warning(f"TMDB request to {endpoint} abandoned at the caller's deadline")
+        return None
+    except httpx.HTTPStatusError as e:
+        # A 4xx is our request's fault; only 5xx counts against TMDB's health
+        if e.response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
         logger.error(f"TMDB API request failed: {e}")
         return None
+    except (httpx.HTTPError, ValueError) as e:
+        # ValueError: a 2xx whose body is not JSON (e.g. an error page from a proxy in between)
+        breaker.record_failure()
+        logger.error(f"TMDB API request failed: {e}")
+        return None
+    except BaseException:
+        # Anything else (including cancellation) must not leave a half-open probe slot taken
+        breaker.release()
+        raise
+    breaker.record_success()
+    return data
+
+@contextmanager
+def refresh_ahead(seconds: float):
+    """Within this block, refetch any cached response that would go stale in the next `seconds`"""
+    token = _refresh_horizon.set(seconds)
+    try:
+        yield
+    finally:
+        _refresh_horizon.reset(token)
+
+async def make_tmdb_request(endpoint: str, params: Dict = None, timeout: Optional[float] = None) -> Optional[Dict]:
+    """Make cached request to TMDB API; stale entries are served while refreshing in the background"""
+    key = make_cache_key(endpoint, params)
+    ttl = get_ttl(endpoint_family(endpoint))
+    fetcher = lambda: tmdb_flight.do(key, lambda: _fetch_from_tmdb(endpoint, params, timeout))
+    horizon = _refresh_horizon.get()
+    if horizon is not None and tmdb_cache.expires_within(key, horizon):
+        return await tmdb_cache.refresh(key, ttl, fetcher)
+    return await tmdb_cache.get_or_fetch(key, ttl, fetcher)
+
+def _image_prefix(size: str) -> str:
+    return f"/api/images/{size}" if TMDB_IMAGE_PROXY else f"{TMDB_IMAGE_BASE_URL}/{size}"
+
+# Built once; mapping a title is then two string concatenations
+_POSTER_PREFIX = _image_prefix(POSTER_SIZE)
+_BACKDROP_PREFIX = _image_prefix(BACKDROP_SIZE)
+
+def image_url(path: Optional[str], size: str) -> Optional[str]:
+    """Build a proxied (or direct CDN) URL for a TMDB image path at a size bucket"""
+    if not path:
+        return None
+    return _image_prefix(size) + path
 
-def map_movie_to_frontend(movie: Dict, media_type: str = 'movie') -> Dict:
+def map_movie_to_frontend(movie: Dict, media_type: str = 'movie') -> MovieCard:
     """Map TMDB movie/series object to frontend format"""
-    title = movie.get('title') or movie.get('name', 'Unknown')
-    year = movie.get('release_date', movie.get('first_air_date', ''))
-    year = year[:4] if year else '2024'
-    
+    get = movie.get
+    date = get('release_date') or get('first_air_date')
     # Convert vote_average (0-10) to match percentage (0-100)
-    vote_avg = movie.get('vote_average', 7.0)
-    match = int(vote_avg * 10)
-    
-    # Determine rating based on adult flag and vote
-    if movie.get('adult', False):
-        rating = 'R'
-    elif vote_avg >= 8:
-        rating = 'TV-MA'
-    elif vote_avg >= 6:
-        rating = 'TV-14'
-    else:
-        rating = 'PG-13'
-    
-    backdrop = movie.get('backdrop_path')
-    poster = movie.get('poster_path')
+    vote_avg = get('vote_average', 7.0)
+    backdrop = get('backdrop_path')
+    poster = get('poster_path')
     
     return {
-        'id': movie.get('id'),
-        'title': title,
-        'description': movie.get('overview', ''),
-        'backdrop': f"{TMDB_IMAGE_BASE_URL}{backdrop}" if backdrop else None,
-        'poster': f"{TMDB_IMAGE_BASE_URL}{poster}" if poster else None,
-        'rating': rating,
-        'year': int(year),
-        'match': match,
+        'id': get('id'),
+        'title': get('title') or get('name', 'Unknown'),
+        'description': get('overview', ''),
+        'backdrop': _BACKDROP_PREFIX + backdrop if backdrop else None,
+        'poster': _POSTER_PREFIX + poster if poster else None,
+        # Rating from the adult flag, then vote average
+        'rating': 'R' if get('adult', False) else 'TV-MA' if vote_avg >= 8 else 'TV-14' if vote_avg >= 6 else 'PG-13',
+        'year': int(date[:4]) if date else 2024,
+        'match': int(vote_avg * 10),
         'media_type': media_type
     }
 
-def get_trending_movies(limit: int = 20) -> List[Dict]:
-    """Get trending movies and series"""
-    data = make_tmdb_request('/trending/all/week')
-    if not data or 'results' not in data:
-        return []
-    
-    movies = []
-    for item in data['results'][:limit]:
-        media_type = item.get('media_type', 'movie')
-        movies.append(map_movie_to_frontend(item, media_type))
-    
+def map_results(items: List[Dict], media_type: Optional[str] = None) -> List[MovieCard]:
+    """Map a whole TMDB results array; media_type=None keeps each item's own (trending mixes movies and series)"""
+    to_card = map_movie_to_frontend
+    if media_type is not None:
+        return [to_card(item, media_type) for item in items]
+    return [to_card(item, item.get('media_type', 'movie')) for item in items]
+
+def _map_results(data: Dict, media_type: Optional[str] = None) -> Optional[List[MovieCard]]:
+    if 'results' not in data:
+        return None
+    return map_results(data['results'], media_type)
+
+async def _get_results(endpoint: str, params: Optional[Dict], limit: int, media_type: Optional[str] = None) -> List[MovieCard]:
+    data = await make_tmdb_request(endpoint, params)
+    movies = await tmdb_snapshots.resolve(endpoint, params, data, lambda d: _map_results(d, media_type))
+    movies = (movies or [])[:limit]
+    title_index.add_many(movies)
     return movies
 
-def get_popular_movies(limit: int = 20) -> List[Dict]:
+async def get_trending_movies(limit: int = 20) -> List[MovieCard]:
+    """Get trending movies and series"""
+    return await _get_results('/trending/all/week', None, limit)
+
+async def get_popular_movies(limit: int = 20) -> List[MovieCard]:
     """Get popular movies"""
-    data = make_tmdb_request('/movie/popular')
-    if not data or 'results' not in data:
-        return []
-    
-    return [map_movie_to_frontend(movie, 'movie') for movie in data['results'][:limit]]
+    return await _get_results('/movie/popular', None, limit, 'movie')
 
-def get_movies_by_genre(genre_id: int, limit: int = 20) -> List[Dict]:
+async def get_movies_by_genre(genre_id: int, limit: int = 20) -> List[MovieCard]:
     """Get movies by genre ID"""
     params = {
         'with_genres': genre_id,
         'sort_by': 'popularity.desc'
     }
-    data = make_tmdb_request('/discover/movie', params)
-    if not data or 'results' not in data:
-        return []
-    
-    return [map_movie_to_frontend(movie, 'movie') for movie in data['results'][:limit]]
+    return await _get_results('/discover/movie', params, limit, 'movie')
 
-def get_category_movies(category: str, limit: int = 20) -> List[Dict]:
+async def get_category_movies(category: str, limit: int = 20) -> List[MovieCard]:
     """Get movies by category name"""
-    # TMDB Genre IDs
-    genre_map = {
-        'action': 28,
-        'comedy': 35,
-        'documentary': 99,
-        'horror': 27,
-        'romance': 10749,
-        'thriller': 53,
-        'drama': 18,
-        'scifi': 878
-    }
-    
     if category == 'trending':
-        return get_trending_movies(limit)
+        return await get_trending_movies(limit)
     elif category == 'popular':
-        return get_popular_movies(limit)
-    elif category in genre_map:
-        return get_movies_by_genre(genre_map[category], limit)
+        return await get_popular_movies(limit)
+    elif category in GENRE_MAP:
+        return await get_movies_by_genre(GENRE_MAP[category], limit)
     else:
-        return get_popular_movies(limit)
+        return await get_popular_movies(limit)
 
-def search_movies(query: str, limit: int = 20) -> List[Dict]:
-    """Search movies and series by query"""
+def _map_search_results(data: Dict) -> Optional[Dict]:
+    if 'results' not in data:
+        return None
+    results = [
+        map_movie_to_frontend(item, item['media_type'])
+        for item in data['results']
+        if item.get('media_type') in ('movie', 'tv')
+    ]
+    return {'results': results, 'complete': data.get('total_results', 0) <= len(data['results'])}
+
+async def _search(query: str) -> Optional[Dict]:
     params = {'query': query}
-    data = make_tmdb_request('/search/multi', params)
-    if not data or 'results' not in data:
-        return []
-    
-    results = []
-    for item in data['results'][:limit]:
-        if item.get('media_type') in ['movie', 'tv']:
-            results.append(map_movie_to_frontend(item, item.get('media_type')))
-    
-    return results
+    data = await make_tmdb_request('/search/multi', params)
+    page = await tmdb_snapshots.resolve('/search/multi', params, data, _map_search_results)
+    if page:
+        title_index.add_many(page['results'])
+    return page
 
-def get_movie_details(movie_id: int, media_type: str = 'movie') -> Optional[Dict]:
-    """Get detailed movie information"""
-    endpoint = f'/{media_type}/{movie_id}'
-    data = make_tmdb_request(endpoint)
-    if not data:
-        return None
+async def search_movies(query: str, limit: int = 20) -> List[MovieCard]:
+    """Search movies and series by query"""
+    page = await _search(query)
+    return page['results'][:limit] if page else []
+
+async def search_first_page(query: str) -> Tuple[List[MovieCard], bool]:
+    """First page of search results, and whether that page is TMDB's complete result set"""
+    page = await _search(query)
+    if not page:
+        return [], False
+    return page['results'], page['complete']
+
+def find_trailer_url(videos: List[Dict]) -> Optional[str]:
+    """Pick the first YouTube trailer or teaser from a TMDB videos list"""
+    for video in videos:
+        if video.get('site') == 'YouTube' and video.get('type') in ['Trailer', 'Teaser']:
+            video_key = video.get('key')
+            if video_key:
+                return f"https://www.youtube.com/watch?v={video_key}"
     
+    return None
+
+def _map_details(data: Dict, media_type: str) -> MovieDetails:
     movie = map_movie_to_frontend(data, media_type)
     
     # Add additional details
@@ -173,20 +367,34 @@ def get_movie_details(movie_id: int, media_type: str = 'movie') -> Optional[Dict
     genres = data.get('genres', [])
     movie['genres'] = [g['name'] for g in genres]
     
+    # Trailer comes from the appended videos
+    movie['trailer'] = find_trailer_url((data.get('videos') or {}).get('results', []))
+    
     return movie
 
-def get_movie_trailer(movie_id: int, media_type: str = 'movie') -> Optional[str]:
+async def get_movie_details(movie_id: int, media_type: str = 'movie') -> Optional[MovieDetails]:
+    """Get detailed movie information, including the trailer, in a single upstream call"""
+    endpoint = f'/{media_type}/{movie_id}'
+    params = {'append_to_response': 'videos'}
+    data = await make_tmdb_request(endpoint, params)
+    return await tmdb_snapshots.resolve(endpoint, params, data, lambda d: _map_details(d, media_type))
+
+async def get_movie_trailer(movie_id: int, media_type: str = 'movie') -> Optional[str]:
     """Get YouTube trailer URL for a movie"""
     endpoint = f'/{media_type}/{movie_id}/videos'
-    data = make_tmdb_request(endpoint)
+    data = await make_tmdb_request(endpoint)
     if not data or 'results' not in data:
         return None
     
-    # Find YouTube trailer
-    for video in data['results']:
-        if video.get('site') == 'YouTube' and video.get('type') in ['Trailer', 'Teaser']:
-            video_key = video.get('key')
-            if video_key:
-                return f"https://www.youtube.com/watch?v={video_key}"
-    
-    return None
+    return find_trailer_url(data['results'])
+
+async def prefetch_movie_details(movies: List[Dict], count: int):
+    """Warm the details cache for the first `count` titles of a row"""
+    targets = [
+        m for m in movies[:count]
+        if m.get('id') is not None and m.get('media_type') in ('movie', 'tv')
+    ]
+    await asyncio.gather(
+        *[get_movie_details(m['id'], m['media_type']) for m in targets],
+        return_exceptions=True
+    )
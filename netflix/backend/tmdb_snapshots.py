@@ -0,0 +1,134 @@
+import asyncio
+import os
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from tmdb_cache import TMDB_CACHE_MAX_ENTRIES, endpoint_family, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Search snapshots are unbounded by nature, so they age out; catalogue rows and details are kept
+TMDB_SNAPSHOT_SEARCH_RETENTION = int(os.environ.get('TMDB_SNAPSHOT_SEARCH_RETENTION', str(7 * 86400)))
+
+
+class Staleness:
+    """Collects whether any value served in the current request came from a snapshot"""
+    __slots__ = ('stale', 'as_of')
+
+    def __init__(self):
+        self.stale = False
+        self.as_of: Optional[datetime] = None
+
+    def mark(self, fetched_at: Optional[datetime]):
+        self.stale = True
+        if fetched_at is not None and (self.as_of is None or fetched_at < self.as_of):
+            self.as_of = fetched_at
+
+    def fields(self) -> Dict[str, Any]:
+        """Extra response fields; empty when everything was live"""
+        if not self.stale:
+            return {}
+        return {'stale': True, 'stale_as_of': self.as_of.isoformat() if self.as_of else None}
+
+
+_staleness: ContextVar[Optional[Staleness]] = ContextVar('tmdb_staleness', default=None)
+
+
+@contextmanager
+def track_staleness():
+    """Collect snapshot fallbacks made inside the block (including tasks it spawns)"""
+    staleness = Staleness()
+    token = _staleness.set(staleness)
+    try:
+        yield staleness
+    finally:
+        _staleness.reset(token)
+
+
+class SnapshotStore:
+    """Last-known-good mapped TMDB responses in MongoDB, keyed like the TMDB cache"""
+
+    def __init__(self):
+        self._collection = None
+        # Raw response last persisted per key; cache hits hand back the same object, so skip rewriting it
+        self._persisted: 'OrderedDict[str, Any]' = OrderedDict()
+        self._tasks = set()
+        self.stats = {'writes': 0, 'write_errors': 0, 'fallbacks': 0, 'fallback_misses': 0}
+
+    def configure(self, collection):
+        self._collection = collection
+        self._persisted.clear()
+
+    async def _save(self, key: str, endpoint: str, params: Optional[Dict], value: Any):
+        now = datetime.now(timezone.utc)
+        update = {
+            '$set': {'endpoint': endpoint, 'params': params or {}, 'value': value, 'fetched_at': now},
+            '$inc': {'version': 1}
+        }
+        if endpoint_family(endpoint) == 'search':
+            update['$set']['purge_at'] = now + timedelta(seconds=TMDB_SNAPSHOT_SEARCH_RETENTION)
+        try:
+            await self._collection.update_one({'_id': key}, update, upsert=True)
+            self.stats['writes'] += 1
+        except Exception as e:
+            self.stats['write_errors'] += 1
+            self._persisted.pop(key, None)
+            logger.warning(f"TMDB snapshot write for {key} failed: {e}")
+
+    def _schedule_save(self, key: str, endpoint: str, params: Optional[Dict], value: Any):
+        task = asyncio.create_task(self._save(key, endpoint, params, value))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, key: str) -> Optional[Dict]:
+        if self._collection is None:
+            return None
+        try:
+            return await self._collection.find_one({'_id': key}, {'value': 1, 'fetched_at': 1})
+        except Exception as e:
+            logger.warning(f"TMDB snapshot read for {key} failed: {e}")
+            return None
+
+    async def resolve(
+        self,
+        endpoint: str,
+        params: Optional[Dict],
+        data: Optional[Dict],
+        mapper: Callable[[Dict], Any]
+    ) -> Optional[Any]:
+        """Map a TMDB response and persist it, or fall back to the last snapshot when it is missing"""
+        key = make_cache_key(endpoint, params)
+        if data:
+            value = mapper(data)
+            if value is not None:
+                if self._collection is not None:
+                    unchanged = self._persisted.get(key) is data
+                    self._persisted[key] = data
+                    # Most recently used last, so eviction drops the least recently used key
+                    self._persisted.move_to_end(key)
+                    if not unchanged:
+                        if len(self._persisted) > TMDB_CACHE_MAX_ENTRIES:
+                            self._persisted.popitem(last=False)
+                        self._schedule_save(key, endpoint, params, value)
+                return value
+
+        doc = await self._load(key)
+        if doc is None:
+            self.stats['fallback_misses'] += 1
+            return None
+        self.stats['fallbacks'] += 1
+        staleness = _staleness.get()
+        if staleness is not None:
+            staleness.mark(doc.get('fetched_at'))
+        logger.info(f"Serving TMDB snapshot for {key} from {doc.get('fetched_at')}")
+        return doc['value']
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'enabled': self._collection is not None, 'tracked_keys': len(self._persisted), **self.stats}
+
+
+tmdb_snapshots = SnapshotStore()
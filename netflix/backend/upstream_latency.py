@@ -0,0 +1,49 @@
+import os
+from collections import deque
+from typing import Any, Dict, Optional
+
+TMDB_HEDGE_ENABLED = os.environ.get('TMDB_HEDGE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Hedge once a call outlives this percentile of recent latencies for its endpoint family
+TMDB_HEDGE_PERCENTILE = float(os.environ.get('TMDB_HEDGE_PERCENTILE', '0.95'))
+TMDB_HEDGE_MIN_SAMPLES = int(os.environ.get('TMDB_HEDGE_MIN_SAMPLES', '20'))
+TMDB_HEDGE_MIN_DELAY = float(os.environ.get('TMDB_HEDGE_MIN_DELAY', '0.05'))
+TMDB_LATENCY_WINDOW = int(os.environ.get('TMDB_LATENCY_WINDOW', '200'))
+
+
+class UpstreamLatency:
+    """Sliding windows of upstream latency per endpoint family, used to time hedged requests"""
+
+    def __init__(self, window: int = TMDB_LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self.stats = {'hedged': 0, 'hedge_wins': 0, 'hedge_skipped': 0}
+
+    def record(self, family: str, seconds: float):
+        samples = self._samples.get(family)
+        if samples is None:
+            samples = self._samples[family] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, family: str, p: float) -> Optional[float]:
+        samples = self._samples.get(family)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def hedge_delay(self, family: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off or there is too little data"""
+        if not TMDB_HEDGE_ENABLED or len(self._samples.get(family, ())) < TMDB_HEDGE_MIN_SAMPLES:
+            return None
+        return max(TMDB_HEDGE_MIN_DELAY, self.percentile(family, TMDB_HEDGE_PERCENTILE))
+
+    def snapshot(self) -> Dict[str, Any]:
+        families = {}
+        for family, samples in self._samples.items():
+            families[family] = {
+                'samples': len(samples),
+                'p50_ms': round(self.percentile(family, 0.5) * 1000, 1),
+                'p95_ms': round(self.percentile(family, 0.95) * 1000, 1),
+                'p99_ms': round(self.percentile(family, 0.99) * 1000, 1)
+            }
+        return {'hedging': TMDB_HEDGE_ENABLED, 'families': families, **self.stats}
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+
+# Module-level config is read at import time, so point every on-disk location at scratch space first
+_scratch = Path(tempfile.mkdtemp(prefix='netflix-tests-'))
+os.environ.setdefault('STORAGE_ROOT', str(_scratch / 'uploads'))
+os.environ.setdefault('IMAGE_CACHE_DIR', str(_scratch / 'image_cache'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'netflix_test')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-signing-key-0123456789abcdef0123456789')
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+def db():
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()['netflix_test']
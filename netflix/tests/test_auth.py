@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import httpx
+import jwt
+import pytest
+from fastapi import Depends, FastAPI
+
+import auth_tokens
+from auth_tokens import RevocationList, TokenClaimsCache, token_digest
+from database import get_db
+from routes import auth
+from routes.auth import require_admin
+
+pytestmark = pytest.mark.anyio
+
+
+def _token(role='admin', ttl=3600, **claims):
+    return jwt.encode({'exp': int(time.time()) + ttl, 'role': role, **claims}, auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+
+
+async def test_claims_cache_is_lru_and_bounded_by_token_expiry():
+    cache = TokenClaimsCache(max_entries=2, max_ttl=300)
+    cache.put('a', {'role': 'admin'})
+    cache.put('b', {'role': 'admin'})
+    assert cache.get('a') == {'role': 'admin'}
+
+    cache.put('c', {'role': 'admin'})
+    assert cache.get('b') is None
+    assert cache.stats['evictions'] == 1
+
+    cache.put('expired', {'exp': time.time() - 1})
+    assert cache.get('expired') is None
+    assert cache.stats['expired'] == 1
+
+    cache.invalidate('c')
+    assert cache.get('c') is None
+    assert cache.stats['invalidations'] == 1
+
+
+async def test_max_ttl_caps_long_lived_tokens():
+    cache = TokenClaimsCache(max_ttl=0)
+    cache.put('a', {'exp': time.time() + 3600})
+
+    assert cache.get('a') is None
+
+
+async def test_revocation_reaches_other_processes_on_sync(db, monkeypatch):
+    monkeypatch.setattr(auth_tokens, 'AUTH_REVOCATION_SYNC_INTERVAL', 0.05)
+    here = RevocationList(TokenClaimsCache())
+    there = RevocationList(TokenClaimsCache())
+    there.cache.put('t1', {'role': 'admin'})
+    await there.sync(db)
+
+    await here.revoke(db, 't1', time.time() + 3600)
+    assert here.is_revoked('t1')
+
+    # Within the interval the other process does not query again
+    await there.sync(db)
+    assert not there.is_revoked('t1')
+
+    await asyncio.sleep(0.06)
+    await there.sync(db)
+    assert there.is_revoked('t1')
+    assert there.cache.get('t1') is None
+
+
+async def test_expired_revocations_are_forgotten(db):
+    revocations = RevocationList(TokenClaimsCache())
+    await revocations.revoke(db, 't1', time.time() - 1)
+
+    assert not revocations.is_revoked('t1')
+    assert revocations.snapshot()['revoked'] == 0
+
+
+@pytest.fixture
+async def api(db, monkeypatch):
+    cache = TokenClaimsCache()
+    monkeypatch.setattr(auth, 'claims_cache', cache)
+    monkeypatch.setattr(auth, 'token_revocations', RevocationList(cache))
+    app = FastAPI()
+    app.include_router(auth.router, prefix='/api')
+    app.dependency_overrides[get_db] = lambda: db
+
+    @app.get('/admin')
+    async def admin(claims=Depends(require_admin)):
+        return claims
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        yield client
+
+
+def _bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+async def test_admin_routes_need_a_valid_admin_token(api):
+    missing = await api.get('/admin')
+    assert missing.status_code == 401 and missing.headers['www-authenticate'] == 'Bearer'
+
+    assert (await api.get('/admin', headers=_bearer('not-a-jwt'))).json()['detail'] == 'Invalid token'
+    assert (await api.get('/admin', headers=_bearer(_token(ttl=-10)))).json()['detail'] == 'Token expired'
+    assert (await api.get('/admin', headers=_bearer(_token(role='viewer')))).status_code == 403
+
+
+async def test_no_tokens_without_a_signing_key(api, monkeypatch):
+    token = _token()
+    monkeypatch.setattr(auth, 'SECRET_KEY', None)
+
+    assert (await api.post('/api/auth/login', json={'password': auth.ADMIN_PASSWORD})).status_code == 503
+    assert (await api.get('/admin', headers=_bearer(token))).status_code == 503
+
+
+async def test_claims_are_decoded_once_per_token(api, monkeypatch):
+    token = _token()
+    decodes = []
+    decode = jwt.decode
+    monkeypatch.setattr(jwt, 'decode', lambda *args, **kwargs: decodes.append(1) or decode(*args, **kwargs))
+
+    for _ in range(3):
+        assert (await api.get('/admin', headers=_bearer(token))).status_code == 200
+
+    assert len(decodes) == 1
+
+
+async def test_logins_in_the_same_second_get_distinct_tokens(api):
+    first = (await api.post('/api/auth/login', json={'password': auth.ADMIN_PASSWORD})).json()['token']
+    second = (await api.post('/api/auth/login', json={'password': auth.ADMIN_PASSWORD})).json()['token']
+
+    assert first != second
+    assert (await api.post('/api/auth/login', json={'password': 'wrong'})).status_code == 401
+
+
+async def test_revoked_token_is_refused_immediately(api, db):
+    token = (await api.post('/api/auth/login', json={'password': auth.ADMIN_PASSWORD})).json()['token']
+    other = _token(jti='other')
+    assert (await api.get('/admin', headers=_bearer(token))).status_code == 200
+
+    assert (await api.post('/api/auth/revoke', json={}, headers=_bearer(token))).status_code == 200
+
+    refused = await api.get('/admin', headers=_bearer(token))
+    assert refused.status_code == 401 and refused.json()['detail'] == 'Token revoked'
+    assert (await api.get('/admin', headers=_bearer(other))).status_code == 200
+    assert await db.revoked_tokens.find_one({'_id': token_digest(token)})
+
+    revoke_other = await api.post('/api/auth/revoke', json={'token': other}, headers=_bearer(other))
+    assert revoke_other.status_code == 200
+    assert (await api.post('/api/auth/verify', params={'token': other})).status_code == 401
@@ -0,0 +1,117 @@
+import asyncio
+import ipaddress
+import time
+
+import pytest
+
+import autocomplete
+from autocomplete import PrefixCache, SessionGovernor, client_ip
+
+pytestmark = pytest.mark.anyio
+
+
+def _doc(id, title):
+    return {'id': id, 'title': title, 'year': 2020, 'media_type': 'movie'}
+
+
+def test_longer_query_narrows_a_complete_cached_prefix():
+    cache = PrefixCache()
+    cache.put('star', [_doc(1, 'Star Wars'), _doc(2, 'Star Trek'), _doc(3, 'A Star Is Born')], complete=True)
+
+    rows = cache.lookup('star t', 8)
+
+    assert [row['id'] for row in rows] == [2]
+    assert cache.stats['prefix_hits'] == 1
+    # The narrowed list is cached under its own key
+    assert cache.lookup('star t', 8) == rows
+    assert cache.stats['hits'] == 1
+
+
+def test_incomplete_prefix_is_only_used_when_it_still_fills_the_page():
+    cache = PrefixCache()
+    cache.put('the', [_doc(1, 'The Matrix'), _doc(2, 'The Mummy')], complete=False)
+
+    assert cache.lookup('the m', 2) is not None
+    assert cache.lookup('the ma', 2) is None
+    assert cache.stats['misses'] == 1
+
+
+def test_entries_expire_and_evict_least_recently_used():
+    cache = PrefixCache(max_entries=2, ttl=60)
+    cache.put('a', [_doc(1, 'Alien')], True)
+    cache.put('b', [_doc(2, 'Brazil')], True)
+    cache.lookup('a', 8)
+    cache.put('c', [_doc(3, 'Cars')], True)
+    assert cache.lookup('b', 8) is None
+
+    expired = PrefixCache(ttl=0)
+    expired.put('a', [_doc(1, 'Alien')], True)
+    assert expired.lookup('a', 8) is None
+
+
+@pytest.fixture
+def proxies(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'TRUSTED_PROXIES', [ipaddress.ip_network('10.0.0.0/8')])
+
+
+def test_client_ip_only_believes_forwarded_for_from_trusted_proxies(proxies):
+    assert client_ip('10.1.2.3', '203.0.113.7') == '203.0.113.7'
+    # Entries the client wrote itself sit left of the address the ingress appended
+    assert client_ip('10.1.2.3', '1.1.1.1, 203.0.113.7') == '203.0.113.7'
+    assert client_ip('10.1.2.3', '203.0.113.7, 10.9.9.9') == '203.0.113.7'
+    # A direct client cannot claim another address
+    assert client_ip('198.51.100.4', '203.0.113.7') == '198.51.100.4'
+    assert client_ip(None, None) == 'unknown'
+
+
+async def test_lone_keystroke_is_not_delayed(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'SUGGEST_DEBOUNCE_MS', 1000)
+    governor = SessionGovernor()
+
+    started = time.monotonic()
+    async with governor.keystroke('s1') as latest:
+        assert latest is True
+    assert time.monotonic() - started < 0.5
+
+
+async def test_keystroke_during_an_in_flight_one_is_superseded_by_the_next(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'SUGGEST_DEBOUNCE_MS', 1000)
+    governor = SessionGovernor()
+    release_first = asyncio.Event()
+
+    async def first():
+        async with governor.keystroke('s1') as latest:
+            await release_first.wait()
+            return latest
+
+    async def typed():
+        async with governor.keystroke('s1') as latest:
+            return latest, time.monotonic()
+
+    first_task = asyncio.ensure_future(first())
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(typed())
+    await asyncio.sleep(0.01)
+    started = time.monotonic()
+    third, _ = await typed()
+    release_first.set()
+
+    assert await first_task is True
+    second_latest, settled_at = await second
+    assert second_latest is False
+    # The newer keystroke ended the wait right away instead of after the debounce window
+    assert settled_at - started < 0.5
+    assert third is True
+    assert governor.stats['debounced'] == 1
+
+
+def test_budget_is_per_client_whatever_session_ids_it_sends(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'SUGGEST_CLIENT_BURST', 2)
+    monkeypatch.setattr(autocomplete, 'SUGGEST_CLIENT_PER_MINUTE', 0)
+    governor = SessionGovernor()
+
+    assert governor.try_spend('203.0.113.7')
+    assert governor.try_spend('203.0.113.7')
+    assert not governor.try_spend('203.0.113.7')
+    assert governor.try_spend('198.51.100.4')
+    assert governor.stats['throttled'] == 1
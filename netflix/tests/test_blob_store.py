@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+
+import pytest
+
+import blob_store as blob_store_module
+from blob_store import BlobStore
+from storage import LocalStorage
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorage(tmp_path / 'root', tmp_path / 'scratch')
+
+
+def _source(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path, hashlib.sha256(data).hexdigest()
+
+
+async def test_identical_uploads_share_one_object_until_the_last_release(db, local, tmp_path):
+    blobs = BlobStore(local)
+    first, digest = _source(tmp_path, 'a', b'same bytes')
+    second, _ = _source(tmp_path, 'b', b'same bytes')
+
+    assert await blobs.ingest(db, first, digest, 10) is False
+    assert await blobs.ingest(db, second, digest, 10) is True
+    assert not second.exists()
+    path = local.local_path(blobs.key_for(digest))
+    assert (await db.blobs.find_one({'_id': digest}))['refs'] == 2
+
+    await blobs.release(db, digest)
+    assert path.exists()
+    await blobs.release(db, digest)
+    assert not path.exists()
+    assert await db.blobs.find_one({'_id': digest}) is None
+
+
+async def test_add_ref_needs_a_stored_object(db, local, tmp_path):
+    blobs = BlobStore(local)
+    source, digest = _source(tmp_path, 'a', b'payload')
+    assert await blobs.add_ref(db, digest) is False
+
+    await blobs.ingest(db, source, digest, 7)
+    assert await blobs.add_ref(db, digest) is True
+    assert (await db.blobs.find_one({'_id': digest}))['refs'] == 2
+
+    # A record whose object vanished hands its reference straight back
+    await local.delete(blobs.key_for(digest))
+    assert await blobs.add_ref(db, digest) is False
+    assert (await db.blobs.find_one({'_id': digest}))['refs'] == 2
+
+
+async def test_fresh_record_rewrites_an_object_left_behind_by_a_delete(db, local, tmp_path):
+    blobs = BlobStore(local)
+    source, digest = _source(tmp_path, 'a', b'new bytes')
+    path = local.local_path(blobs.key_for(digest))
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b'stale')
+
+    assert await blobs.ingest(db, source, digest, 9) is False
+    assert path.read_bytes() == b'new bytes'
+
+
+async def test_ingest_waits_for_another_process_to_finish_deleting(db, local, tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store_module, 'BLOB_INGEST_WAIT', 0.01)
+    # Separate instances have separate locks, like two worker processes
+    releaser, ingester = BlobStore(local), BlobStore(local)
+    source, digest = _source(tmp_path, 'a', b'contended')
+    await releaser.ingest(db, source, digest, 9)
+    path = local.local_path(releaser.key_for(digest))
+
+    unlink_started = asyncio.Event()
+    finish_unlink = asyncio.Event()
+    delete = local.delete
+
+    async def slow_delete(key):
+        unlink_started.set()
+        await finish_unlink.wait()
+        await delete(key)
+
+    monkeypatch.setattr(local, 'delete', slow_delete)
+    release = asyncio.ensure_future(releaser.release(db, digest))
+    await unlink_started.wait()
+
+    again, _ = _source(tmp_path, 'b', b'contended')
+    ingest = asyncio.ensure_future(ingester.ingest(db, again, digest, 9))
+    assert await ingester.add_ref(db, digest) is False
+    await asyncio.sleep(0.05)
+    assert not ingest.done()
+
+    finish_unlink.set()
+    await release
+    assert await ingest is False
+    assert path.read_bytes() == b'contended'
+    assert (await db.blobs.find_one({'_id': digest}))['refs'] == 1
@@ -0,0 +1,62 @@
+import pytest
+
+import catalogue_warmer
+import tmdb_service
+from catalogue_warmer import CatalogueWarmer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    monkeypatch.setattr(catalogue_warmer, 'WARM_CATEGORIES', ['trending', 'popular', 'horror'])
+    monkeypatch.setattr(catalogue_warmer, 'CATALOGUE_WARMER_SPACING', 0)
+    monkeypatch.setattr(catalogue_warmer, 'CATALOGUE_WARMER_DETAILS_PER_ROW', 2)
+    calls = []
+
+    async def get_category_movies(category, limit):
+        calls.append(('row', category, tmdb_service._refresh_horizon.get()))
+        if category == 'popular':
+            raise RuntimeError('TMDB unavailable')
+        return [
+            {'id': 1, 'media_type': 'movie'},
+            {'id': 2, 'media_type': 'person'},
+            {'id': 3, 'media_type': 'tv'},
+        ]
+
+    async def get_movie_details(movie_id, media_type):
+        calls.append(('details', movie_id, tmdb_service._refresh_horizon.get()))
+
+    monkeypatch.setattr(catalogue_warmer, 'get_category_movies', get_category_movies)
+    monkeypatch.setattr(catalogue_warmer, 'get_movie_details', get_movie_details)
+    return calls
+
+
+async def test_pass_refreshes_rows_and_top_titles_ahead_of_expiry(upstream, monkeypatch):
+    monkeypatch.setattr(catalogue_warmer.tmdb_rate_limiter, 'remaining_budget', lambda: 1000)
+    warmer = CatalogueWarmer()
+
+    await warmer.run_once()
+
+    assert [call[:2] for call in upstream] == [
+        ('row', 'trending'), ('details', 1),
+        ('row', 'popular'),
+        ('row', 'horror'), ('details', 1),
+    ]
+    # Every upstream call ran inside refresh_ahead with the warmer's horizon
+    assert {call[2] for call in upstream} == {warmer.horizon}
+    assert warmer.horizon > catalogue_warmer.CATALOGUE_WARMER_INTERVAL
+    snapshot = warmer.snapshot()
+    assert snapshot['passes'] == 1 and snapshot['errors'] == 1
+    assert snapshot['rows_warmed'] == 2 and snapshot['details_warmed'] == 2
+
+
+async def test_low_key_budget_pauses_the_pass(upstream, monkeypatch):
+    monkeypatch.setattr(catalogue_warmer.tmdb_rate_limiter, 'remaining_budget', lambda: 0)
+    monkeypatch.setattr(catalogue_warmer, 'CATALOGUE_WARMER_BUDGET_WAIT', 0)
+    warmer = CatalogueWarmer()
+
+    await warmer.run_once()
+
+    assert upstream == []
+    assert warmer.budget_skips == 1 and warmer.passes == 1
@@ -0,0 +1,104 @@
+import time
+
+import upstream_latency
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerGroup, CircuitBreaker
+from upstream_latency import UpstreamLatency
+
+
+def test_opens_after_consecutive_failures_only():
+    breaker = CircuitBreaker('test', failure_threshold=3, recovery_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert 59 < breaker.retry_after() <= 60
+    assert breaker.stats['opened'] == 1 and breaker.stats['rejected'] == 1
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    assert breaker.state == HALF_OPEN and breaker.retry_after() is None
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_a_full_timeout():
+    breaker = CircuitBreaker('test', failure_threshold=5, recovery_timeout=0.01)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker._state == OPEN
+    assert breaker.stats['opened'] == 2
+    assert breaker.snapshot()['consecutive_failures'] == 6
+
+
+def test_released_probe_slot_can_be_taken_again():
+    breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.allow()
+
+    breaker.release()
+
+    assert breaker.allow()
+
+
+def test_group_keeps_one_breaker_per_family():
+    group = BreakerGroup('tmdb')
+    group.get('search').record_failure()
+
+    assert group.get('search') is group.get('search')
+    assert group.get('details').name == 'tmdb:details'
+    snapshot = group.snapshot()
+    assert snapshot['search']['failures'] == 1 and snapshot['details']['failures'] == 0
+
+
+def test_hedge_waits_for_enough_samples_then_tracks_the_tail(monkeypatch):
+    monkeypatch.setattr(upstream_latency, 'TMDB_HEDGE_MIN_SAMPLES', 10)
+    latency = UpstreamLatency(window=100)
+    for ms in range(1, 10):
+        latency.record('search', ms / 10)
+    assert latency.hedge_delay('search') is None
+
+    latency.record('search', 1.0)
+    assert latency.hedge_delay('search') == 1.0
+    assert latency.hedge_delay('details') is None
+
+
+def test_hedge_delay_has_a_floor_and_the_window_slides(monkeypatch):
+    monkeypatch.setattr(upstream_latency, 'TMDB_HEDGE_MIN_SAMPLES', 1)
+    latency = UpstreamLatency(window=5)
+    for _ in range(5):
+        latency.record('search', 0.001)
+    assert latency.hedge_delay('search') == upstream_latency.TMDB_HEDGE_MIN_DELAY
+
+    for _ in range(5):
+        latency.record('search', 2.0)
+    assert latency.hedge_delay('search') == 2.0
+    assert latency.snapshot()['families']['search']['samples'] == 5
+
+
+def test_hedging_can_be_switched_off(monkeypatch):
+    monkeypatch.setattr(upstream_latency, 'TMDB_HEDGE_ENABLED', False)
+    monkeypatch.setattr(upstream_latency, 'TMDB_HEDGE_MIN_SAMPLES', 1)
+    latency = UpstreamLatency()
+    latency.record('search', 0.5)
+
+    assert latency.hedge_delay('search') is None
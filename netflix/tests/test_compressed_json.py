@@ -0,0 +1,110 @@
+import gzip
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import compressed_json
+from compressed_json import CompressedVariantCache, etag_matches, json_response, negotiate_encoding
+
+ROW = {'success': True, 'data': [{'id': i, 'title': f'Title {i}'} for i in range(100)]}
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(compressed_json, 'COMPRESSORS', {'gzip': compressed_json.COMPRESSORS['gzip']})
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('gzip, deflate', 'gzip'),
+    ('GZIP;q=0.5', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=oops', None),
+    ('*', 'gzip'),
+    ('*;q=0.5, gzip;q=0', None),
+    ('identity', None),
+])
+def test_negotiate_encoding(without_brotli, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_brotli_wins_when_available_and_equally_acceptable(monkeypatch):
+    monkeypatch.setitem(compressed_json.COMPRESSORS, 'br', lambda body: body)
+
+    assert negotiate_encoding('gzip, br') == 'br'
+    assert negotiate_encoding('gzip, br;q=0.5') == 'gzip'
+
+
+@pytest.mark.parametrize('header, matches', [
+    ('"abc"', True),
+    ('"abc-gzip"', True),
+    ('W/"abc-br"', True),
+    ('"other", "abc"', True),
+    ('*', True),
+    ('"abcd"', False),
+    ('"other"', False),
+])
+def test_etag_matches_any_encoding_of_the_payload(header, matches):
+    assert etag_matches(header, 'abc') is matches
+
+
+def test_variant_cache_compresses_once_and_stays_within_budget(without_brotli):
+    cache = CompressedVariantCache(max_bytes=10_000)
+    body = b'x' * 5000
+
+    first = cache.get('a', 'gzip', body)
+    assert cache.get('a', 'gzip', body) is first
+    assert gzip.decompress(first) == body
+    assert cache.stats == {'hits': 1, 'compressions': 1, 'not_modified': 0, 'identity': 0}
+
+    for digest in 'bcdefg':
+        cache.get(digest, 'gzip', os.urandom(3000))
+    assert cache.total_bytes <= cache.max_bytes
+    assert ('a', 'gzip') not in cache._entries
+
+
+@pytest.fixture
+def client(without_brotli, monkeypatch):
+    monkeypatch.setattr(compressed_json, 'response_variants', CompressedVariantCache())
+    app = FastAPI()
+
+    @app.get('/row')
+    async def row(request: Request):
+        return json_response(request, ROW)
+
+    @app.get('/tiny')
+    async def tiny(request: Request):
+        return json_response(request, {'success': True})
+
+    return TestClient(app)
+
+
+def test_large_payloads_are_compressed_with_a_per_encoding_tag(client):
+    plain = client.get('/row', headers={'Accept-Encoding': 'identity'})
+    zipped = client.get('/row', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'content-encoding' not in plain.headers
+    assert zipped.headers['content-encoding'] == 'gzip'
+    assert zipped.json() == plain.json() == ROW
+    assert zipped.headers['etag'] == plain.headers['etag'][:-1] + '-gzip"'
+    assert zipped.headers['vary'] == 'Accept-Encoding'
+    assert 'no-cache' in zipped.headers['cache-control']
+
+
+def test_small_payloads_go_out_uncompressed(client):
+    response = client.get('/tiny', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'content-encoding' not in response.headers
+    assert response.headers['etag'].count('-') == 0
+
+
+def test_revalidation_is_304_across_encodings(client):
+    etag = client.get('/row', headers={'Accept-Encoding': 'gzip'}).headers['etag']
+
+    response = client.get('/row', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.content == b''
+    assert compressed_json.response_variants.stats['not_modified'] == 1
@@ -0,0 +1,223 @@
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+import resumable_upload
+from blob_store import blob_store
+from database import get_db
+from routes import custom_videos
+from routes.auth import require_admin
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def api(db):
+    app = FastAPI()
+    app.include_router(custom_videos.router, prefix='/api')
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[require_admin] = lambda: {'role': 'admin'}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        yield client
+
+
+def _form(**overrides):
+    form = {'title': 'Clip', 'description': 'A clip', 'filename': 'clip.mp4', 'size': '10'}
+    form.update(overrides)
+    return form
+
+
+async def _stored(db, tmp_path, data):
+    digest = hashlib.sha256(data).hexdigest()
+    source = tmp_path / 'seed.mp4'
+    source.write_bytes(data)
+    await blob_store.ingest(db, source, digest, len(data))
+    return digest
+
+
+async def test_dedup_uses_the_stored_size_not_the_declared_one(api, db, tmp_path):
+    digest = await _stored(db, tmp_path, b'x' * 64)
+
+    response = await api.post('/api/custom-videos/uploads', data=_form(size='999999', checksum=digest))
+
+    body = response.json()
+    assert response.status_code == 201
+    assert body['deduplicated'] is True
+    assert body['size'] == body['offset'] == 64
+    video = await db.custom_videos.find_one({'id': body['video_id']})
+    assert video['size'] == 64
+    assert (await db.blobs.find_one({'_id': digest}))['refs'] == 2
+
+
+async def test_failed_dedup_commit_hands_back_every_reference(api, db, tmp_path, monkeypatch):
+    digest = await _stored(db, tmp_path, b'y' * 32)
+
+    async def broken_commit(db, video_doc):
+        raise RuntimeError('queue down')
+
+    monkeypatch.setattr(custom_videos, '_commit_video', broken_commit)
+    response = await api.post(
+        '/api/custom-videos/uploads',
+        data=_form(checksum=digest),
+        files={'thumbnail': ('poster.jpg', b'thumbnail bytes', 'image/jpeg')}
+    )
+
+    assert response.status_code == 500
+    assert (await db.blobs.find_one({'_id': digest}))['refs'] == 1
+    thumbnail_digest = hashlib.sha256(b'thumbnail bytes').hexdigest()
+    assert await db.blobs.find_one({'_id': thumbnail_digest}) is None
+
+
+async def _start(api, data, **form):
+    response = await api.post('/api/custom-videos/uploads', data=_form(size=str(len(data)), **form))
+    assert response.status_code == 201
+    return response.json()['upload_id']
+
+
+async def _patch(api, upload_id, offset, chunk):
+    return await api.patch(
+        f'/api/custom-videos/uploads/{upload_id}',
+        content=chunk,
+        headers={'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'}
+    )
+
+
+async def test_chunks_resume_at_the_acknowledged_offset(api, db):
+    data = b'0123456789' * 10
+    upload_id = await _start(api, data, checksum=hashlib.sha256(data).hexdigest())
+
+    first = await _patch(api, upload_id, 0, data[:40])
+    assert first.headers['Upload-Offset'] == '40'
+    assert first.json()['complete'] is False
+
+    stale = await _patch(api, upload_id, 0, data[:40])
+    assert stale.status_code == 409
+    assert stale.headers['Upload-Offset'] == '40'
+
+    head = await api.head(f'/api/custom-videos/uploads/{upload_id}')
+    assert head.headers['Upload-Offset'] == '40'
+    assert head.headers['Upload-Length'] == '100'
+
+    # A restart loses the in-memory hasher; it is rebuilt from the partial file
+    resumable_upload._states.clear()
+    done = await _patch(api, upload_id, 40, data[40:])
+    body = done.json()
+    assert body['complete'] is True and body['offset'] == 100
+    video = await db.custom_videos.find_one({'id': body['video_id']})
+    assert video['checksum'] == hashlib.sha256(data).hexdigest()
+    assert upload_id not in resumable_upload._states
+
+
+async def test_unknown_or_finished_uploads_leave_no_state_behind(api, db):
+    missing = await _patch(api, 'no-such-upload', 0, b'x')
+    assert missing.status_code == 404
+
+    data = b'abc'
+    upload_id = await _start(api, data)
+    await _patch(api, upload_id, 0, data)
+    again = await _patch(api, upload_id, 3, b'more')
+    assert again.status_code == 409
+
+    assert 'no-such-upload' not in resumable_upload._states
+    assert upload_id not in resumable_upload._states
+
+
+async def test_sweep_expires_idle_sessions_and_orphaned_partial_files(api, db):
+    idle = await _start(api, b'x' * 10)
+    active = await _start(api, b'y' * 10)
+    await _patch(api, idle, 0, b'x' * 4)
+    long_ago = datetime.now(timezone.utc) - timedelta(seconds=resumable_upload.UPLOAD_SESSION_TTL + 60)
+    await db.upload_sessions.update_one({'id': idle}, {'$set': {'updated_at': long_ago}})
+    orphan = custom_videos.PARTIAL_DIR / 'never-recorded.part'
+    orphan.write_bytes(b'z')
+    old = long_ago.timestamp()
+    os.utime(orphan, (old, old))
+
+    assert await custom_videos.expire_stale_uploads(db) == 1
+
+    assert (await db.upload_sessions.find_one({'id': idle}))['status'] == 'expired'
+    assert not custom_videos._partial_path(idle).exists()
+    assert not orphan.exists()
+    assert custom_videos._partial_path(active).exists()
+    assert (await _patch(api, idle, 4, b'x' * 6)).status_code == 409
+
+
+async def test_chunk_written_after_the_session_moved_on_is_rolled_back(api, db, monkeypatch):
+    data = b'0123456789'
+    upload_id = await _start(api, data)
+    await _patch(api, upload_id, 0, data[:4])
+    append = custom_videos.append_chunks
+
+    async def append_then_lose_the_session(path, state, chunks, max_size):
+        offset = await append(path, state, chunks, max_size)
+        # Another worker expired (or advanced) the session while this chunk was on disk
+        await db.upload_sessions.update_one({'id': upload_id}, {'$set': {'status': 'expired'}})
+        return offset
+
+    monkeypatch.setattr(custom_videos, 'append_chunks', append_then_lose_the_session)
+    response = await _patch(api, upload_id, 4, data[4:8])
+
+    assert response.status_code == 409
+    assert response.headers['Upload-Offset'] == '4'
+    assert custom_videos._partial_path(upload_id).read_bytes() == data[:4]
+    assert (await db.upload_sessions.find_one({'id': upload_id}))['offset'] == 4
+    assert upload_id not in resumable_upload._states
+
+
+async def test_a_patch_in_another_process_makes_this_one_wait_its_turn(api, db):
+    data = b'0123456789'
+    upload_id = await _start(api, data)
+    partial = custom_videos._partial_path(upload_id)
+
+    async with resumable_upload.exclusive_partial(partial):
+        busy = await _patch(api, upload_id, 0, data)
+    assert busy.status_code == 409
+    assert partial.read_bytes() == b''
+
+    done = await _patch(api, upload_id, 0, data)
+    assert done.status_code == 200 and done.json()['complete'] is True
+
+
+async def test_keyset_pages_cover_ties_and_legacy_videos_exactly_once(api, db):
+    base = datetime(2024, 1, 1)
+    videos = [
+        {'id': 'a', 'created_at': base + timedelta(minutes=3)},
+        {'id': 'c', 'created_at': base + timedelta(minutes=2)},
+        {'id': 'b', 'created_at': base + timedelta(minutes=2)},
+        {'id': 'd', 'created_at': base + timedelta(minutes=1)},
+        {'id': 'f'},
+        {'id': 'e'},
+    ]
+    for video in videos:
+        await db.custom_videos.insert_one({
+            'title': video['id'], 'description': '', 'video_path': 'x.mp4', 'thumbnail_path': None,
+            'category': 'My Videos', 'year': 2024, 'rating': 'PG', 'match': 90, 'media_type': 'custom', **video
+        })
+
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+        page = (await api.get('/api/custom-videos/list', params=params)).json()
+        seen += [video['id'] for video in page['data']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    # Newest first, id descending within a timestamp, legacy rows (no created_at) last
+    assert seen == ['a', 'c', 'b', 'd', 'f', 'e']
+
+
+def test_cursor_round_trips_and_rejects_garbage():
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = custom_videos._encode_cursor({'id': 'abc', 'created_at': created_at})
+
+    assert '=' not in cursor
+    assert custom_videos._decode_cursor(cursor) == (created_at, 'abc')
+    assert custom_videos._decode_cursor(custom_videos._encode_cursor({'id': 'x'})) == (None, 'x')
+    with pytest.raises(HTTPException) as error:
+        custom_videos._decode_cursor('not-a-cursor')
+    assert error.value.status_code == 400
@@ -0,0 +1,59 @@
+import pytest
+
+import database
+from database import PoolMetrics, pool_settings
+
+
+@pytest.fixture
+def fresh_client(monkeypatch):
+    monkeypatch.setattr(database, '_client', None)
+    monkeypatch.setattr(database, '_db', None)
+    yield
+    database.close()
+
+
+def test_pool_settings_come_from_the_environment_over_defaults(monkeypatch):
+    monkeypatch.setenv('MONGO_MAX_POOL_SIZE', '25')
+    monkeypatch.delenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', raising=False)
+
+    settings = pool_settings()
+
+    assert settings['maxPoolSize'] == 25
+    assert settings['serverSelectionTimeoutMS'] == 5000
+    # No default means the driver's own default applies
+    assert 'waitQueueTimeoutMS' not in settings
+
+
+def test_one_client_per_process_until_closed(fresh_client):
+    with pytest.raises(RuntimeError):
+        database.get_db()
+
+    db = database.connect()
+    assert database.connect() is db
+    assert database.get_db() is db
+    assert database.snapshot()['connected'] is True
+
+    database.close()
+    with pytest.raises(RuntimeError):
+        database.get_db()
+
+
+def test_pool_metrics_track_connections_and_checkout_waits():
+    metrics = PoolMetrics()
+    for _ in range(2):
+        metrics.connection_created(None)
+    for _ in range(3):
+        metrics.connection_check_out_started(None)
+        metrics.connection_checked_out(None)
+    metrics.connection_checked_in(None)
+    metrics.connection_check_out_started(None)
+    metrics.connection_check_out_failed(None)
+    metrics.connection_closed(None)
+
+    snapshot = metrics.snapshot()
+    assert snapshot['open_connections'] == 1
+    assert snapshot['in_use'] == 2
+    assert snapshot['checkouts'] == 3
+    assert snapshot['checkout_failures'] == 1
+    waits = snapshot['checkout_wait_ms']
+    assert 0 <= waits['p50'] <= waits['p99'] <= waits['max']
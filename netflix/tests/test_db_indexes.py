@@ -0,0 +1,47 @@
+import pytest
+
+import db_indexes
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_migrations_apply_once_and_recording_is_idempotent(db, monkeypatch):
+    calls = []
+
+    async def backfill(db):
+        calls.append('backfill')
+
+    monkeypatch.setattr(db_indexes, 'MIGRATIONS', [('0001_backfill', backfill)])
+
+    assert await db_indexes.run_migrations(db) == ['0001_backfill']
+    assert await db_indexes.run_migrations(db) == []
+    assert calls == ['backfill']
+
+
+async def test_recording_tolerates_a_worker_that_applied_the_same_migration(db, monkeypatch):
+    async def raced(db):
+        # Another worker finishes and records this migration while ours is still running
+        await db.migrations.insert_one({'_id': '0001_raced', 'applied_at': None})
+
+    monkeypatch.setattr(db_indexes, 'MIGRATIONS', [('0001_raced', raced)])
+
+    assert await db_indexes.run_migrations(db) == ['0001_raced']
+    assert await db.migrations.count_documents({}) == 1
+
+
+async def test_indexes_are_ensured_even_when_a_migration_fails(db, monkeypatch):
+    ensured = []
+
+    async def broken_migrations(db):
+        raise RuntimeError('bad migration')
+
+    async def ensure_indexes(db):
+        ensured.append(db)
+
+    monkeypatch.setattr(server, 'run_migrations', broken_migrations)
+    monkeypatch.setattr(server, 'ensure_indexes', ensure_indexes)
+
+    await server.migrate_database(db)
+
+    assert ensured == [db]
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from routes import movies
+
+pytestmark = pytest.mark.anyio
+
+ROWS = {
+    'trending': [{'id': 1, 'media_type': 'movie'}, {'id': 2, 'media_type': 'tv'}],
+    'popular': [{'id': 1, 'media_type': 'movie'}, {'id': 3, 'media_type': 'movie'}],
+    'action': [{'id': 2, 'media_type': 'movie'}],
+}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    state = {'in_flight': 0, 'peak': 0}
+
+    async def get_category_movies(category, limit):
+        state['in_flight'] += 1
+        state['peak'] = max(state['peak'], state['in_flight'])
+        await asyncio.sleep(0.01)
+        state['in_flight'] -= 1
+        if category == 'horror':
+            raise RuntimeError('TMDB unavailable')
+        return ROWS.get(category, [])[:limit]
+
+    monkeypatch.setattr(movies, 'get_category_movies', get_category_movies)
+    return state
+
+
+@pytest.fixture
+async def api(upstream):
+    app = FastAPI()
+    app.include_router(movies.router, prefix='/api')
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        yield client
+
+
+def test_categories_accept_repeated_and_comma_separated_params():
+    assert movies._parse_categories(['trending,popular', 'trending', ' action ']) == ['trending', 'popular', 'action']
+    assert movies._parse_categories(None) == [c['id'] for c in movies.CATEGORIES]
+
+
+async def test_rows_keep_request_order_and_drop_titles_seen_in_earlier_rows(api, upstream):
+    response = await api.get('/api/movies/feed', params={'categories': 'trending,popular,action,horror'})
+
+    rows = response.json()['data']
+    assert [row['category'] for row in rows] == ['trending', 'popular', 'action', 'horror']
+    assert [m['id'] for m in rows[0]['data']] == [1, 2]
+    assert [m['id'] for m in rows[1]['data']] == [3]
+    # Same id with a different media type is a different title
+    assert [m['id'] for m in rows[2]['data']] == [2]
+    assert rows[1]['name'] == 'Popular on Netflix'
+    assert rows[3]['data'] == [] and rows[3]['error'] == 'TMDB unavailable'
+    assert response.json()['success'] is True
+    # All rows were requested before any of them came back
+    assert upstream['peak'] == 4
+
+
+async def test_stream_emits_one_ndjson_row_per_category(api):
+    response = await api.get('/api/movies/feed', params={'categories': 'trending,popular', 'stream': 'true'})
+
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(row['category'] for row in rows) == ['popular', 'trending']
+    ids = [m['id'] for row in rows for m in row['data']]
+    assert sorted(ids) == [1, 2, 3]
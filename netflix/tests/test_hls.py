@@ -0,0 +1,110 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from database import get_db
+from media_processing import hls_ladder
+from routes import custom_videos
+from routes.auth import require_admin
+from routes.custom_videos import HLS_PATH_RE, _apply_packaging
+from storage import storage
+
+pytestmark = pytest.mark.anyio
+
+VERSION = 'abcdef012345'
+
+
+@pytest.fixture
+async def api(db):
+    app = FastAPI()
+    app.include_router(custom_videos.router, prefix='/api')
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[require_admin] = lambda: {'role': 'admin'}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        yield client
+
+
+@pytest.mark.parametrize('height, rungs', [
+    (None, [1080, 720, 480, 360]),
+    (720, [720, 480, 360]),
+    (2160, [1080, 720, 480, 360]),
+    # Smaller than every rung: one rendition at the source's even height and the lowest bitrate
+    (241, [240]),
+])
+def test_ladder_never_upscales(height, rungs):
+    ladder = hls_ladder(height)
+
+    assert [h for h, _ in ladder] == rungs
+    assert ladder[-1][1] == 800
+
+
+@pytest.mark.parametrize('path, served', [
+    (f'{VERSION}/master.m3u8', True),
+    (f'{VERSION}/720p/index.m3u8', True),
+    (f'{VERSION}/720p/init.mp4', True),
+    (f'{VERSION}/720p/seg_00012.m4s', True),
+    (f'{VERSION}/../secret/master.m3u8', False),
+    (f'{VERSION}/720p/seg_12.m4s', False),
+    (f'{VERSION}/720p/clip.mp4', False),
+    ('latest/master.m3u8', False),
+])
+def test_only_packaged_files_are_addressable(path, served):
+    assert bool(HLS_PATH_RE.match(path)) is served
+
+
+def _packaged(tmp_path, version):
+    out_dir = tmp_path / 'hls' / version
+    (out_dir / '360p').mkdir(parents=True)
+    (out_dir / 'master.m3u8').write_text('#EXTM3U\n360p/index.m3u8\n')
+    (out_dir / '360p' / 'index.m3u8').write_text('#EXTM3U\n')
+    (out_dir / '360p' / 'init.mp4').write_bytes(b'init')
+    return out_dir
+
+
+async def test_new_version_is_published_and_replaces_the_old_one(api, db, tmp_path):
+    await db.custom_videos.insert_one({'id': 'vid1', 'title': 'Clip', 'description': '', 'video_path': 'vid1.mp4'})
+    result = {'master': 'master.m3u8', 'renditions': [{'name': '360p'}]}
+    old = 'a' * 12
+
+    await _apply_packaging(db, {'video_id': 'vid1', 'payload': {'out_dir': str(_packaged(tmp_path, old))}}, result)
+    await _apply_packaging(db, {'video_id': 'vid1', 'payload': {'out_dir': str(_packaged(tmp_path, VERSION))}}, result)
+
+    video = await db.custom_videos.find_one({'id': 'vid1'})
+    assert video['hls']['version'] == VERSION
+    assert await storage.exists(f'hls/vid1/{VERSION}/360p/init.mp4')
+    assert not await storage.exists(f'hls/vid1/{old}/master.m3u8')
+
+    playlist = await api.get(f'/api/custom-videos/hls/vid1/{VERSION}/master.m3u8')
+    assert playlist.status_code == 200
+    assert playlist.headers['content-type'] == 'application/vnd.apple.mpegurl'
+    assert 'immutable' in playlist.headers['cache-control']
+    assert (await api.get(f'/api/custom-videos/hls/vid1/{old}/master.m3u8')).status_code == 404
+    assert (await api.get(f'/api/custom-videos/hls/vid1/{VERSION}/360p/clip.mp4')).status_code == 404
+
+    details = (await api.get('/api/custom-videos/vid1')).json()['data']
+    assert details['hls_url'] == f'/api/custom-videos/hls/vid1/{VERSION}/master.m3u8'
+
+
+async def test_packaging_a_deleted_video_publishes_nothing(db, tmp_path):
+    out_dir = _packaged(tmp_path, VERSION)
+
+    await _apply_packaging(db, {'video_id': 'gone', 'payload': {'out_dir': str(out_dir)}}, {})
+
+    assert not out_dir.exists()
+    assert not await storage.exists(f'hls/gone/{VERSION}/master.m3u8')
+
+
+async def test_packaging_waits_for_a_probed_video(api, db):
+    await db.custom_videos.insert_one({'id': 'vid1', 'video_path': 'vid1.mp4'})
+    assert (await api.post('/api/custom-videos/vid1/hls')).status_code == 409
+    assert (await api.post('/api/custom-videos/missing/hls')).status_code == 404
+
+    media_info = {'video': {'width': 1280, 'height': 720}, 'audio': None}
+    await db.custom_videos.update_one({'id': 'vid1'}, {'$set': {'media_info': media_info}})
+    response = await api.post('/api/custom-videos/vid1/hls')
+
+    assert response.status_code == 202
+    job = await db.media_jobs.find_one({'id': response.json()['job_id']})
+    assert job['type'] == 'package_hls' and job['status'] == 'queued'
+    assert job['payload']['height'] == 720 and job['payload']['has_audio'] is False
+    assert HLS_PATH_RE.match(job['payload']['out_dir'].rsplit('/', 1)[1] + '/master.m3u8')
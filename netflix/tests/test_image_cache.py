@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+import tmdb_service
+from image_cache import DiskLRUCache
+
+pytestmark = pytest.mark.anyio
+
+
+def test_image_urls_point_at_tmdb_cdn_by_default():
+    assert tmdb_service.TMDB_IMAGE_PROXY is False
+    card = tmdb_service.map_movie_to_frontend({'id': 1, 'title': 'X', 'poster_path': '/p.jpg', 'backdrop_path': '/b.jpg'})
+    assert card['poster'] == f"https://image.tmdb.org/t/p/{tmdb_service.POSTER_SIZE}/p.jpg"
+    assert card['backdrop'].startswith('https://image.tmdb.org/t/p/')
+
+
+async def test_concurrent_first_loads_count_existing_files_once(tmp_path):
+    (tmp_path / 'w342').mkdir()
+    (tmp_path / 'w342' / 'a.jpg').write_bytes(b'x' * 10)
+    (tmp_path / 'w342' / 'b.jpg').write_bytes(b'x' * 5)
+    cache = DiskLRUCache(tmp_path, max_bytes=1000)
+
+    await asyncio.gather(*(cache.ensure_loaded() for _ in range(5)))
+
+    assert cache.total_bytes == 15
+    assert cache.snapshot()['entries'] == 2
+
+
+async def test_put_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(tmp_path, max_bytes=10)
+    await cache.ensure_loaded()
+    await cache.put('w92/a.jpg', b'a' * 4)
+    await cache.put('w92/b.jpg', b'b' * 4)
+    assert cache.get('w92/a.jpg') is not None  # a is now most recent
+    await cache.put('w92/c.jpg', b'c' * 4)
+
+    assert cache.get('w92/b.jpg') is None
+    assert not (tmp_path / 'w92' / 'b.jpg').exists()
+    assert cache.total_bytes == 8
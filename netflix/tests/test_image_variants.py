@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import image_variants
+from image_variants import _build_and_store, generate_variants, is_variant_name, pick_variant, variant_files, variant_key
+from storage import storage
+
+VARIANTS = {
+    'hash': '0123456789ab',
+    'width': 1000,
+    'variants': {
+        '320': {'webp': 'v_thumb.w320.0123456789ab.webp', 'jpeg': 'v_thumb.w320.0123456789ab.jpg'},
+        '1000': {'webp': 'v_thumb.w1000.0123456789ab.webp', 'jpeg': 'v_thumb.w1000.0123456789ab.jpg'},
+    },
+}
+
+
+@pytest.mark.parametrize('width, fmt, expected', [
+    (100, 'webp', 'v_thumb.w320.0123456789ab.webp'),
+    (320, 'jpeg', 'v_thumb.w320.0123456789ab.jpg'),
+    (321, 'webp', 'v_thumb.w1000.0123456789ab.webp'),
+    # Nothing wide enough falls back to the largest
+    (4000, 'webp', 'v_thumb.w1000.0123456789ab.webp'),
+])
+def test_pick_variant_prefers_the_smallest_wide_enough(width, fmt, expected):
+    assert pick_variant(VARIANTS, width, fmt) == expected
+
+
+def test_missing_variants_pick_nothing():
+    assert pick_variant(None, 320) is None
+    assert pick_variant({'variants': {}}, 320) is None
+    assert variant_files(None) == []
+
+
+def test_variant_names_are_content_addressed():
+    assert is_variant_name('v_thumb.w320.0123456789ab.webp')
+    assert not is_variant_name('v_thumb.w320.webp')
+    assert not is_variant_name('../v_thumb.w320.0123456789ab.webp')
+    assert not is_variant_name('v_thumb.w320.0123456789ab.png')
+
+
+def test_generate_variants_never_upscales(tmp_path):
+    source = tmp_path / 'poster.png'
+    Image.new('RGB', (500, 250), 'red').save(source)
+
+    result = generate_variants(str(source), str(tmp_path / 'out'), 'v_thumb', widths=[160, 320, 640])
+
+    assert result['width'] == 500
+    assert sorted(result['variants'], key=int) == ['160', '320', '500']
+    files = variant_files(result)
+    assert len(files) == 6 and all(is_variant_name(name) for name in files)
+    with Image.open(tmp_path / 'out' / result['variants']['160']['webp']) as img:
+        assert img.size == (160, 80)
+
+
+@pytest.fixture
+def in_thread(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(image_variants, '_get_executor', lambda: executor)
+    yield
+    executor.shutdown(wait=True)
+
+
+async def _stored_image(tmp_path, key, colour):
+    source = tmp_path / f'{colour}.png'
+    Image.new('RGB', (200, 100), colour).save(source)
+    await storage.put_file(key, source, 'image/png')
+
+
+async def _stored_variants(names):
+    return [name for name in names if await storage.exists(variant_key(name))]
+
+
+@pytest.mark.anyio
+async def test_variants_of_a_video_deleted_mid_run_are_removed(db, tmp_path, in_thread):
+    Image.new('RGB', (200, 100), 'red').save(tmp_path / 'red.png')
+    expected = variant_files(generate_variants(str(tmp_path / 'red.png'), str(tmp_path / 'out'), 'gone_thumb'))
+    await _stored_image(tmp_path, 'gone_poster.png', 'red')
+
+    await _build_and_store(db, 'gone', 'gone_poster.png')
+
+    assert await _stored_variants(expected) == []
+
+
+@pytest.mark.anyio
+async def test_replaced_variants_are_released_after_the_swap(db, tmp_path, in_thread):
+    await db.custom_videos.insert_one({'id': 'vid1', 'title': 'Clip'})
+    await _stored_image(tmp_path, 'vid1_old.png', 'red')
+    await _build_and_store(db, 'vid1', 'vid1_old.png')
+    old = variant_files((await db.custom_videos.find_one({'id': 'vid1'}))['thumbnail_variants'])
+
+    # Rebuilding from the same image keeps its files
+    await _build_and_store(db, 'vid1', 'vid1_old.png')
+    assert await _stored_variants(old) == old
+
+    await _stored_image(tmp_path, 'vid1_new.png', 'blue')
+    await _build_and_store(db, 'vid1', 'vid1_new.png')
+
+    new = variant_files((await db.custom_videos.find_one({'id': 'vid1'}))['thumbnail_variants'])
+    assert set(new).isdisjoint(old)
+    assert await _stored_variants(new) == new
+    assert await _stored_variants(old) == []
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import media_jobs as media_jobs_module
+from media_jobs import MediaJobQueue
+
+pytestmark = pytest.mark.anyio
+
+
+def slow_process(seconds=0.0):
+    time.sleep(seconds)
+    return {'slept': seconds}
+
+
+@pytest.fixture
+def queue(db, monkeypatch):
+    queue = MediaJobQueue()
+    queue._db = db
+    applied = []
+
+    async def apply(db, job, result):
+        applied.append((job['id'], result))
+
+    queue.register('probe', slow_process, apply)
+    queue.applied = applied
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(queue, '_get_executor', lambda: executor)
+    yield queue
+    executor.shutdown(wait=True)
+
+
+async def _expire_lease(db, job_id, attempts):
+    await db.media_jobs.update_one({'id': job_id}, {'$set': {
+        'status': 'running',
+        'attempts': attempts,
+        'lease_until': datetime.now(timezone.utc) - timedelta(seconds=1),
+        'lease_token': 'dead-worker'
+    }})
+
+
+async def test_claim_takes_the_oldest_due_job_and_leases_it(queue, db):
+    first = await queue.enqueue(db, 'probe', 'v1', {})
+    await queue.enqueue(db, 'probe', 'v2', {})
+
+    job = await queue._claim()
+
+    assert job['id'] == first
+    assert job['status'] == 'running' and job['attempts'] == 1
+    assert job['lease_token']
+    assert (await queue.get(db, first)).get('lease_token') is None  # never exposed
+
+
+async def test_expired_lease_is_reclaimed_while_attempts_remain(queue, db):
+    job_id = await queue.enqueue(db, 'probe', 'v1', {})
+    await _expire_lease(db, job_id, attempts=1)
+
+    job = await queue._claim()
+
+    assert job['id'] == job_id and job['attempts'] == 2
+    assert job['lease_token'] != 'dead-worker'
+
+
+async def test_expired_lease_on_the_last_attempt_fails_the_job(queue, db):
+    job_id = await queue.enqueue(db, 'probe', 'v1', {})
+    await _expire_lease(db, job_id, attempts=media_jobs_module.MEDIA_JOB_MAX_ATTEMPTS)
+
+    assert await queue._claim() is None
+
+    job = await queue.get(db, job_id)
+    assert job['status'] == 'failed'
+    assert 'Lease expired' in job['error']
+    assert queue.stats['failed'] == 1
+
+
+async def test_heartbeat_renews_the_lease_while_processing(queue, db, monkeypatch):
+    monkeypatch.setattr(media_jobs_module, 'MEDIA_JOB_HEARTBEAT', 0.05)
+    job_id = await queue.enqueue(db, 'probe', 'v1', {'seconds': 0.3})
+    job = await queue._claim()
+    leased = job['lease_until']
+
+    run = asyncio.ensure_future(queue._run(job))
+    await asyncio.sleep(0.2)
+    renewed = (await db.media_jobs.find_one({'id': job_id}))['lease_until']
+    await run
+
+    assert renewed > leased
+    done = await db.media_jobs.find_one({'id': job_id})
+    assert done['status'] == 'done' and 'lease_until' not in done
+
+
+async def test_worker_that_lost_its_lease_cannot_finish_the_job(queue, db):
+    job_id = await queue.enqueue(db, 'probe', 'v1', {})
+    stale = await queue._claim()
+    await _expire_lease(db, job_id, attempts=1)
+    current = await queue._claim()
+
+    await queue._finish(stale, {'status': 'done'})
+
+    job = await db.media_jobs.find_one({'id': job_id})
+    assert job['status'] == 'running'
+    assert job['lease_token'] == current['lease_token']
+
+
+def write_poster(poster_path=None, fail=False, seconds=0.0):
+    with open(poster_path, 'wb') as f:
+        f.write(b'jpeg')
+    time.sleep(seconds)
+    if fail:
+        raise RuntimeError('encoder crashed')
+    return {'poster': poster_path}
+
+
+async def test_outputs_get_a_fresh_name_each_attempt_and_failed_ones_are_removed(queue, db, tmp_path):
+    async def apply(db, job, result):
+        queue.applied.append(result['poster'])
+
+    queue.register('poster', write_poster, apply, outputs=('poster_path',))
+    requested = str(tmp_path / 'v1_poster.jpg')
+    job_id = await queue.enqueue(db, 'poster', 'v1', {'poster_path': requested, 'fail': True})
+
+    await queue._run(await queue._claim())
+    assert list(tmp_path.iterdir()) == []
+
+    await db.media_jobs.update_one({'id': job_id}, {'$set': {
+        'payload.fail': False, 'run_after': datetime.now(timezone.utc)
+    }})
+    await queue._run(await queue._claim())
+
+    [written] = queue.applied
+    assert written != requested
+    assert written.startswith(str(tmp_path / f"v1_poster.{job_id}."))
+    assert [p.name for p in tmp_path.iterdir()] == [written.rsplit('/', 1)[1]]
+
+
+async def test_result_is_not_applied_once_another_worker_took_the_job(queue, db, tmp_path):
+    async def apply(db, job, result):
+        queue.applied.append(result)
+
+    queue.register('poster', write_poster, apply, outputs=('poster_path',))
+    job_id = await queue.enqueue(db, 'poster', 'v1', {'poster_path': str(tmp_path / 'v1_poster.jpg'), 'seconds': 0.2})
+    stale = await queue._claim()
+
+    attempt = asyncio.ensure_future(queue._attempt(stale))
+    # The lease lapses mid-encode and another worker claims the job
+    await asyncio.sleep(0.05)
+    await _expire_lease(db, job_id, attempts=1)
+    current = await queue._claim()
+    await attempt
+
+    assert queue.applied == []
+    assert list(tmp_path.iterdir()) == []
+    assert queue.stats['leases_lost'] == 1 and queue.stats['completed'] == 0
+    job = await db.media_jobs.find_one({'id': job_id})
+    assert job['status'] == 'running' and job['lease_token'] == current['lease_token']
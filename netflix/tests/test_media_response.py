@@ -0,0 +1,159 @@
+import os
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import media_response
+from media_response import ZEROCOPY_EXTENSION, RangeFileResponse, parse_range_header
+
+DATA = bytes(range(256)) * 4  # 1024 bytes
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', [(0, 100)]),
+    ('bytes=1000-', [(1000, 1024)]),
+    ('bytes=-24', [(1000, 1024)]),
+    ('bytes=-5000', [(0, 1024)]),
+    ('bytes=1000-5000', [(1000, 1024)]),
+    # Sorted, with overlapping and adjacent ranges merged
+    ('bytes=500-599, 0-9, 5-19, 20-29', [(0, 30), (500, 600)]),
+    ('bytes=2000-3000', []),
+    ('bytes=-0', []),
+    ('items=0-1', None),
+    ('bytes=', None),
+    ('bytes=abc-def', None),
+    ('bytes=10-5', None),
+    ('bytes=5', None),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, len(DATA)) == expected
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(DATA)
+    app = FastAPI()
+
+    @app.api_route('/clip', methods=['GET', 'HEAD'])
+    async def clip():
+        return RangeFileResponse(path, media_type='video/mp4')
+
+    return TestClient(app)
+
+
+def test_full_response_advertises_ranges_and_validators(client):
+    response = client.get('/clip')
+
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.headers['etag'].startswith('"')
+    assert 'last-modified' in response.headers
+
+
+def test_single_range_is_partial_content(client):
+    response = client.get('/clip', headers={'Range': 'bytes=100-199'})
+
+    assert response.status_code == 206
+    assert response.content == DATA[100:200]
+    assert response.headers['content-range'] == 'bytes 100-199/1024'
+    assert response.headers['content-length'] == '100'
+
+
+def test_multiple_ranges_are_sent_as_multipart_byteranges(client):
+    response = client.get('/clip', headers={'Range': 'bytes=0-9,1000-'})
+
+    assert response.status_code == 206
+    content_type = response.headers['content-type']
+    boundary = re.match(r'multipart/byteranges; boundary=(\w+)', content_type).group(1)
+    assert int(response.headers['content-length']) == len(response.content)
+    parts = response.content.split(f'--{boundary}'.encode())
+    assert parts[-1] == b'--\r\n'
+    bodies = []
+    for part in parts[1:-1]:
+        head, _, body = part.partition(b'\r\n\r\n')
+        assert b'Content-Type: video/mp4' in head
+        bodies.append((re.search(rb'Content-Range: bytes (\d+)-(\d+)/1024', head).groups(), body[:-2]))
+    assert bodies == [((b'0', b'9'), DATA[:10]), ((b'1000', b'1023'), DATA[1000:])]
+
+
+def test_unsatisfiable_range_is_416(client):
+    response = client.get('/clip', headers={'Range': 'bytes=5000-'})
+
+    assert response.status_code == 416
+    assert response.headers['content-range'] == 'bytes */1024'
+
+
+def test_malformed_range_is_ignored(client):
+    response = client.get('/clip', headers={'Range': 'bytes=oops'})
+
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_range_only_honours_the_current_validator(client):
+    etag = client.get('/clip').headers['etag']
+
+    assert client.get('/clip', headers={'Range': 'bytes=0-9', 'If-Range': etag}).status_code == 206
+    stale = client.get('/clip', headers={'Range': 'bytes=0-9', 'If-Range': '"old"'})
+    assert stale.status_code == 200 and stale.content == DATA
+
+
+def test_conditional_get_is_304(client):
+    first = client.get('/clip')
+
+    assert client.get('/clip', headers={'If-None-Match': first.headers['etag']}).status_code == 304
+    assert client.get('/clip', headers={'If-Modified-Since': first.headers['last-modified']}).status_code == 304
+
+
+def test_head_sends_headers_without_a_body(client):
+    response = client.head('/clip', headers={'Range': 'bytes=0-9'})
+
+    assert response.status_code == 206
+    assert response.headers['content-length'] == '10'
+    assert response.content == b''
+
+
+async def _send_file(path, extensions, range_header=None):
+    """Drive the response with a bare ASGI scope; returns the messages after http.response.start"""
+    headers = [(b'range', range_header.encode())] if range_header else []
+    scope = {'type': 'http', 'method': 'GET', 'headers': headers, 'extensions': extensions}
+    messages = []
+
+    async def send(message):
+        if message['type'] == ZEROCOPY_EXTENSION:
+            # The descriptor is only valid until the send returns
+            message = {**message, 'sent': os.pread(message['file'], message['count'], message['offset'])}
+        messages.append(message)
+
+    await RangeFileResponse(path)(scope, None, send)
+    return messages[1:]
+
+
+@pytest.mark.anyio
+async def test_zero_copy_send_is_used_when_the_server_offers_it(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(DATA)
+
+    [message] = await _send_file(path, {ZEROCOPY_EXTENSION: {}}, 'bytes=100-199')
+
+    assert message['type'] == ZEROCOPY_EXTENSION
+    assert (message['offset'], message['count']) == (100, 100)
+    assert message['sent'] == DATA[100:200]
+
+
+@pytest.mark.anyio
+async def test_without_zero_copy_the_file_is_sent_in_mapped_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_response, 'CHUNK_SIZE', 300)
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(DATA)
+
+    messages = await _send_file(path, {})
+
+    assert {m['type'] for m in messages} == {'http.response.body'}
+    assert [len(m['body']) for m in messages] == [300, 300, 300, 124]
+    assert [m['more_body'] for m in messages] == [True, True, True, False]
+    assert b''.join(m['body'] for m in messages) == DATA
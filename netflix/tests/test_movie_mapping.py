@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import fast_json
+from fast_json import FastJSONResponse
+from tmdb_service import _BACKDROP_PREFIX, _POSTER_PREFIX, map_movie_to_frontend, map_results
+
+
+def test_movie_card_fields():
+    card = map_movie_to_frontend({
+        'id': 603, 'title': 'The Matrix', 'overview': 'Neo', 'release_date': '1999-03-31',
+        'vote_average': 8.2, 'poster_path': '/p.jpg', 'backdrop_path': None,
+    })
+
+    assert card == {
+        'id': 603, 'title': 'The Matrix', 'description': 'Neo',
+        'backdrop': None, 'poster': _POSTER_PREFIX + '/p.jpg',
+        'rating': 'TV-MA', 'year': 1999, 'match': 82, 'media_type': 'movie',
+    }
+
+
+@pytest.mark.parametrize('movie, rating', [
+    ({'adult': True, 'vote_average': 9}, 'R'),
+    ({'vote_average': 6.5}, 'TV-14'),
+    ({'vote_average': 4}, 'PG-13'),
+    ({}, 'TV-14'),
+])
+def test_rating_comes_from_the_adult_flag_then_votes(movie, rating):
+    assert map_movie_to_frontend(movie)['rating'] == rating
+
+
+def test_series_use_name_and_first_air_date():
+    card = map_movie_to_frontend({'id': 1, 'name': 'Dark', 'first_air_date': '2017-12-01', 'backdrop_path': '/b.jpg'}, 'tv')
+
+    assert (card['title'], card['year'], card['media_type']) == ('Dark', 2017, 'tv')
+    assert card['backdrop'] == _BACKDROP_PREFIX + '/b.jpg'
+
+
+def test_map_results_keeps_each_items_media_type_unless_forced():
+    items = [{'id': 1, 'media_type': 'tv'}, {'id': 2}]
+
+    assert [m['media_type'] for m in map_results(items)] == ['tv', 'movie']
+    assert [m['media_type'] for m in map_results(items, 'movie')] == ['movie', 'movie']
+
+
+def test_stdlib_fallback_is_compact_utf8(monkeypatch):
+    monkeypatch.setattr(fast_json, 'orjson', None)
+    content = {'title': 'Amélie', 'ids': [1, 2], 'poster': None}
+
+    body = fast_json.dumps(content)
+
+    assert body == '{"title":"Amélie","ids":[1,2],"poster":null}'.encode('utf-8')
+    assert FastJSONResponse(content).body == body
+    with pytest.raises(ValueError):
+        fast_json.dumps({'match': float('nan')})
+
+
+def test_cards_round_trip_through_dumps():
+    content = {'data': map_results([{'id': 1, 'title': 'Heat', 'release_date': '1995-12-15'}])}
+
+    assert json.loads(fast_json.dumps(content)) == content
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from dotenv import dotenv_values
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+
+
+def test_env_file_is_loaded_before_routes_read_their_settings(tmp_path):
+    expected = dotenv_values(BACKEND_DIR / '.env').get('JWT_SECRET_KEY')
+    if not expected:
+        pytest.skip('backend .env has no JWT_SECRET_KEY')
+    env = {k: v for k, v in os.environ.items() if k != 'JWT_SECRET_KEY'}
+
+    # A fresh interpreter: routes.auth is already imported in this one
+    result = subprocess.run(
+        [sys.executable, '-c', 'import server; from routes import auth; print(auth.SECRET_KEY)'],
+        cwd=tmp_path, env={**env, 'PYTHONPATH': str(BACKEND_DIR)}, capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip().splitlines()[-1] == expected
+
+
+def test_startup_refuses_to_run_without_a_signing_key(monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'JWT_SECRET_KEY', None)
+    monkeypatch.setattr(server.database, 'connect', lambda: pytest.fail('connected without a signing key'))
+
+    with pytest.raises(RuntimeError, match='JWT_SECRET_KEY'):
+        with TestClient(server.app):
+            pass
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await release.wait()
+        return {'id': 1}
+
+    waiters = [asyncio.ensure_future(flight.do('movie:1', fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [{'id': 1}] * 5
+    assert len(calls) == 1
+    assert flight.snapshot() == {'in_flight': 0, 'calls': 5, 'executions': 1, 'coalesced': 4}
+
+
+async def test_different_keys_and_later_calls_run_again():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        return key
+
+    assert await asyncio.gather(flight.do('a', lambda: fetch('a')), flight.do('b', lambda: fetch('b'))) == ['a', 'b']
+    assert await flight.do('a', lambda: fetch('a')) == 'a'
+    assert calls == ['a', 'b', 'a']
+
+
+async def test_errors_reach_every_waiter_and_are_not_remembered():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError('upstream down')
+
+    waiters = [asyncio.ensure_future(flight.do('k', failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    await asyncio.sleep(0)
+
+    async def ok():
+        return 'recovered'
+
+    assert await flight.do('k', ok) == 'recovered'
+
+
+async def test_one_cancelled_waiter_does_not_cancel_the_shared_fetch():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return 'done'
+
+    impatient = asyncio.ensure_future(flight.do('k', fetch))
+    patient = asyncio.ensure_future(flight.do('k', fetch))
+    await asyncio.sleep(0)
+    impatient.cancel()
+    release.set()
+
+    assert await patient == 'done'
+    assert impatient.cancelled()
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from boto3.s3.transfer import TransferConfig
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from media_response import RangeObjectResponse
+from storage import S3Storage
+
+pytestmark = pytest.mark.anyio
+
+BUCKET = 'test-uploads'
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_SESSION_TOKEN', 'testing')
+    with moto.mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        store = S3Storage(BUCKET, 'media', tmp_path / 'scratch')
+        # S3's minimum part size, so an 11 MB file goes up as three parallel parts
+        store.transfer_config = TransferConfig(multipart_threshold=5 * MB, multipart_chunksize=5 * MB, max_concurrency=4)
+        yield store
+
+
+def _scratch_file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+async def test_put_file_uploads_in_parts_and_removes_scratch(s3, tmp_path):
+    data = os.urandom(11 * MB)
+    source = _scratch_file(tmp_path, 'big.mp4', data)
+
+    await s3.put_file('blobs/ab/cd/big', source, 'video/mp4')
+
+    assert not source.exists()
+    head = s3.client.head_object(Bucket=BUCKET, Key='media/blobs/ab/cd/big')
+    assert head['ETag'].strip('"').endswith('-3')
+    assert head['ContentType'] == 'video/mp4'
+    info = await s3.stat('blobs/ab/cd/big')
+    assert info.size == len(data)
+    assert await s3.stat('blobs/missing') is None
+
+
+async def test_iter_range_streams_only_the_requested_bytes(s3, tmp_path):
+    data = bytes(range(256)) * 40
+    await s3.put_file('blobs/x', _scratch_file(tmp_path, 'x', data))
+
+    chunks = [chunk async for chunk in s3.iter_range('blobs/x', 100, 1100)]
+
+    assert b''.join(chunks) == data[100:1100]
+    assert s3.stats['range_reads'] == 1
+
+
+async def test_delete_prefix_removes_only_that_tree(s3, tmp_path):
+    for name in ('master.m3u8', '720p/index.m3u8', '720p/seg_00000.m4s'):
+        await s3.put_file(f"hls/v1/aaaaaaaaaaaa/{name}", _scratch_file(tmp_path, 'f', b'x'))
+    await s3.put_file('hls/v10/bbbbbbbbbbbb/master.m3u8', _scratch_file(tmp_path, 'f', b'x'))
+
+    await s3.delete_prefix('hls/v1')
+
+    keys = [o['Key'] for o in s3.client.list_objects_v2(Bucket=BUCKET).get('Contents', [])]
+    assert keys == ['media/hls/v10/bbbbbbbbbbbb/master.m3u8']
+
+
+async def test_local_copy_downloads_to_scratch_and_cleans_up(s3, tmp_path):
+    await s3.put_file('blobs/y.mp4', _scratch_file(tmp_path, 'y', b'video'))
+
+    async with s3.local_copy('blobs/y.mp4') as path:
+        assert path.read_bytes() == b'video'
+    assert not path.exists()
+
+    with pytest.raises(FileNotFoundError):
+        async with s3.local_copy('blobs/nope.mp4'):
+            pass
+
+
+@pytest.fixture
+def object_client(s3, tmp_path):
+    import anyio
+    data = b'0123456789' * 100
+    anyio.run(s3.put_file, 'blobs/clip.mp4', _scratch_file(tmp_path, 'clip', data))
+    app = FastAPI()
+
+    @app.get('/clip')
+    async def clip():
+        return RangeObjectResponse(s3, 'blobs/clip.mp4', await s3.stat('blobs/clip.mp4'), media_type='video/mp4')
+
+    return TestClient(app), data
+
+
+def test_range_object_response_partial_content(object_client):
+    client, data = object_client
+    response = client.get('/clip', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.headers['content-range'] == f"bytes 10-19/{len(data)}"
+    assert response.content == data[10:20]
+
+
+def test_range_object_response_unsatisfiable(object_client):
+    client, data = object_client
+    response = client.get('/clip', headers={'Range': f"bytes={len(data)}-"})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f"bytes */{len(data)}"
+
+
+def test_range_object_response_not_modified(object_client):
+    client, data = object_client
+    first = client.get('/clip')
+    assert first.status_code == 200 and first.content == data
+    again = client.get('/clip', headers={'If-None-Match': first.headers['etag']})
+    assert again.status_code == 304
+
+
+def test_hls_playlists_are_proxied_and_segments_redirected(s3, tmp_path, monkeypatch):
+    import anyio
+    import routes.custom_videos as custom_videos
+
+    monkeypatch.setattr(custom_videos, 'storage', s3)
+    monkeypatch.setattr(custom_videos, 'STORAGE_REDIRECT', True)
+    prefix = 'hls/v1/aaaaaaaaaaaa'
+    anyio.run(s3.put_file, f"{prefix}/master.m3u8", _scratch_file(tmp_path, 'm', b'#EXTM3U\n720p/index.m3u8\n'))
+    anyio.run(s3.put_file, f"{prefix}/720p/seg_00000.m4s", _scratch_file(tmp_path, 's', b'segment'))
+    app = FastAPI()
+    app.include_router(custom_videos.router)
+    client = TestClient(app)
+
+    playlist = client.get('/custom-videos/hls/v1/aaaaaaaaaaaa/master.m3u8')
+    assert playlist.status_code == 200
+    assert playlist.content == b'#EXTM3U\n720p/index.m3u8\n'
+    assert playlist.headers['content-type'].startswith('application/vnd.apple.mpegurl')
+
+    segment = client.get('/custom-videos/hls/v1/aaaaaaaaaaaa/720p/seg_00000.m4s', follow_redirects=False)
+    assert segment.status_code == 307
+    assert 'Signature=' in segment.headers['location'] or 'X-Amz-Signature=' in segment.headers['location']
@@ -0,0 +1,134 @@
+import random
+import statistics
+import time
+
+import pytest
+
+import title_index
+from title_index import TitleIndex, normalize
+
+
+def _doc(id, title, media_type='movie'):
+    return {'id': id, 'title': title, 'media_type': media_type}
+
+
+def _ids(results):
+    return [doc['id'] for _, doc in results]
+
+
+def test_normalize_strips_accents_case_and_punctuation():
+    assert normalize('  Amélie: Le Fabuleux—Destin!  ') == 'amelie le fabuleux destin'
+
+
+def test_prefix_matches_outrank_fuzzy_ones():
+    index = TitleIndex()
+    index.add_many([_doc(1, 'The Matrix'), _doc(2, 'The Matrix Reloaded'), _doc(3, 'Metropolis')])
+
+    assert _ids(index.search('matrix rel'))[0] == 2
+    results = index.search('the mat')
+    assert _ids(results) == [1, 2]
+    assert results[0][0] >= 0.9
+
+
+def test_typos_fall_back_to_trigram_similarity():
+    index = TitleIndex()
+    index.add_many([_doc(1, 'Interstellar'), _doc(2, 'Inception')])
+
+    assert _ids(index.search('intersteller'))[0] == 1
+
+
+def test_people_and_untitled_results_are_not_indexed():
+    index = TitleIndex()
+    index.add_many([_doc(1, 'Tom Hanks', 'person'), _doc(2, None), _doc(3, 'Big', 'tv')])
+
+    assert len(index) == 1
+    assert index.search('tom hanks') == []
+
+
+def test_re_adding_a_renamed_title_replaces_it():
+    index = TitleIndex()
+    index.add(_doc(1, 'Working Title'))
+    index.add(_doc(1, 'Final Title'))
+
+    assert len(index) == 1
+    assert index.search('working') == []
+    assert _ids(index.search('final')) == [1]
+
+
+def test_least_recently_added_tmdb_titles_are_evicted_but_uploads_stay():
+    index = TitleIndex(max_titles=2)
+    index.add(_doc('c1', 'Home Video', 'custom'))
+    index.add(_doc(1, 'Alien'))
+    index.add(_doc(2, 'Aliens'))
+    index.add(_doc(1, 'Alien'))  # seen again, so 2 is now the oldest
+    index.add(_doc(3, 'Alien 3'))
+
+    assert sorted(_ids(index.search('alien')), key=str) == [1, 3]
+    assert _ids(index.search('home')) == ['c1']
+    assert index.snapshot()['evictions'] == 1
+
+
+def test_removals_are_compacted_out_of_the_postings():
+    index = TitleIndex(compact_ratio=0.5, compact_min=2)
+    index.add_many([_doc(1, 'Zodiac'), _doc(2, 'Zoolander'), _doc(3, 'Fargo')])
+
+    index.remove('movie', 1)
+    assert index.snapshot()['tombstones'] == 1
+    index.remove('movie', 2)
+
+    snapshot = index.snapshot()
+    assert snapshot['compactions'] == 1
+    assert snapshot['tombstones'] == 0
+    assert snapshot['tokens'] == 1
+    assert _ids(index.search('fargo')) == [3]
+    assert index.search('zo') == []
+    index.add(_doc(4, 'Zombieland'))
+    assert _ids(index.search('zom')) == [4]
+
+
+def test_one_letter_words_only_match_whole_title_words():
+    index = TitleIndex()
+    index.add_many([_doc(1, 'A Quiet Place'), _doc(2, 'Avatar')])
+
+    assert _ids(index.search('a')) == [1]
+    assert _ids(index.search('av')) == [2]
+    assert index.search('q') == []
+
+
+def test_short_queries_skip_fuzzy_matching(monkeypatch):
+    index = TitleIndex()
+    index.add(_doc(1, 'Up'))
+    monkeypatch.setattr(index, '_fuzzy_scores', lambda norm: pytest.fail(f'fuzzy search for {norm!r}'))
+
+    assert _ids(index.search('up')) == [1]
+
+
+def test_postings_scanned_per_word_are_capped_to_the_most_recent(monkeypatch):
+    monkeypatch.setattr(title_index, 'TITLE_INDEX_MAX_POSTINGS', 3)
+    index = TitleIndex()
+    index.add(_doc(0, 'Alien Rare'))
+    index.add_many(_doc(i, f'Alien {i}') for i in range(1, 10))
+
+    assert sorted(_ids(index.search('alien'))) == [7, 8, 9]
+    # The selective word drives the candidates, so older titles are still found
+    assert _ids(index.search('alien rar'))[0] == 0
+
+
+def test_search_stays_fast_at_the_title_cap():
+    rng = random.Random(7)
+    common = 'the a of love night man last story dark day house war dead life star lost'.split()
+    invented = [''.join(rng.choice(['ka', 'lo', 'mi', 'ra', 'te', 'su', 'an', 'or']) for _ in range(3)) for _ in range(5000)]
+    index = TitleIndex(max_titles=title_index.TITLE_INDEX_MAX_TITLES)
+    index.add_many(
+        _doc(i, ' '.join(rng.choice(common if rng.random() < 0.5 else invented) for _ in range(rng.randint(1, 5))))
+        for i in range(title_index.TITLE_INDEX_MAX_TITLES)
+    )
+
+    for query in ['t', 'a', 'th', 'the', 'love', 'the la', 'the lost st', 'nigth']:
+        samples = []
+        for _ in range(21):
+            started = time.perf_counter()
+            index.search(query)
+            samples.append(time.perf_counter() - started)
+        # Typically well under 1 ms (benchmarks/bench_title_index.py); the slack absorbs slow CI hosts
+        assert statistics.median(samples) < 0.002, query
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+import tmdb_cache as tmdb_cache_module
+from tmdb_cache import TMDBCache, endpoint_family, make_cache_key
+
+pytestmark = pytest.mark.anyio
+
+
+class Upstream:
+    def __init__(self):
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        return {'page': self.calls}
+
+
+@pytest.mark.parametrize('endpoint, family', [
+    ('/trending/all/week', 'trending'),
+    ('/movie/popular', 'popular'),
+    ('/discover/movie', 'discover'),
+    ('/movie/603', 'details'),
+    ('/tv/1399/videos', 'videos'),
+    ('/search/multi', 'search'),
+    ('/genre/movie/list', 'other'),
+])
+def test_endpoint_families(endpoint, family):
+    assert endpoint_family(endpoint) == family
+
+
+def test_cache_key_ignores_param_order_and_the_api_key():
+    assert make_cache_key('/search/multi', {'query': 'x', 'page': 1, 'api_key': 'a'}) == \
+        make_cache_key('/search/multi', {'page': '1', 'query': 'x', 'api_key': 'b'})
+    assert make_cache_key('/movie/popular') == '/movie/popular'
+
+
+async def test_fresh_entries_are_served_without_fetching():
+    cache, upstream = TMDBCache(), Upstream()
+
+    assert await cache.get_or_fetch('k', 60, upstream.fetch) == {'page': 1}
+    assert await cache.get_or_fetch('k', 60, upstream.fetch) == {'page': 1}
+    assert upstream.calls == 1
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+
+async def test_stale_entries_are_served_while_one_refresh_runs_in_the_background():
+    cache, upstream = TMDBCache(), Upstream()
+    await cache.get_or_fetch('k', 0, upstream.fetch)
+
+    stale = await asyncio.gather(*(cache.get_or_fetch('k', 60, upstream.fetch) for _ in range(3)))
+    assert stale == [{'page': 1}] * 3
+    await asyncio.sleep(0)
+
+    assert upstream.calls == 2
+    assert await cache.get_or_fetch('k', 60, upstream.fetch) == {'page': 2}
+    assert cache.stats['stale_hits'] == 3 and cache.stats['refreshes'] == 1
+
+
+async def test_entries_past_the_stale_window_are_refetched(monkeypatch):
+    monkeypatch.setattr(tmdb_cache_module, 'TMDB_CACHE_STALE_TTL', 0)
+    cache, upstream = TMDBCache(), Upstream()
+    await cache.get_or_fetch('k', 0, upstream.fetch)
+
+    assert await cache.get_or_fetch('k', 60, upstream.fetch) == {'page': 2}
+    assert cache.stats['misses'] == 2
+
+
+async def test_failed_fetches_are_not_cached():
+    cache = TMDBCache()
+
+    async def failing():
+        return None
+
+    assert await cache.get_or_fetch('k', 60, failing) is None
+    assert cache.snapshot()['entries'] == 0
+
+
+async def test_shared_tier_serves_entries_fetched_by_another_process(db):
+    writer, reader, upstream = TMDBCache(), TMDBCache(), Upstream()
+    writer.configure_shared_tier(db.tmdb_cache)
+    reader.configure_shared_tier(db.tmdb_cache)
+
+    await writer.get_or_fetch('k', 60, upstream.fetch)
+
+    assert await reader.get_or_fetch('k', 60, upstream.fetch) == {'page': 1}
+    assert upstream.calls == 1
+    assert reader.stats['shared_hits'] == 1
+    assert (await db.tmdb_cache.find_one({'_id': 'k'}))['expires_at'] > time.time()
+
+
+def test_lru_keeps_the_most_recently_used_entries():
+    cache = TMDBCache(max_entries=2)
+    entry = tmdb_cache_module.CacheEntry({}, time.time(), time.time() + 60)
+    cache._set_local('a', entry)
+    cache._set_local('b', entry)
+    cache._get_local('a')
+    cache._set_local('c', entry)
+
+    assert list(cache._entries) == ['a', 'c']
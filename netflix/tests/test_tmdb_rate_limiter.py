@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from tmdb_rate_limiter import RateLimitTimeout, TMDBRateLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+def _deadline(seconds=1.0):
+    return time.monotonic() + seconds
+
+
+async def test_calls_go_to_the_key_with_the_most_budget():
+    limiter = TMDBRateLimiter(['key-aaaa', 'key-bbbb'], rate=0.001, burst=3)
+    limiter.buckets['key-aaaa'].tokens = 1
+
+    keys = [await limiter.acquire(_deadline()) for _ in range(3)]
+
+    assert keys.count('key-bbbb') == 2
+    assert limiter.stats['acquired'] == 3
+
+
+async def test_saturated_keys_queue_until_a_token_refills():
+    limiter = TMDBRateLimiter(['key-aaaa'], rate=50, burst=1)
+    await limiter.acquire(_deadline())
+
+    started = time.monotonic()
+    assert await limiter.acquire(_deadline()) == 'key-aaaa'
+
+    assert 0.01 <= time.monotonic() - started < 0.5
+    assert limiter.stats['queued'] == 1
+
+
+async def test_no_budget_before_the_deadline_times_out_without_waiting():
+    limiter = TMDBRateLimiter(['key-aaaa'], rate=0.1, burst=1)
+    await limiter.acquire(_deadline())
+
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        await limiter.acquire(_deadline(0.5))
+    assert time.monotonic() - started < 0.1
+    assert limiter.stats['timeouts'] == 1
+
+
+async def test_full_queue_rejects_immediately():
+    limiter = TMDBRateLimiter(['key-aaaa'], rate=0.1, burst=1, max_queue=0)
+    await limiter.acquire(_deadline())
+
+    with pytest.raises(RateLimitTimeout, match='queue is full'):
+        await limiter.acquire(_deadline())
+    assert limiter.stats['rejected'] == 1
+
+
+async def test_429_blocks_the_key_for_retry_after():
+    limiter = TMDBRateLimiter(['key-aaaa', 'key-bbbb'], rate=100, burst=10)
+
+    limiter.record_response('key-aaaa', 429, {'retry-after': '30'})
+
+    assert {await limiter.acquire(_deadline()) for _ in range(5)} == {'key-bbbb'}
+    blocked = limiter.snapshot()['keys'][0]
+    assert blocked['throttled'] == 1 and blocked['blocked_for'] > 29
+    assert limiter.remaining_budget() < 10
+
+
+async def test_rate_limit_headers_cap_tokens_and_block_until_reset():
+    limiter = TMDBRateLimiter(['key-aaaa'], rate=100, burst=10)
+
+    limiter.record_response('key-aaaa', 200, {'x-ratelimit-remaining': '2'})
+    assert limiter.buckets['key-aaaa'].tokens == 2
+
+    limiter.record_response('key-aaaa', 200, {'x-ratelimit-remaining': '0', 'x-ratelimit-reset': str(time.time() + 20)})
+    with pytest.raises(RateLimitTimeout):
+        await limiter.acquire(_deadline(1))
+
+
+async def test_hedges_can_exclude_the_key_already_in_use():
+    limiter = TMDBRateLimiter(['key-aaaa', 'key-bbbb'], rate=0.001, burst=5)
+    limiter.buckets['key-bbbb'].tokens = 1
+
+    assert await limiter.acquire(_deadline(), exclude='key-aaaa') == 'key-bbbb'
@@ -0,0 +1,116 @@
+import asyncio
+
+import httpx
+import pytest
+
+import tmdb_service
+from circuit_breaker import CircuitBreaker, HALF_OPEN
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Route _fetch_from_tmdb to a canned response through a half-open breaker"""
+    breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == HALF_OPEN
+    monkeypatch.setattr(tmdb_service.tmdb_breakers, 'get', lambda family: breaker)
+
+    async def acquire(deadline, exclude=None):
+        return 'key'
+
+    monkeypatch.setattr(tmdb_service.tmdb_rate_limiter, 'acquire', acquire)
+    responses = {}
+
+    async def attempt(client, endpoint, params, api_key, timeout, family):
+        if 'hang' in responses:
+            await asyncio.Event().wait()
+        return responses['response']
+
+    monkeypatch.setattr(tmdb_service, '_hedged_attempt', attempt)
+    return breaker, responses
+
+
+def _response(status, content):
+    return httpx.Response(status, content=content, request=httpx.Request('GET', 'https://api.themoviedb.org/3/x'))
+
+
+async def test_non_json_body_is_a_failed_probe(upstream):
+    breaker, responses = upstream
+    responses['response'] = _response(200, b'<html>gateway error</html>')
+
+    assert await tmdb_service._fetch_from_tmdb('/movie/popular') is None
+    assert breaker.stats['failures'] == 2
+    # The probe reopened the circuit instead of leaving it half-open with the slot taken
+    assert breaker.state == HALF_OPEN and breaker.allow()
+
+
+async def test_good_probe_closes_the_circuit(upstream):
+    breaker, responses = upstream
+    responses['response'] = _response(200, b'{"results": []}')
+
+    assert await tmdb_service._fetch_from_tmdb('/movie/popular') == {'results': []}
+    assert breaker.state == 'closed'
+
+
+async def test_cancelled_probe_gives_the_slot_back(upstream):
+    breaker, responses = upstream
+    responses['hang'] = True
+
+    task = asyncio.ensure_future(tmdb_service._fetch_from_tmdb('/movie/popular'))
+    await asyncio.sleep(0.01)
+    assert not breaker.allow()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert breaker.allow()
+
+
+@pytest.fixture
+def tmdb_calls(monkeypatch):
+    calls = []
+    details = {
+        '/movie/603': {
+            'id': 603, 'title': 'The Matrix', 'runtime': 136, 'genres': [{'name': 'Action'}],
+            'videos': {'results': [
+                {'site': 'Vimeo', 'type': 'Trailer', 'key': 'v'},
+                {'site': 'YouTube', 'type': 'Featurette', 'key': 'f'},
+                {'site': 'YouTube', 'type': 'Teaser', 'key': 'abc'},
+            ]}
+        },
+        '/tv/1399': {'id': 1399, 'name': 'Game of Thrones', 'number_of_seasons': 8, 'genres': []},
+    }
+
+    async def make_tmdb_request(endpoint, params=None, timeout=None):
+        calls.append((endpoint, params))
+        return details.get(endpoint)
+
+    monkeypatch.setattr(tmdb_service, 'make_tmdb_request', make_tmdb_request)
+    return calls
+
+
+async def test_details_and_trailer_come_from_one_upstream_call(tmdb_calls):
+    movie = await tmdb_service.get_movie_details(603, 'movie')
+
+    assert tmdb_calls == [('/movie/603', {'append_to_response': 'videos'})]
+    assert movie['duration'] == '2h 16m'
+    assert movie['genres'] == ['Action']
+    assert movie['trailer'] == 'https://www.youtube.com/watch?v=abc'
+
+    show = await tmdb_service.get_movie_details(1399, 'tv')
+    assert show['seasons'] == 8 and show['trailer'] is None
+
+
+async def test_prefetch_warms_details_for_the_first_titles_only(tmdb_calls):
+    row = [
+        {'id': 603, 'media_type': 'movie'},
+        {'id': 42, 'media_type': 'person'},
+        {'id': 1399, 'media_type': 'tv'},
+        {'id': 7, 'media_type': 'movie'},
+    ]
+
+    await tmdb_service.prefetch_movie_details(row, 3)
+
+    assert [endpoint for endpoint, _ in tmdb_calls] == ['/movie/603', '/tv/1399']
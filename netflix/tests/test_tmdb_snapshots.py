@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import tmdb_snapshots
+from tmdb_snapshots import SnapshotStore, track_staleness
+
+pytestmark = pytest.mark.anyio
+
+ENDPOINT = '/movie/popular'
+PARAMS = {'page': 1}
+
+
+def _titles(data):
+    return [m['title'] for m in data['results']]
+
+
+async def _settle(store):
+    await asyncio.gather(*store._tasks)
+
+
+@pytest.fixture
+def store(db):
+    store = SnapshotStore()
+    store.configure(db.tmdb_snapshots)
+    return store
+
+
+async def test_live_responses_are_mapped_and_persisted_once(store, db):
+    data = {'results': [{'title': 'Dune'}]}
+
+    assert await store.resolve(ENDPOINT, PARAMS, data, _titles) == ['Dune']
+    # A cache hit hands back the same object; it is not rewritten
+    assert await store.resolve(ENDPOINT, PARAMS, data, _titles) == ['Dune']
+    await _settle(store)
+
+    saved = await db.tmdb_snapshots.find_one({})
+    assert saved['value'] == ['Dune'] and saved['version'] == 1
+    assert 'purge_at' not in saved
+    assert store.stats['writes'] == 1
+
+
+async def test_search_snapshots_age_out(store, db):
+    await store.resolve('/search/multi', {'query': 'dune'}, {'results': [{'title': 'Dune'}]}, _titles)
+    await _settle(store)
+
+    saved = await db.tmdb_snapshots.find_one({})
+    assert saved['purge_at'] > saved['fetched_at']
+
+
+async def test_missing_upstream_data_falls_back_to_the_snapshot(store):
+    await store.resolve(ENDPOINT, PARAMS, {'results': [{'title': 'Dune'}]}, _titles)
+    await _settle(store)
+
+    with track_staleness() as staleness:
+        assert await store.resolve(ENDPOINT, PARAMS, None, _titles) == ['Dune']
+
+    fields = staleness.fields()
+    assert fields['stale'] is True and fields['stale_as_of'] is not None
+    assert store.stats['fallbacks'] == 1
+
+
+async def test_nothing_to_fall_back_to(store):
+    with track_staleness() as staleness:
+        assert await store.resolve(ENDPOINT, PARAMS, None, _titles) is None
+
+    assert staleness.fields() == {}
+    assert store.stats['fallback_misses'] == 1
+
+
+async def test_unconfigured_store_only_maps(db):
+    store = SnapshotStore()
+
+    assert await store.resolve(ENDPOINT, PARAMS, {'results': []}, _titles) == []
+    assert await store.resolve(ENDPOINT, PARAMS, None, _titles) is None
+    assert store._tasks == set()
+
+
+async def test_recently_served_keys_are_not_rewritten_after_an_eviction(store, db, monkeypatch):
+    monkeypatch.setattr(tmdb_snapshots, 'TMDB_CACHE_MAX_ENTRIES', 2)
+    hot = {'results': [{'title': 'Dune'}]}
+    await store.resolve(ENDPOINT, {'page': 1}, hot, _titles)
+    await store.resolve(ENDPOINT, {'page': 2}, {'results': []}, _titles)
+
+    # A hit refreshes page 1, so page 2 is the one evicted
+    await store.resolve(ENDPOINT, {'page': 1}, hot, _titles)
+    await store.resolve(ENDPOINT, {'page': 3}, {'results': []}, _titles)
+    await store.resolve(ENDPOINT, {'page': 1}, hot, _titles)
+    await _settle(store)
+
+    assert store.stats['writes'] == 3
+    assert len(store._persisted) == 2